@@ -0,0 +1,737 @@
+from __future__ import annotations
+
+import json
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Iterable
+
+from checkpoints import (
+    CheckpointStore,
+    current_watermark,
+    mark_watermark,
+    watermark_holds,
+)
+from data30_utils import (
+    CHUNK_BYTES,
+    DATA30_EVENTS_PATH,
+    DATA30_GAPS_PATH,
+    DATA30_PATH,
+    data30_events_path,
+    data30_shards,
+    decode_range,
+    iter_data30_events,
+    iter_data30_gaps,
+    map_ordered,
+    parse_timestamp,
+)
+
+
+PROCESSED_DIR = Path(__file__).resolve().parents[1] / "data" / "processed"
+
+# events are small; hand them to aggregators in batches of this many records
+EVENT_BATCH = 10_000
+
+
+class Aggregator:
+    """
+    One analysis as four steps over column batches from iter_data30_batches
+    ({"stream_id", "timestamp", "username", "message"} -> lists):
+
+      init()                -> a fresh state
+      update(state, batch)  folds one batch into the state (in place)
+      merge(a, b)           combines the states of two consecutive shards, a first;
+                            must be associative (shards are merged left to right)
+      finalize(state)       -> the JSON written to data/processed/<output_name>
+
+    State lives outside the aggregator, so one instance can run over many shards.
+    Aggregators that read typed events (events.jsonl) also get update_events.
+    States must pickle: they are checkpointed between runs (bump `version` when
+    the state layout changes, which discards old checkpoints).
+    """
+
+    name = ""
+    output_name = ""
+    version = 1
+
+    def init(self) -> Any:
+        raise NotImplementedError
+
+    def update(self, state: Any, batch: dict[str, list]) -> None:
+        raise NotImplementedError
+
+    def update_events(self, state: Any, records: list[dict]) -> None:
+        pass
+
+    def merge(self, a: Any, b: Any) -> Any:
+        raise NotImplementedError
+
+    def finalize(self, state: Any) -> Any:
+        raise NotImplementedError
+
+    def describe(self, result: Any, output_path: Path) -> str:
+        return f"Wrote {self.name} to {output_path}"
+
+    @property
+    def uses_events(self) -> bool:
+        return False
+
+    @property
+    def checkpoint_key(self) -> str:
+        return f"{self.name}-v{self.version}"
+
+
+def merge_counters(a: Counter, b: Counter) -> Counter:
+    a.update(b)
+    return a
+
+
+class ChatCount(Aggregator):
+    name = "chat_count"
+    output_name = "chat_count.json"
+    # v1 states left out lines that were not valid JSON
+    version = 2
+
+    def init(self) -> list[int]:
+        return [0]
+
+    def update(self, state: list[int], batch: dict[str, list]) -> None:
+        # every non-blank line, as chat_count.py always counted, decodable or not
+        state[0] += len(batch["message"]) + batch.get("skipped", 0)
+
+    def merge(self, a: list[int], b: list[int]) -> list[int]:
+        return [a[0] + b[0]]
+
+    def finalize(self, state: list[int]) -> dict:
+        return {"count": state[0]}
+
+    def describe(self, result: dict, output_path: Path) -> str:
+        return f"Wrote chat count ({result['count']}) to {output_path}"
+
+
+class UniqueChatters(Aggregator):
+    name = "unique_chatters"
+    output_name = "unique_chatters.json"
+
+    def init(self) -> set[str]:
+        return set()
+
+    def update(self, state: set[str], batch: dict[str, list]) -> None:
+        state.update(u for u in batch["username"] if u)
+
+    def merge(self, a: set[str], b: set[str]) -> set[str]:
+        a |= b
+        return a
+
+    def finalize(self, state: set[str]) -> list[str]:
+        return sorted(state)
+
+    def describe(self, result: list, output_path: Path) -> str:
+        return f"Wrote {len(result)} unique chatters to {output_path}"
+
+
+class _DailyCounts(Aggregator):
+    """
+    Per-day totals from typed events when `events_path` exists (exact), else from
+    matching chat text.
+    """
+
+    value_key = ""
+
+    def __init__(
+        self, use_events: bool | None = None, events_path: Path = DATA30_EVENTS_PATH
+    ):
+        self._use_events = events_path.exists() if use_events is None else use_events
+
+    @property
+    def uses_events(self) -> bool:
+        return self._use_events
+
+    @property
+    def checkpoint_key(self) -> str:
+        source = "events" if self._use_events else "chat"
+        return f"{self.name}-{source}-v{self.version}"
+
+    def init(self) -> Counter[str]:
+        return Counter()
+
+    def update(self, state: Counter[str], batch: dict[str, list]) -> None:
+        if self._use_events:
+            return
+        for timestamp, message in zip(batch["timestamp"], batch["message"]):
+            amount = self.message_amount(message or "")
+            if not amount or not timestamp:
+                continue
+            state[parse_timestamp(timestamp).date().isoformat()] += amount
+
+    def update_events(self, state: Counter[str], records: list[dict]) -> None:
+        for record in records:
+            amount = self.event_amount(record)
+            timestamp = record.get("timestamp")
+            if not amount or not timestamp:
+                continue
+            state[parse_timestamp(timestamp).date().isoformat()] += amount
+
+    def message_amount(self, message: str) -> int:
+        raise NotImplementedError
+
+    def event_amount(self, record: dict) -> int:
+        raise NotImplementedError
+
+    def merge(self, a: Counter[str], b: Counter[str]) -> Counter[str]:
+        return merge_counters(a, b)
+
+    def finalize(self, state: Counter[str]) -> list[dict]:
+        return [{"date": date, self.value_key: state[date]} for date in sorted(state)]
+
+    def describe(self, result: list, output_path: Path) -> str:
+        return f"Wrote {len(result)} days to {output_path}"
+
+
+CHEER_RE = re.compile(r"cheer(\d+)", re.IGNORECASE)
+
+
+class BitsOverTime(_DailyCounts):
+    # the bits tag is exact; CHEER_RE also matches "cheer100" typed without cheering
+    name = "bits_over_time"
+    output_name = "bits_over_time.json"
+    value_key = "bits"
+
+    def message_amount(self, message: str) -> int:
+        return sum(int(value) for value in CHEER_RE.findall(message))
+
+    def event_amount(self, record: dict) -> int:
+        if record.get("type") != "bits":
+            return 0
+        return int(record.get("bits") or 0)
+
+
+# one event per subscription; submysterygift only announces the subgifts that follow
+SUB_EVENT_TYPES = {"sub", "resub", "subgift"}
+SUB_MESSAGE_PATTERNS = [
+    re.compile(r"subscribed at tier [123]"),
+    re.compile(r"subscribed with prime"),
+    re.compile(r"gifted (?:\\d+ )?tier [123] sub"),
+    re.compile(r"gifted a tier [123] sub"),
+]
+
+
+class SubsOverTime(_DailyCounts):
+    name = "subs_over_time"
+    output_name = "subs_over_time.json"
+    value_key = "subs"
+
+    def message_amount(self, message: str) -> int:
+        message = message.lower()
+        return int(any(pattern.search(message) for pattern in SUB_MESSAGE_PATTERNS))
+
+    def event_amount(self, record: dict) -> int:
+        return int(record.get("type") in SUB_EVENT_TYPES)
+
+
+class ChristmasMentions(Aggregator):
+    name = "christmas_mentions"
+    output_name = "christmas_mentions.json"
+
+    keywords = {
+        "christmas": "christmas",
+        "new years": "new years",
+        "@supertf": "super",
+        "blizzard": "blizzard",
+    }
+
+    def init(self) -> dict[str, Counter[str]]:
+        return {label: Counter() for label in self.keywords.values()}
+
+    def update(self, state: dict[str, Counter[str]], batch: dict[str, list]) -> None:
+        keywords = self.keywords.items()
+        for timestamp, message in zip(batch["timestamp"], batch["message"]):
+            lower_message = str(message or "").lower()
+            matched = [label for key, label in keywords if key in lower_message]
+            if not matched or not timestamp:
+                continue
+            date = timestamp.split("T")[0]
+            for label in matched:
+                state[label][date] += 1
+
+    def merge(self, a: dict, b: dict) -> dict:
+        for label, counter in b.items():
+            a[label].update(counter)
+        return a
+
+    def finalize(self, state: dict[str, Counter[str]]) -> list[dict]:
+        dates = sorted({date for counter in state.values() for date in counter})
+        return [
+            {
+                "date": date,
+                "christmas": state["christmas"].get(date, 0),
+                "new_years": state["new years"].get(date, 0),
+                "super": state["super"].get(date, 0),
+                "blizzard": state["blizzard"].get(date, 0),
+            }
+            for date in dates
+        ]
+
+    def describe(self, result: list, output_path: Path) -> str:
+        return f"Wrote {len(result)} dates to {output_path}"
+
+
+def word_count(text: str) -> int:
+    return len([word for word in text.split() if word])
+
+
+class LongestMessage(Aggregator):
+    name = "longest_message"
+    output_name = "longest_message.json"
+
+    def init(self) -> dict:
+        return {
+            "stream_id": "",
+            "timestamp": "",
+            "username": "",
+            "message": "",
+            "words": 0,
+        }
+
+    def update(self, state: dict, batch: dict[str, list]) -> None:
+        for i, message in enumerate(batch["message"]):
+            message = message or ""
+            count = word_count(message)
+            if count <= state["words"]:
+                continue
+            state.update(
+                stream_id=batch["stream_id"][i] or "",
+                timestamp=batch["timestamp"][i] or "",
+                username=batch["username"][i] or "",
+                message=message,
+                words=count,
+            )
+
+    def merge(self, a: dict, b: dict) -> dict:
+        # the earliest message wins ties, as in a single pass
+        return b if b["words"] > a["words"] else a
+
+    def finalize(self, state: dict) -> dict:
+        return state
+
+    def describe(self, result: dict, output_path: Path) -> str:
+        return f"Wrote longest message ({result['words']} words) to {output_path}"
+
+
+MENTION_RE = re.compile(r"@([A-Za-z0-9_]+)")
+
+
+class MostPopularMentions(Aggregator):
+    name = "most_popular_mentions"
+    output_name = "most_popular_mentions.json"
+
+    def init(self) -> tuple[dict[str, set[str]], Counter[str]]:
+        return defaultdict(set), Counter()
+
+    def update(self, state: tuple, batch: dict[str, list]) -> None:
+        unique_senders, mention_counts = state
+        for username, message in zip(batch["username"], batch["message"]):
+            sender = (username or "").lower()
+            for target in MENTION_RE.findall(message or ""):
+                target = target.lower()
+                if target == "supertf" or not target or target == sender:
+                    continue
+                unique_senders[target].add(sender)
+                mention_counts[target] += 1
+
+    def merge(self, a: tuple, b: tuple) -> tuple:
+        for target, senders in b[0].items():
+            a[0][target] |= senders
+        a[1].update(b[1])
+        return a
+
+    def finalize(self, state: tuple) -> list[dict]:
+        unique_senders, mention_counts = state
+        ranking = sorted(
+            unique_senders.items(),
+            key=lambda item: (-len(item[1]), -mention_counts[item[0]], item[0]),
+        )[:5]
+        return [
+            {
+                "username": username,
+                "unique_chatters": len(unique_senders[username]),
+                "mentions": mention_counts[username],
+            }
+            for username, _ in ranking
+        ]
+
+    def describe(self, result: list, output_path: Path) -> str:
+        return f"Wrote {len(result)} users to {output_path}"
+
+
+class BiggestFan(Aggregator):
+    name = "biggest_fan"
+    output_name = "top_supertf_mentions.json"
+
+    def init(self) -> dict[str, list[str]]:
+        # username -> their @supertf messages, in order of first mention
+        return {}
+
+    def update(self, state: dict[str, list[str]], batch: dict[str, list]) -> None:
+        for username, message in zip(batch["username"], batch["message"]):
+            if not username:
+                continue
+            message = message or ""
+            if "@supertf" in message.lower():
+                state.setdefault(username, []).append(message)
+
+    def merge(self, a: dict, b: dict) -> dict:
+        for username, messages in b.items():
+            a.setdefault(username, []).extend(messages)
+        return a
+
+    def finalize(self, state: dict[str, list[str]]) -> dict | None:
+        if not state:
+            return None
+        username, messages = max(state.items(), key=lambda item: len(item[1]))
+        return {"username": username, "mentions": len(messages), "messages": messages}
+
+    def describe(self, result: dict | None, output_path: Path) -> str:
+        if result is None:
+            return "No @supertf mentions found."
+        return f"Wrote results to {output_path}"
+
+
+class FunStats(Aggregator):
+    name = "fun_stats"
+    output_name = "fun_stats.json"
+
+    def __init__(self, gaps_path: Path = DATA30_GAPS_PATH):
+        self.gaps_path = gaps_path
+
+    def init(self) -> dict:
+        return {
+            "chatters": set(),
+            "stream_counts": Counter(),
+            # stream_id -> [min, max] epoch seconds
+            "stream_bounds": {},
+            "second_counts": Counter(),
+        }
+
+    def update(self, state: dict, batch: dict[str, list]) -> None:
+        state["chatters"].update(u for u in batch["username"] if u)
+        stream_counts = state["stream_counts"]
+        stream_bounds = state["stream_bounds"]
+        second_counts = state["second_counts"]
+        for stream_id, timestamp in zip(batch["stream_id"], batch["timestamp"]):
+            if stream_id:
+                stream_counts[stream_id] += 1
+            if not timestamp:
+                continue
+            ts = parse_timestamp(timestamp)
+            t = ts.timestamp()
+            bounds = stream_bounds.get(stream_id)
+            if bounds is None:
+                stream_bounds[stream_id] = [t, t]
+            elif t < bounds[0]:
+                bounds[0] = t
+            elif t > bounds[1]:
+                bounds[1] = t
+            second_counts[ts.replace(microsecond=0).isoformat()] += 1
+
+    def merge(self, a: dict, b: dict) -> dict:
+        a["chatters"] |= b["chatters"]
+        a["stream_counts"].update(b["stream_counts"])
+        a["second_counts"].update(b["second_counts"])
+        for stream_id, (lo, hi) in b["stream_bounds"].items():
+            bounds = a["stream_bounds"].setdefault(stream_id, [lo, hi])
+            bounds[0] = min(bounds[0], lo)
+            bounds[1] = max(bounds[1], hi)
+        return a
+
+    def finalize(self, state: dict) -> dict:
+        # seconds the collector was disconnected: no chat was seen, so they are not
+        # part of the chat rate's denominator
+        gap_seconds: dict[str, float] = {}
+        for gap in iter_data30_gaps(self.gaps_path):
+            stream_id = gap["stream_id"]
+            gap_seconds[stream_id] = gap_seconds.get(stream_id, 0.0) + gap["duration_s"]
+
+        total_messages = sum(state["stream_counts"].values())
+        total_seconds = 0.0
+        stream_lengths = []
+        for stream_id, (lo, hi) in state["stream_bounds"].items():
+            duration = hi - lo
+            if duration <= 0:
+                continue
+            stream_lengths.append(duration)
+            total_seconds += max(0.0, duration - gap_seconds.get(stream_id, 0.0))
+
+        second_counts = state["second_counts"]
+        peak_messages_per_second = max(second_counts.values()) if second_counts else 0
+        avg_chats_per_minute = (
+            total_messages / (total_seconds / 60) if total_seconds else 0.0
+        )
+        avg_stream_length_seconds = (
+            sum(stream_lengths) / len(stream_lengths) if stream_lengths else 0.0
+        )
+        return {
+            "unique_chatters": len(state["chatters"]),
+            "avg_chats_per_minute": round(avg_chats_per_minute, 2),
+            "peak_messages_per_second": peak_messages_per_second,
+            "avg_stream_length_seconds": int(avg_stream_length_seconds),
+        }
+
+    def describe(self, result: dict, output_path: Path) -> str:
+        return f"Wrote fun stats to {output_path}"
+
+
+class StreamMetadata(Aggregator):
+    name = "extract_stream_metadata"
+    output_name = "stream_metadata.json"
+
+    def init(self) -> dict[str, str]:
+        # stream_id -> first date seen
+        return {}
+
+    def update(self, state: dict[str, str], batch: dict[str, list]) -> None:
+        for stream_id, timestamp in zip(batch["stream_id"], batch["timestamp"]):
+            if not stream_id or not timestamp:
+                continue
+            date = timestamp.split("T")[0]
+            current = state.get(stream_id)
+            if current is None or date < current:
+                state[stream_id] = date
+
+    def merge(self, a: dict[str, str], b: dict[str, str]) -> dict[str, str]:
+        for stream_id, date in b.items():
+            if stream_id not in a or date < a[stream_id]:
+                a[stream_id] = date
+        return a
+
+    def finalize(self, state: dict[str, str]) -> list[dict]:
+        return [
+            {
+                "stream": stream_id,
+                "date": date,
+                "title": f"Stream {stream_id}",
+                "category": None,
+            }
+            for stream_id, date in sorted(state.items())
+        ]
+
+    def describe(self, result: list, output_path: Path) -> str:
+        return f"Wrote {len(result)} streams to {output_path}"
+
+
+def all_aggregators(
+    use_events: bool | None = None,
+    events_path: Path = DATA30_EVENTS_PATH,
+    gaps_path: Path = DATA30_GAPS_PATH,
+) -> list[Aggregator]:
+    """
+    Every aggregator; `events_path` and `gaps_path` must be the files compacted
+    next to the chat they will scan (data30_events_path / data30_gaps_path).
+    """
+    return [
+        ChatCount(),
+        UniqueChatters(),
+        BitsOverTime(use_events, events_path),
+        SubsOverTime(use_events, events_path),
+        ChristmasMentions(),
+        LongestMessage(),
+        MostPopularMentions(),
+        BiggestFan(),
+        FunStats(gaps_path),
+        StreamMetadata(),
+    ]
+
+
+# the aggregators of the running pass, set once in each worker process
+_worker_aggregators: list[Aggregator] = []
+
+
+def _set_worker_aggregators(aggregators: list[Aggregator]) -> None:
+    global _worker_aggregators
+    _worker_aggregators = aggregators
+
+
+def map_shard(
+    task: tuple[str, int, int], aggregators: list[Aggregator] | None = None
+) -> list[Any]:
+    """
+    The map step: fresh states of every aggregator over one shard (file, start,
+    end) of the chat.
+    """
+    if aggregators is None:
+        aggregators = _worker_aggregators
+    batch = decode_range(task)
+    states = [agg.init() for agg in aggregators]
+    for agg, state in zip(aggregators, states):
+        agg.update(state, batch)
+    return states
+
+
+def merge_states(
+    aggregators: list[Aggregator], left: list[Any], right: list[Any]
+) -> list[Any]:
+    return [agg.merge(a, b) for agg, a, b in zip(aggregators, left, right)]
+
+
+def feed_events(
+    aggregators: list[Aggregator],
+    states: list[Any],
+    span: tuple[int, int | None] | None = (0, None),
+    path: Path = DATA30_EVENTS_PATH,
+) -> None:
+    """
+    Folds the typed events in `span` of `path` (None: none) into the states of
+    the aggregators that read events.
+    """
+    event_users = [(a, s) for a, s in zip(aggregators, states) if a.uses_events]
+    if not event_users or span is None or not path.exists():
+        return
+    records: list[dict] = []
+    for record in iter_data30_events(path, *span):
+        records.append(record)
+        if len(records) >= EVENT_BATCH:
+            for agg, state in event_users:
+                agg.update_events(state, records)
+            records = []
+    for agg, state in event_users:
+        agg.update_events(state, records)
+
+
+def run_pass(
+    aggregators: Iterable[Aggregator],
+    path: Path = DATA30_PATH,
+    workers: int | None = None,
+    states: list[Any] | None = None,
+    spans: dict[str, tuple[int, int]] | None = None,
+    events_span: tuple[int, int | None] | None = (0, None),
+    chunk_bytes: int = CHUNK_BYTES,
+    events_path: Path | None = None,
+) -> list[Any]:
+    """
+    Feeds every aggregator from one scan of the chat (and one of the events, if
+    any aggregator wants them). Returns their states, in order.
+
+    The chat is split into fixed shards (data30_shards), each mapped to states in
+    a pool of `workers` processes (default: all cores, at most MAX_WORKERS), and
+    the shard states are merged in shard order. Results depend on the shards, not
+    on the worker count.
+
+    `states` continues from earlier states instead of fresh ones; `spans` and
+    `events_span` limit the scan to those byte ranges (None: no events). The
+    events are read from `events_path`, by default the events.jsonl next to `path`.
+    """
+    aggregators = list(aggregators)
+    if states is None:
+        states = [agg.init() for agg in aggregators]
+    if events_path is None:
+        events_path = data30_events_path(path)
+
+    feed_events(aggregators, states, events_span, events_path)
+    shard_states = map_ordered(
+        map_shard,
+        data30_shards(path, chunk_bytes, spans),
+        workers,
+        initializer=_set_worker_aggregators,
+        initargs=(aggregators,),
+    )
+    for shard in shard_states:
+        states = merge_states(aggregators, states, shard)
+    return states
+
+
+def run_incremental(
+    aggregators: Iterable[Aggregator],
+    path: Path = DATA30_PATH,
+    workers: int | None = None,
+    store: CheckpointStore | None = None,
+    events_path: Path | None = None,
+) -> list[Any]:
+    """
+    run_pass over only what arrived since each aggregator's checkpoint, then
+    checkpoints the new states. An aggregator with no usable checkpoint (none yet,
+    or a file it covered was rewritten / removed) starts from scratch.
+    """
+    aggregators = list(aggregators)
+    store = store or CheckpointStore()
+    if events_path is None:
+        events_path = data30_events_path(path)
+    target = current_watermark(path, events_path)
+    target_marks = mark_watermark(target, events_path)
+
+    # aggregators checkpointed at the same watermark share one scan
+    groups: dict[str, list[int]] = {}
+    states: list[Any] = [None] * len(aggregators)
+    starts: dict[str, dict] = {}
+    for i, agg in enumerate(aggregators):
+        checkpoint = store.load(agg.checkpoint_key, path)
+        if checkpoint is not None and watermark_holds(
+            checkpoint[1], path, events_path
+        ):
+            states[i], marks = checkpoint
+        else:
+            states[i], marks = agg.init(), {"chat": {}, "events": None}
+        key = json.dumps(marks, sort_keys=True)
+        groups.setdefault(key, []).append(i)
+        starts[key] = marks
+
+    for key, members in groups.items():
+        done = starts[key]
+        spans = {}
+        for file_path, end in target["chat"].items():
+            start = done["chat"].get(file_path, {"end": 0})["end"]
+            if end > start:
+                spans[file_path] = (start, end)
+        events_span = None
+        if target["events"] is not None:
+            start = (done["events"] or {"end": 0})["end"]
+            if target["events"] > start:
+                events_span = (start, target["events"])
+        group = [aggregators[i] for i in members]
+        if spans or events_span:
+            print(
+                f"{', '.join(agg.name for agg in group)}: "
+                f"{sum(end - start for start, end in spans.values())} new chat bytes"
+            )
+        group_states = run_pass(
+            group,
+            path,
+            workers,
+            states=[states[i] for i in members],
+            spans=spans,
+            events_span=events_span,
+            events_path=events_path,
+        )
+        for i, agg, state in zip(members, group, group_states):
+            states[i] = state
+            store.save(agg.checkpoint_key, path, state, target_marks)
+    return states
+
+
+def write_result(
+    agg: Aggregator, result: Any, output_dir: Path = PROCESSED_DIR
+) -> Path:
+    output_path = output_dir / agg.output_name
+    if result is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        with output_path.open("w", encoding="utf-8") as handle:
+            json.dump(result, handle, ensure_ascii=True, indent=2)
+    print(agg.describe(result, output_path))
+    return output_path
+
+
+def run_and_write(
+    aggregators: Iterable[Aggregator],
+    path: Path = DATA30_PATH,
+    output_dir: Path = PROCESSED_DIR,
+    workers: int | None = None,
+    store: CheckpointStore | None = None,
+    events_path: Path | None = None,
+) -> None:
+    """
+    Computes and writes the aggregators' outputs, folding in only the chat added
+    since their checkpoints in `store` (default location: data30/checkpoints).
+    """
+    aggregators = list(aggregators)
+    states = run_incremental(aggregators, path, workers, store, events_path)
+    for agg, state in zip(aggregators, states):
+        write_result(agg, agg.finalize(state), output_dir)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Any
+
+from data30_utils import DATA30_EVENTS_PATH, DATA30_PATH, data30_files, line_end
+
+
+# aggregator states saved after each run, with how far into the corpus they got
+DEFAULT_CHECKPOINT_DIR = DATA30_PATH.with_name("checkpoints")
+CHECKPOINT_VERSION = 1
+
+# bytes hashed at each end of the processed prefix to notice a rewritten file
+MARK_BYTES = 4096
+
+
+def file_mark(path: Path, end: int) -> dict:
+    """
+    How far `path` was processed, plus hashes of the first and last bytes before
+    that point: if they still match, the prefix is the same and only bytes past
+    `end` are new.
+    """
+    with path.open("rb") as handle:
+        head = handle.read(min(end, MARK_BYTES))
+        handle.seek(max(0, end - MARK_BYTES))
+        tail = handle.read(min(end, MARK_BYTES))
+    return {
+        "end": end,
+        "head": hashlib.sha1(head).hexdigest(),
+        "tail": hashlib.sha1(tail).hexdigest(),
+    }
+
+
+def mark_holds(path: Path, mark: dict) -> bool:
+    try:
+        if path.stat().st_size < mark["end"]:
+            return False
+        return file_mark(path, mark["end"]) == mark
+    except OSError:
+        return False
+
+
+def current_watermark(
+    path: Path = DATA30_PATH, events_path: Path = DATA30_EVENTS_PATH
+) -> dict:
+    """
+    Complete-line ends of the chat files (the file, or every partition) and of
+    the events file, as of now. A run processes up to here and no further, so
+    lines appended meanwhile are left for the next one.
+    """
+    return {
+        "chat": {
+            str(file_path): line_end(file_path) for file_path in data30_files(path)
+        },
+        "events": line_end(events_path) if events_path.exists() else None,
+    }
+
+
+def mark_watermark(
+    watermark: dict, events_path: Path = DATA30_EVENTS_PATH
+) -> dict:
+    events = watermark["events"]
+    return {
+        "chat": {
+            file_path: file_mark(Path(file_path), end)
+            for file_path, end in watermark["chat"].items()
+        },
+        "events": None if events is None else file_mark(events_path, events),
+    }
+
+
+def watermark_holds(
+    marks: dict, path: Path = DATA30_PATH, events_path: Path = DATA30_EVENTS_PATH
+) -> bool:
+    """
+    Whether everything a checkpoint covered is still there unchanged: the same
+    chat files (partitions may be added, not removed) with the same prefixes.
+    """
+    files = {str(file_path) for file_path in data30_files(path)}
+    for file_path, mark in marks["chat"].items():
+        if file_path not in files or not mark_holds(Path(file_path), mark):
+            return False
+    events = marks["events"]
+    return events is None or mark_holds(events_path, events)
+
+
+class CheckpointStore:
+    """
+    One pickle per aggregator, keyed by Aggregator.checkpoint_key, holding its
+    state and the marked watermark the state covers.
+    """
+
+    def __init__(self, directory: Path = DEFAULT_CHECKPOINT_DIR):
+        self.directory = directory
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.pkl"
+
+    def load(self, key: str, source: Path) -> tuple[Any, dict] | None:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            with path.open("rb") as handle:
+                checkpoint = pickle.load(handle)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            return None
+        if (
+            checkpoint.get("version") != CHECKPOINT_VERSION
+            or checkpoint.get("source") != str(source)
+        ):
+            return None
+        return checkpoint["state"], checkpoint["marks"]
+
+    def save(self, key: str, source: Path, state: Any, marks: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp = path.with_suffix(".pkl.tmp")
+        with tmp.open("wb") as handle:
+            pickle.dump(
+                {
+                    "version": CHECKPOINT_VERSION,
+                    "source": str(source),
+                    "marks": marks,
+                    "state": state,
+                },
+                handle,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+            handle.flush()
+            os.fsync(handle.fileno())
+        tmp.replace(path)
+
+    def clear(self) -> None:
+        if self.directory.exists():
+            for path in self.directory.glob("*.pkl"):
+                path.unlink()
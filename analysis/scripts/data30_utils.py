@@ -1,15 +1,45 @@
 from __future__ import annotations
 
 import json
+import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Iterator
+from typing import Callable, Iterator
+
+import numpy as np
+
+try:  # optional, several times faster than the stdlib decoder
+    import orjson
+
+    _loads: Callable[[bytes], object] = orjson.loads
+except ImportError:
+    _loads = json.loads
 
 
 DATA30_PATH = (
     Path(__file__).resolve().parents[1] / "data" / "data30" / "all_chat.jsonl"
 )
+# typed sub / raid / bits events captured by the collector (events.jsonl per stream)
+DATA30_EVENTS_PATH = DATA30_PATH.with_name("events.jsonl")
+# windows with no chat coverage (collector IRC disconnects)
+DATA30_GAPS_PATH = DATA30_PATH.with_name("gaps.jsonl")
+# collector.compact --partitioned: chat/date=YYYY-MM-DD/part-NNNNN.jsonl
+DATA30_PARTITIONS_DIR = DATA30_PATH.with_name("chat")
+# memory-mapped columns built from the chat (build_data30_cache)
+DATA30_CACHE_DIR = DATA30_PATH.with_name("cache")
+
+
+def data30_events_path(path: Path = DATA30_PATH) -> Path:
+    """The events.jsonl compacted next to the chat file or partitions dir `path`."""
+    return path.with_name(DATA30_EVENTS_PATH.name)
+
+
+def data30_gaps_path(path: Path = DATA30_PATH) -> Path:
+    """The gaps.jsonl compacted next to the chat file or partitions dir `path`."""
+    return path.with_name(DATA30_GAPS_PATH.name)
 
 
 def parse_timestamp(value: str) -> datetime:
@@ -18,23 +48,437 @@ def parse_timestamp(value: str) -> datetime:
     )
 
 
-def iter_data30_messages(path: Path = DATA30_PATH) -> Iterator[dict]:
-    with path.open("r", encoding="utf-8") as handle:
-        for line_number, line in enumerate(handle, start=1):
+def data30_files(path: Path) -> list[Path]:
+    """
+    The chat files behind `path`: the file itself, or every partition under a
+    partitioned directory in date / part order.
+    """
+    if path.is_dir():
+        return sorted(path.glob("date=*/part-*.jsonl"))
+    return [path]
+
+
+# columns of a message batch, in the order of the tuples iter_data30_rows yields
+MESSAGE_COLUMNS = ("stream_id", "timestamp", "username", "message")
+# byte range each worker decodes at a time
+CHUNK_BYTES = 32 * 1024 * 1024
+# default pool size: decoding stops scaling after a few cores, and every worker
+# adds chunks (and their decoded batches) held in memory
+MAX_WORKERS = 8
+
+
+def line_end(path: Path) -> int:
+    """
+    Offset just past the last complete line of `path`; a partial line a writer is
+    still appending is left out.
+    """
+    with path.open("rb") as handle:
+        end = handle.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - 65536)
+            handle.seek(start)
+            newline = handle.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+    return 0
+
+
+def byte_ranges(
+    path: Path,
+    chunk_bytes: int = CHUNK_BYTES,
+    start: int = 0,
+    end: int | None = None,
+) -> list[tuple[int, int]]:
+    """
+    Splits [start, end) of a JSONL file (default: all of it) into ranges of about
+    `chunk_bytes` that begin and end on line boundaries. `start` must be one.
+    """
+    size = path.stat().st_size if end is None else end
+    ranges = []
+    with path.open("rb") as handle:
+        while start < size:
+            stop = min(size, start + chunk_bytes)
+            if stop < size:
+                handle.seek(stop)
+                handle.readline()
+                stop = min(size, handle.tell())
+            ranges.append((start, stop))
+            start = stop
+    return ranges
+
+
+def decode_range(task: tuple[str, int, int]) -> dict[str, list]:
+    """
+    The message columns of one (file, start, end) byte range, plus "skipped": how
+    many non-blank lines in it were not valid JSON.
+    """
+    path, start, end = task
+    with open(path, "rb") as handle:
+        handle.seek(start)
+        data = handle.read(end - start)
+    stream_ids: list = []
+    timestamps: list = []
+    usernames: list = []
+    messages: list = []
+    bad = 0
+    for line in data.split(b"\n"):
+        if not line.strip():
+            continue
+        try:
+            payload = _loads(line)
+        except ValueError:
+            bad += 1
+            continue
+        stream_ids.append(payload.get("vid", ""))
+        timestamps.append(payload.get("ts"))
+        usernames.append(payload.get("u", ""))
+        messages.append(payload.get("m", ""))
+    if bad:
+        print(
+            f"Skipping {bad} invalid JSON lines in {path} bytes {start}-{end}",
+            file=sys.stderr,
+        )
+    return {
+        "stream_id": stream_ids,
+        "timestamp": timestamps,
+        "username": usernames,
+        "message": messages,
+        "skipped": bad,
+    }
+
+
+def data30_shards(
+    path: Path = DATA30_PATH,
+    chunk_bytes: int = CHUNK_BYTES,
+    spans: dict[str, tuple[int, int]] | None = None,
+) -> list[tuple[str, int, int]]:
+    """
+    (file, start, end) ranges covering the chat in file order: everything under
+    `path`, or only `spans` ({file: (start, end)}) when given. Boundaries depend
+    on the data and `chunk_bytes` alone, never on how many workers read them.
+    """
+    if spans is None:
+        spans = {str(file_path): (0, None) for file_path in data30_files(path)}
+    return [
+        (file_path, start, end)
+        for file_path, span in spans.items()
+        for start, end in byte_ranges(Path(file_path), chunk_bytes, *span)
+    ]
+
+
+def map_ordered(
+    fn: Callable,
+    tasks: list,
+    workers: int | None = None,
+    initializer: Callable | None = None,
+    initargs: tuple = (),
+) -> Iterator:
+    """
+    fn(task) for each task, yielded in task order, computed in a process pool of
+    `workers` (default: all cores, at most MAX_WORKERS); a single task or
+    workers=1 runs in this process. At most workers + 1 tasks are in flight.
+    """
+    workers = workers or min(os.cpu_count() or 1, MAX_WORKERS)
+    if workers <= 1 or len(tasks) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield fn(task)
+        return
+    workers = min(workers, len(tasks))
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    ) as pool:
+        # keep every worker busy and one result ready, not every result at once
+        pending: deque = deque()
+        for task in tasks:
+            pending.append(pool.submit(fn, task))
+            if len(pending) > workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_data30_batches(
+    path: Path = DATA30_PATH,
+    workers: int | None = 1,
+    chunk_bytes: int = CHUNK_BYTES,
+    spans: dict[str, tuple[int, int]] | None = None,
+) -> Iterator[dict[str, list]]:
+    """
+    Yields the messages as column batches {"stream_id": [...], "timestamp": [...],
+    "username": [...], "message": [...]} (plus "skipped", see decode_range), in
+    file order. Newline-aligned byte ranges are decoded one at a time in this
+    process by default; workers > 1 (or None for map_ordered's default) decodes
+    them in a process pool instead.
+
+    `spans` ({file: (start, end)}) reads only those files and byte ranges instead
+    of everything under `path`.
+    """
+    tasks = data30_shards(path, chunk_bytes, spans)
+    yield from map_ordered(decode_range, tasks, workers)
+
+
+def iter_data30_rows(
+    path: Path = DATA30_PATH, workers: int | None = 1
+) -> Iterator[tuple]:
+    """
+    (stream_id, timestamp, username, message) tuples, streamed in this process
+    unless `workers` asks for a pool (see iter_data30_batches).
+    """
+    for batch in iter_data30_batches(path, workers):
+        yield from zip(*(batch[column] for column in MESSAGE_COLUMNS))
+
+
+def iter_data30_messages(
+    path: Path = DATA30_PATH, workers: int | None = 1
+) -> Iterator[dict]:
+    for stream_id, timestamp, username, message in iter_data30_rows(path, workers):
+        yield {
+            "stream_id": stream_id,
+            "timestamp": timestamp,
+            "username": username,
+            "message": message,
+        }
+
+
+def iter_data30_events(
+    path: Path = DATA30_EVENTS_PATH, start: int = 0, end: int | None = None
+) -> Iterator[dict]:
+    """
+    Yields typed events: stream_id, timestamp, type (sub, resub, subgift,
+    submysterygift, raid, bits), username, plus the type's own fields
+    (tier, months, recipient, count, viewers, bits). `start` / `end` limit the
+    read to a line-aligned byte range.
+    """
+    with path.open("rb") as handle:
+        handle.seek(start)
+        offset = start
+        for line in handle:
+            line_start = offset
+            offset += len(line)
+            if end is not None and offset > end:
+                break
             line = line.strip()
             if not line:
                 continue
             try:
                 payload = json.loads(line)
-            except json.JSONDecodeError:
+            except ValueError:
                 print(
-                    f"Skipping invalid JSON in {path}:{line_number}",
+                    f"Skipping invalid JSON in {path} at byte {line_start}",
                     file=sys.stderr,
                 )
                 continue
+            record = {
+                "stream_id": payload.pop("vid", ""),
+                "timestamp": payload.pop("ts", None),
+                "type": payload.pop("type", ""),
+                "username": payload.pop("u", ""),
+            }
+            record.update(payload)
+            yield record
+
+
+def iter_data30_gaps(path: Path = DATA30_GAPS_PATH) -> Iterator[dict]:
+    """
+    Yields coverage gaps: stream_id, start, end (None if the stream ended while
+    disconnected) and duration_s.
+    """
+    if not path.exists():
+        return
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                payload = json.loads(line)
+            except json.JSONDecodeError:
+                continue
             yield {
                 "stream_id": payload.get("vid", ""),
-                "timestamp": payload.get("ts"),
-                "username": payload.get("u", ""),
-                "message": payload.get("m", ""),
+                "start": payload.get("start"),
+                "end": payload.get("end"),
+                "duration_s": payload.get("duration_s") or 0.0,
             }
+
+
+# ---- columnar cache -------------------------------------------------------
+#
+# cache/meta.json          row count, source file sizes / mtimes
+# cache/ts.i64             epoch ms per message (TS_MISSING when absent)
+# cache/stream.i32         index into streams.json
+# cache/user.i32           index into users.json
+# cache/msg_offsets.i64    message i is msg_blob[offsets[i]:offsets[i + 1]]
+# cache/msg_blob.u8        every message, UTF-8, back to back
+
+CACHE_VERSION = 1
+TS_MISSING = np.iinfo(np.int64).min
+
+
+def _source_stamp(path: Path) -> list[list]:
+    stamp = []
+    for file_path in data30_files(path):
+        stat = file_path.stat()
+        stamp.append([str(file_path), stat.st_size, stat.st_mtime_ns])
+    return stamp
+
+
+def _timestamps_ms(values: list) -> np.ndarray:
+    # numpy parses naive ISO strings in C; strip the UTC suffix first
+    naive = [
+        (v[:-1] if v.endswith("Z") else v.removesuffix("+00:00")) if v else "NaT"
+        for v in values
+    ]
+    try:
+        return np.array(naive, dtype="datetime64[ms]").astype(np.int64)
+    except ValueError:
+        return np.array(
+            [
+                int(parse_timestamp(v).timestamp() * 1000) if v else TS_MISSING
+                for v in values
+            ],
+            dtype=np.int64,
+        )
+
+
+def build_data30_cache(
+    path: Path = DATA30_PATH,
+    cache_dir: Path = DATA30_CACHE_DIR,
+    workers: int | None = None,
+) -> Path:
+    """
+    One pass over the chat (decoded in a pool, see map_ordered) into memory-mapped
+    columns. Built in a sibling temp directory and swapped in, so readers never
+    see half a cache.
+    """
+    tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+    if tmp_dir.exists():
+        for stale in tmp_dir.iterdir():
+            stale.unlink()
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    # stamp first and read only that far: chat appended during the build is left
+    # out, and the changed stamp makes the next load_data30_cache pick it up
+    sources = _source_stamp(path)
+    spans = {file_path: (0, size) for file_path, size, _ in sources}
+
+    streams: dict[str, int] = {}
+    users: dict[str, int] = {}
+    rows = 0
+    blob_size = 0
+    with (
+        (tmp_dir / "ts.i64").open("wb") as ts_out,
+        (tmp_dir / "stream.i32").open("wb") as stream_out,
+        (tmp_dir / "user.i32").open("wb") as user_out,
+        (tmp_dir / "msg_offsets.i64").open("wb") as offsets_out,
+        (tmp_dir / "msg_blob.u8").open("wb") as blob_out,
+    ):
+        np.zeros(1, dtype=np.int64).tofile(offsets_out)
+        for batch in iter_data30_batches(path, workers, spans=spans):
+            _timestamps_ms(batch["timestamp"]).tofile(ts_out)
+            np.array(
+                [streams.setdefault(v or "", len(streams)) for v in batch["stream_id"]],
+                dtype=np.int32,
+            ).tofile(stream_out)
+            np.array(
+                [users.setdefault(v or "", len(users)) for v in batch["username"]],
+                dtype=np.int32,
+            ).tofile(user_out)
+            encoded = [(m or "").encode("utf-8") for m in batch["message"]]
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+            (np.cumsum(lengths) + blob_size).tofile(offsets_out)
+            blob_out.write(b"".join(encoded))
+            blob_size += int(lengths.sum())
+            rows += len(encoded)
+
+    (tmp_dir / "streams.json").write_text(json.dumps(list(streams)), encoding="utf-8")
+    (tmp_dir / "users.json").write_text(json.dumps(list(users)), encoding="utf-8")
+    meta = {
+        "version": CACHE_VERSION,
+        "rows": rows,
+        "blob_bytes": blob_size,
+        "sources": sources,
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    if cache_dir.exists():
+        for old in cache_dir.iterdir():
+            old.unlink()
+        cache_dir.rmdir()
+    tmp_dir.rename(cache_dir)
+    return cache_dir
+
+
+class Data30Cache:
+    """
+    The chat as read-only memory-mapped arrays (see build_data30_cache). Opening
+    costs milliseconds, and processes opening the same cache share its pages.
+    """
+
+    def __init__(self, cache_dir: Path = DATA30_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+        rows = self.meta["rows"]
+        self.ts = self._map("ts.i64", np.int64, rows)
+        self.stream = self._map("stream.i32", np.int32, rows)
+        self.user = self._map("user.i32", np.int32, rows)
+        self.msg_offsets = self._map("msg_offsets.i64", np.int64, rows + 1)
+        self.msg_blob = self._map("msg_blob.u8", np.uint8, self.meta["blob_bytes"])
+        self.stream_names: list[str] = json.loads(
+            (cache_dir / "streams.json").read_text(encoding="utf-8")
+        )
+        self.user_names: list[str] = json.loads(
+            (cache_dir / "users.json").read_text(encoding="utf-8")
+        )
+
+    def _map(self, name: str, dtype, count: int) -> np.ndarray:
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self.cache_dir / name, dtype=dtype, mode="r", shape=(count,))
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def message(self, i: int) -> str:
+        start, end = self.msg_offsets[i], self.msg_offsets[i + 1]
+        return self.msg_blob[start:end].tobytes().decode("utf-8")
+
+    def message_lengths(self) -> np.ndarray:
+        # UTF-8 bytes per message
+        return np.diff(self.msg_offsets)
+
+
+def load_data30_cache(
+    path: Path = DATA30_PATH,
+    cache_dir: Path = DATA30_CACHE_DIR,
+    rebuild: bool = True,
+) -> Data30Cache:
+    """
+    Opens the columnar cache, (re)building it first when it is missing or the chat
+    files changed since it was built.
+    """
+    meta_path = cache_dir / "meta.json"
+    fresh = False
+    if meta_path.exists():
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        fresh = (
+            meta.get("version") == CACHE_VERSION
+            and meta.get("sources") == _source_stamp(path)
+        )
+    if not fresh:
+        if not rebuild:
+            raise FileNotFoundError(f"No up-to-date data30 cache in {cache_dir}")
+        print(f"Building data30 cache in {cache_dir}", file=sys.stderr)
+        build_data30_cache(path, cache_dir)
+    return Data30Cache(cache_dir)
+
+
+if __name__ == "__main__":
+    cache = load_data30_cache()
+    print(
+        f"data30 cache: {len(cache)} messages, {len(cache.stream_names)} streams, "
+        f"{len(cache.user_names)} users in {cache.cache_dir}"
+    )
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import argparse
+
+from aggregators import all_aggregators, run_and_write
+from checkpoints import CheckpointStore
+from data30_utils import MAX_WORKERS
+
+
+def main() -> None:
+    aggregators = all_aggregators()
+    names = [agg.name for agg in aggregators]
+    parser = argparse.ArgumentParser(
+        description="Compute the chat aggregates from one scan of the chat added "
+        "since the last run."
+    )
+    parser.add_argument(
+        "names", nargs="*", metavar="NAME", help=f"Only these: {', '.join(names)}"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help=f"Processes (default: all cores, at most {MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Drop the checkpoints and rescan it all"
+    )
+    args = parser.parse_args()
+    unknown = sorted(set(args.names) - set(names))
+    if unknown:
+        parser.error(f"unknown aggregates: {', '.join(unknown)}")
+
+    store = CheckpointStore()
+    if args.full:
+        store.clear()
+    if args.names:
+        aggregators = [agg for agg in aggregators if agg.name in args.names]
+    run_and_write(aggregators, workers=args.workers, store=store)
+
+
+if __name__ == "__main__":
+    main()
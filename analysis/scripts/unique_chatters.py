@@ -3,16 +3,18 @@ from __future__ import annotations
 import json
 from pathlib import Path
 
-from data30_utils import iter_data30_messages
+import numpy as np
+
+from data30_utils import load_data30_cache
 
 
 def main() -> None:
     root = Path(__file__).resolve().parents[1]
     output_path = root / "data" / "processed" / "unique_chatters.json"
 
-    records = list(iter_data30_messages())
+    cache = load_data30_cache()
     unique = sorted(
-        {record.get("username", "") for record in records if record.get("username", "")}
+        name for name in (cache.user_names[i] for i in np.unique(cache.user)) if name
     )
 
     with output_path.open("w", encoding="utf-8") as handle:
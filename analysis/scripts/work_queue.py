@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pickle
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from aggregators import (
+    PROCESSED_DIR,
+    Aggregator,
+    all_aggregators,
+    feed_events,
+    map_shard,
+    merge_states,
+    write_result,
+)
+from checkpoints import current_watermark
+from data30_utils import (
+    CHUNK_BYTES,
+    DATA30_PATH,
+    data30_events_path,
+    data30_gaps_path,
+    data30_shards,
+)
+
+
+# Spreads the aggregators' map step over machines through a job directory that
+# every machine mounts (at the same path as the data30 files):
+#
+#   job.json                          source files, aggregators, shard list
+#   leases/shard-NNNNN.attempt-K      attempt K at a shard; its mtime is the
+#                                     holder's heartbeat
+#   results/shard-NNNNN.pkl           the shard's aggregator states
+#   errors/shard-NNNNN.attempt-K.txt  traceback of a failed attempt
+#
+# Claiming attempt K is an O_EXCL create, so exactly one worker gets it. A lease
+# whose heartbeat is older than the lease time (the worker died or hung) is
+# taken over by creating attempt K + 1; a failed attempt expires its lease at
+# once. Heartbeats are file times set by the file server, so their age is taken
+# against its clock (the mtime of a freshly touched .clock-<worker> probe), not
+# against the local one, which may be off by more than a lease. The reducer
+# merges results in shard order, so the outputs match a single-machine
+# run_aggregates.py over the same data.
+#
+#   python work_queue.py init /shared/job [NAME ...]
+#   python work_queue.py work /shared/job --processes 32     (on every machine)
+#   python work_queue.py reduce /shared/job
+
+JOB_NAME = "job.json"
+JOB_VERSION = 1
+DEFAULT_LEASE_S = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_S = 5.0
+
+
+def shard_name(index: int) -> str:
+    return f"shard-{index:05d}"
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    def __init__(self, root: Path):
+        self.root = root
+        self.leases = root / "leases"
+        self.results = root / "results"
+        self.errors = root / "errors"
+        self._probe = root / f".clock-{worker_name()}"
+        self._job: dict | None = None
+
+    @classmethod
+    def create(
+        cls,
+        root: Path,
+        names: list[str],
+        path: Path = DATA30_PATH,
+        events_path: Path | None = None,
+        chunk_bytes: int = CHUNK_BYTES,
+        gaps_path: Path | None = None,
+    ) -> WorkQueue:
+        """
+        Plans a job over the chat as it is now: complete lines only, split into
+        shards of about `chunk_bytes`. The events and gaps default to those next
+        to `path`.
+        """
+        if (root / JOB_NAME).exists():
+            raise FileExistsError(f"{root / JOB_NAME} already exists")
+        if events_path is None:
+            events_path = data30_events_path(path)
+        if gaps_path is None:
+            gaps_path = data30_gaps_path(path)
+        target = current_watermark(path, events_path)
+        spans = {file_path: (0, end) for file_path, end in target["chat"].items()}
+        job = {
+            "version": JOB_VERSION,
+            "source": str(path),
+            "events_path": str(events_path),
+            "events_end": target["events"],
+            "gaps_path": str(gaps_path),
+            "aggregators": names,
+            "shards": [
+                list(shard) for shard in data30_shards(path, chunk_bytes, spans)
+            ],
+        }
+        queue = cls(root)
+        for directory in (queue.leases, queue.results, queue.errors):
+            directory.mkdir(parents=True, exist_ok=True)
+        tmp = root / f"{JOB_NAME}.tmp"
+        tmp.write_text(json.dumps(job, indent=2) + "\n", encoding="utf-8")
+        tmp.replace(root / JOB_NAME)
+        return queue
+
+    @property
+    def job(self) -> dict:
+        if self._job is None:
+            job = json.loads((self.root / JOB_NAME).read_text(encoding="utf-8"))
+            if job.get("version") != JOB_VERSION:
+                raise ValueError(f"Unsupported job version in {self.root / JOB_NAME}")
+            self._job = job
+        return self._job
+
+    def aggregators(self) -> list[Aggregator]:
+        job = self.job
+        use_events = job["events_end"] is not None
+        events_path = Path(job["events_path"])
+        # jobs planned before gaps_path was recorded
+        gaps_path = Path(job.get("gaps_path") or data30_gaps_path(Path(job["source"])))
+        return [
+            agg
+            for agg in all_aggregators(use_events, events_path, gaps_path)
+            if agg.name in job["aggregators"]
+        ]
+
+    def _lease(self, index: int, attempt: int) -> Path:
+        return self.leases / f"{shard_name(index)}.attempt-{attempt}"
+
+    def _result(self, index: int) -> Path:
+        return self.results / f"{shard_name(index)}.pkl"
+
+    def now(self) -> float:
+        """
+        The shared filesystem's current time, to compare heartbeats against.
+        """
+        self._probe.touch()
+        return self._probe.stat().st_mtime
+
+    def _attempts(self, index: int) -> list[tuple[int, float]]:
+        # (attempt, heartbeat mtime) for every lease taken on the shard so far
+        prefix = f"{shard_name(index)}.attempt-"
+        attempts = []
+        for lease in self.leases.glob(f"{prefix}*"):
+            try:
+                attempts.append((int(lease.name[len(prefix) :]), lease.stat().st_mtime))
+            except (ValueError, FileNotFoundError):
+                continue
+        return sorted(attempts)
+
+    def status(
+        self,
+        index: int,
+        lease_s: float = DEFAULT_LEASE_S,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        now: float | None = None,
+    ) -> tuple[str, int]:
+        """
+        ("done" | "held" | "failed" | "open", attempts so far) for one shard, as of
+        `now` on the filesystem's clock (default: read it).
+        """
+        if self._result(index).exists():
+            return "done", 0
+        attempts = self._attempts(index)
+        if not attempts:
+            return "open", 0
+        attempt, heartbeat = attempts[-1]
+        if now is None:
+            now = self.now()
+        if now - heartbeat < lease_s:
+            return "held", attempt
+        if attempt >= max_attempts:
+            return "failed", attempt
+        return "open", attempt
+
+    def claim(self, index: int, attempt: int, worker: str) -> Path | None:
+        lease = self._lease(index, attempt)
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None  # another worker got this attempt first
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            json.dump({"worker": worker, "claimed_at": time.time()}, handle)
+        return lease
+
+    def run_shard(
+        self,
+        index: int,
+        lease: Path,
+        aggregators: list[Aggregator],
+        worker: str,
+        lease_s: float = DEFAULT_LEASE_S,
+    ) -> bool:
+        stop = threading.Event()
+
+        def heartbeat() -> None:
+            while not stop.wait(lease_s / 4):
+                try:
+                    os.utime(lease)
+                except OSError:
+                    pass
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            states = map_shard(tuple(self.job["shards"][index]), aggregators)
+            self._write_result(index, states, worker)
+            return True
+        except Exception:
+            error = self.errors / f"{lease.name}.txt"
+            error.write_text(f"{worker}\n{traceback.format_exc()}", encoding="utf-8")
+            print(
+                f"[{worker}] {shard_name(index)} failed, see {error}", file=sys.stderr
+            )
+            # expire the lease now so the retry does not wait out the lease time
+            os.utime(lease, (0, 0))
+            return False
+        finally:
+            stop.set()
+            beat.join()
+
+    def _write_result(self, index: int, states: list[Any], worker: str) -> None:
+        # a worker whose lease was taken over may finish too; both results are
+        # the same, and the rename makes either one whole
+        path = self._result(index)
+        tmp = path.with_name(f"{path.name}.{worker}.tmp")
+        with tmp.open("wb") as handle:
+            pickle.dump(states, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            handle.flush()
+            os.fsync(handle.fileno())
+        tmp.replace(path)
+
+    def work(
+        self,
+        worker: str | None = None,
+        lease_s: float = DEFAULT_LEASE_S,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        poll_s: float = DEFAULT_POLL_S,
+    ) -> int:
+        """
+        Claims and maps shards until none are left to claim or wait for. Returns
+        how many shards this worker completed.
+        """
+        worker = worker or worker_name()
+        aggregators = self.aggregators()
+        completed = 0
+        while True:
+            waiting = progressed = False
+            now = self.now()
+            for index in range(len(self.job["shards"])):
+                state, attempt = self.status(index, lease_s, max_attempts, now)
+                if state == "held":
+                    waiting = True
+                if state != "open":
+                    continue
+                lease = self.claim(index, attempt + 1, worker)
+                if lease is None:
+                    waiting = True
+                    continue
+                if self._result(index).exists():
+                    continue  # finished by the previous holder meanwhile
+                completed += self.run_shard(index, lease, aggregators, worker, lease_s)
+                progressed = True
+                now = self.now()
+            if not waiting and not progressed:
+                return completed
+            if not progressed:
+                time.sleep(poll_s)
+
+    def counts(
+        self,
+        lease_s: float = DEFAULT_LEASE_S,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> dict[str, int]:
+        counts = {"done": 0, "held": 0, "failed": 0, "open": 0}
+        now = self.now()
+        for index in range(len(self.job["shards"])):
+            counts[self.status(index, lease_s, max_attempts, now)[0]] += 1
+        return counts
+
+    def reduce(self) -> tuple[list[Aggregator], list[Any]]:
+        """
+        Merges the shard results in shard order, after the events (small, so read
+        here). Every shard must be done.
+        """
+        job = self.job
+        missing = [
+            shard_name(index)
+            for index in range(len(job["shards"]))
+            if not self._result(index).exists()
+        ]
+        if missing:
+            raise RuntimeError(f"{len(missing)} shards not done, first {missing[0]}")
+        aggregators = self.aggregators()
+        states = [agg.init() for agg in aggregators]
+        events_end = job["events_end"]
+        feed_events(
+            aggregators,
+            states,
+            None if events_end is None else (0, events_end),
+            Path(job["events_path"]),
+        )
+        for index in range(len(job["shards"])):
+            with self._result(index).open("rb") as handle:
+                states = merge_states(aggregators, states, pickle.load(handle))
+        return aggregators, states
+
+
+def _work(root: Path, lease_s: float, max_attempts: int, poll_s: float) -> int:
+    return WorkQueue(root).work(None, lease_s, max_attempts, poll_s)
+
+
+def main() -> None:
+    names = [agg.name for agg in all_aggregators()]
+    parser = argparse.ArgumentParser(
+        description="Run the chat aggregates across machines via a shared directory."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="Plan a job over the chat as it is now")
+    init.add_argument("queue", type=Path)
+    init.add_argument(
+        "names", nargs="*", metavar="NAME", help=f"Only these: {', '.join(names)}"
+    )
+    init.add_argument("--data", type=Path, default=DATA30_PATH, help="Chat file or dir")
+    init.add_argument(
+        "--chunk-mb", type=int, default=CHUNK_BYTES >> 20, help="Shard size in MB"
+    )
+
+    work = commands.add_parser("work", help="Map shards until the job is done")
+    work.add_argument("queue", type=Path)
+    work.add_argument(
+        "--processes", type=int, default=1, help="Worker processes on this machine"
+    )
+    work.add_argument(
+        "--lease-s",
+        type=float,
+        default=DEFAULT_LEASE_S,
+        help="Seconds without a heartbeat before a lease is taken over",
+    )
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    work.add_argument("--poll-s", type=float, default=DEFAULT_POLL_S)
+
+    status = commands.add_parser("status", help="Count shards by state")
+    status.add_argument("queue", type=Path)
+
+    reduce = commands.add_parser("reduce", help="Merge the shards, write the outputs")
+    reduce.add_argument("queue", type=Path)
+    reduce.add_argument("--output-dir", type=Path, default=PROCESSED_DIR)
+    args = parser.parse_args()
+
+    if args.command == "init":
+        unknown = sorted(set(args.names) - set(names))
+        if unknown:
+            parser.error(f"unknown aggregates: {', '.join(unknown)}")
+        try:
+            queue = WorkQueue.create(
+                args.queue,
+                args.names or names,
+                args.data,
+                chunk_bytes=args.chunk_mb << 20,
+            )
+        except FileExistsError as exc:
+            raise SystemExit(f"{exc}; use a new directory per job")
+        print(f"Planned {len(queue.job['shards'])} shards in {args.queue}")
+    elif args.command == "work":
+        job_args = (args.queue, args.lease_s, args.max_attempts, args.poll_s)
+        if args.processes <= 1:
+            completed = _work(*job_args)
+        else:
+            with ProcessPoolExecutor(max_workers=args.processes) as pool:
+                futures = [pool.submit(_work, *job_args) for _ in range(args.processes)]
+                completed = sum(future.result() for future in futures)
+        counts = WorkQueue(args.queue).counts(args.lease_s, args.max_attempts)
+        print(f"Mapped {completed} shards here; job: {counts}")
+    elif args.command == "status":
+        print(WorkQueue(args.queue).counts())
+    else:
+        try:
+            aggregators, states = WorkQueue(args.queue).reduce()
+        except RuntimeError as exc:
+            raise SystemExit(str(exc))
+        for agg, state in zip(aggregators, states):
+            write_result(agg, agg.finalize(state), args.output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# the analysis scripts import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+USERS = [f"viewer{i}" for i in range(40)]
+STREAMS = [
+    "xqc_2024-12-24T18-00-00Z",
+    "xqc_2024-12-25T18-00-00Z",
+    "hasan_2024-12-25T20-00-00Z",
+]
+MESSAGES = [
+    "hello chat",
+    "merry christmas @xqc",
+    "Cheer100 lets go",
+    "@hasan what is this",
+    "LUL",
+    "a much longer message that goes on and on about the stream and the game",
+    "@viewer3 @viewer7 look",
+]
+
+
+def chat_rows(count: int = 3000) -> list[dict]:
+    rows = []
+    for i in range(count):
+        stream = STREAMS[(i * 3) // count]
+        day = stream.split("_", 1)[1][:10]
+        rows.append(
+            {
+                "vid": stream,
+                "ts": f"{day}T{18 + (i % 4):02d}:{(i // 60) % 60:02d}:{i % 60:02d}Z",
+                "u": USERS[(i * 7) % len(USERS)],
+                "m": MESSAGES[i % len(MESSAGES)],
+            }
+        )
+    return rows
+
+
+@pytest.fixture
+def corpus(tmp_path: Path) -> tuple[Path, Path]:
+    """
+    A small all_chat.jsonl (three streams, two malformed lines) and events.jsonl.
+    """
+    chat = tmp_path / "data30" / "all_chat.jsonl"
+    chat.parent.mkdir()
+    lines = [json.dumps(row) for row in chat_rows()]
+    lines[100] = '{"vid": "xqc_2024-12-24T18-00-00Z", "ts":'
+    lines[2000] = "not json"
+    chat.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    events = chat.with_name("events.jsonl")
+    rows = []
+    for i in range(60):
+        stream = STREAMS[i % len(STREAMS)]
+        day = stream.split("_", 1)[1][:10]
+        row = {"vid": stream, "ts": f"{day}T19:{i:02d}:00Z", "u": USERS[i % len(USERS)]}
+        if i % 2:
+            row.update(type="bits", bits=100)
+        else:
+            row.update(type="sub", tier="1000")
+        rows.append(row)
+    events.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8")
+    return chat, events
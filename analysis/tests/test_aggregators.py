@@ -0,0 +1,59 @@
+import json
+
+from aggregators import (
+    ChatCount,
+    FunStats,
+    all_aggregators,
+    feed_events,
+    run_incremental,
+    run_pass,
+)
+from checkpoints import CheckpointStore, current_watermark, mark_watermark
+
+
+def results(aggregators, states):
+    return {agg.name: agg.finalize(state) for agg, state in zip(aggregators, states)}
+
+
+def test_events_feed_the_event_aggregators(corpus):
+    chat, events = corpus
+    # events.jsonl of this corpus, not of the default data30 directory
+    aggregators = all_aggregators(None, events, chat.with_name("gaps.jsonl"))
+    assert all(agg.uses_events for agg in aggregators[2:4])
+    states = [agg.init() for agg in aggregators]
+    feed_events(aggregators, states, (0, None), events)
+    by_name = results(aggregators, states)
+    assert by_name["bits_over_time"] and by_name["subs_over_time"]
+
+    events.unlink()
+    assert not any(agg.uses_events for agg in all_aggregators(None, events))
+
+
+def test_fun_stats_leaves_the_corpus_gaps_out_of_the_chat_rate(corpus):
+    chat, _ = corpus
+    gaps = chat.with_name("gaps.jsonl")
+    agg = FunStats(gaps)
+    state = run_pass([agg], chat, 1, events_span=None)[0]
+    rate = agg.finalize(state)["avg_chats_per_minute"]
+
+    stream_id, (lo, hi) = next(iter(state["stream_bounds"].items()))
+    gap = {"vid": stream_id, "start": None, "end": None, "duration_s": (hi - lo) / 2}
+    gaps.write_text(json.dumps(gap) + "\n", encoding="utf-8")
+    assert agg.finalize(state)["avg_chats_per_minute"] > rate
+
+
+def test_chat_count_counts_every_non_blank_line(corpus, tmp_path):
+    chat, events = corpus
+    chat.write_bytes(chat.read_bytes() + b"\n  \n")
+    # the two malformed lines count, as they always did in chat_count.py
+    lines = [line for line in chat.read_bytes().split(b"\n") if line.strip()]
+    agg = ChatCount()
+    states = run_pass([agg], chat, 1, events_span=None, chunk_bytes=4096)
+    assert agg.finalize(states[0]) == {"count": len(lines)}
+
+    # checkpoints from before the fix left them out and must not be resumed
+    store = CheckpointStore(tmp_path / "checkpoints")
+    marks = mark_watermark(current_watermark(chat, events), events)
+    store.save("chat_count-v1", chat, [len(lines) - 2], marks)
+    states = run_incremental([agg], chat, 1, store)
+    assert agg.finalize(states[0]) == {"count": len(lines)}
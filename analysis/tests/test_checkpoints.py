@@ -0,0 +1,34 @@
+from aggregators import all_aggregators, run_incremental, run_pass
+from checkpoints import CheckpointStore
+
+
+def results(aggregators, states):
+    return {agg.name: agg.finalize(state) for agg, state in zip(aggregators, states)}
+
+
+def cut_at_line(data, fraction):
+    return data.index(b"\n", int(len(data) * fraction)) + 1
+
+
+def test_incremental_runs_match_a_full_scan(corpus, tmp_path, capsys):
+    chat, events = corpus
+    data, event_data = chat.read_bytes(), events.read_bytes()
+    cut, event_cut = cut_at_line(data, 0.6), cut_at_line(event_data, 0.5)
+    chat.write_bytes(data[:cut])
+    events.write_bytes(event_data[:event_cut])
+    store = CheckpointStore(tmp_path / "checkpoints")
+
+    aggregators = all_aggregators(True)
+    run_incremental(aggregators, chat, workers=1, store=store)
+    chat.write_bytes(data)
+    events.write_bytes(event_data)
+    capsys.readouterr()
+    states = run_incremental(aggregators, chat, workers=1, store=store)
+    assert f": {len(data) - cut} new chat bytes" in capsys.readouterr().out
+
+    full = run_pass(all_aggregators(True), chat, 1, events_path=events)
+    by_name = results(aggregators, states)
+    assert by_name == results(all_aggregators(True), full)
+    # the corpus's own events, not the default data30 ones
+    assert sum(day["bits"] for day in by_name["bits_over_time"]) == 30 * 100
+    assert sum(day["subs"] for day in by_name["subs_over_time"]) == 30
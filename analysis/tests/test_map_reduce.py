@@ -0,0 +1,37 @@
+from aggregators import all_aggregators, map_shard, merge_states, run_pass
+from data30_utils import data30_shards
+
+
+def results(aggregators, states):
+    return {agg.name: agg.finalize(state) for agg, state in zip(aggregators, states)}
+
+
+def test_shard_merge_matches_one_scan(corpus):
+    chat, events = corpus
+    aggregators = all_aggregators(True)
+
+    def run(chunk_bytes, workers):
+        states = run_pass(aggregators, chat, workers, chunk_bytes=chunk_bytes)
+        return results(aggregators, states)
+
+    whole = run(1 << 30, 1)
+    assert run(4096, 1) == whole
+    assert run(4096, 2) == whole
+
+
+def test_shard_states_merge_associatively(corpus):
+    chat, _ = corpus
+    aggregators = all_aggregators(False)
+    shards = [map_shard(task, aggregators) for task in data30_shards(chat, 4096)]
+    assert len(shards) >= 3
+
+    def fold(states):
+        out = [agg.init() for agg in aggregators]
+        for state in states:
+            out = merge_states(aggregators, out, state)
+        return out
+
+    left = fold(shards)
+    shards = [map_shard(task, aggregators) for task in data30_shards(chat, 4096)]
+    right = merge_states(aggregators, fold(shards[:1]), fold(shards[1:]))
+    assert results(aggregators, left) == results(aggregators, right)
@@ -0,0 +1,69 @@
+import os
+import time
+
+import work_queue
+from aggregators import all_aggregators, run_pass
+from work_queue import WorkQueue
+
+NAMES = ["chat_count", "unique_chatters", "longest_message"]
+
+
+def test_stale_lease_takeover_and_failed_attempt_retry(corpus, tmp_path, monkeypatch):
+    chat, events = corpus
+    queue = WorkQueue.create(tmp_path / "job", NAMES, chat, events, chunk_bytes=16384)
+    assert len(queue.job["shards"]) >= 4
+
+    # a worker died holding shard 0: its heartbeat is older than the lease
+    dead = queue.claim(0, 1, "dead")
+    stale = queue.now() - 120
+    os.utime(dead, (stale, stale))
+    assert queue.status(0, lease_s=60) == ("open", 1)
+
+    # shard 1 was just claimed; a local clock an hour ahead must not expire it
+    live = queue.claim(1, 1, "live")
+    real_time = time.time
+    with monkeypatch.context() as patch:
+        patch.setattr(work_queue.time, "time", lambda: real_time() + 3600)
+        assert queue.status(1, lease_s=60) == ("held", 1)
+    os.utime(live, (0, 0))  # let it go the way a failed attempt does
+
+    # the first attempt at shard 2 fails
+    shard_2 = tuple(queue.job["shards"][2])
+    failures = []
+    map_shard = work_queue.map_shard
+
+    def flaky(task, aggregators):
+        if task == shard_2 and not failures:
+            failures.append(task)
+            raise OSError("disk went away")
+        return map_shard(task, aggregators)
+
+    monkeypatch.setattr(work_queue, "map_shard", flaky)
+    assert queue.work("w1", lease_s=60, poll_s=0.01) == len(queue.job["shards"])
+
+    assert (queue.leases / "shard-00000.attempt-2").exists()
+    assert (queue.errors / "shard-00002.attempt-1.txt").exists()
+    assert (queue.leases / "shard-00002.attempt-2").exists()
+    assert queue.counts(lease_s=60) == {
+        "done": len(queue.job["shards"]),
+        "held": 0,
+        "failed": 0,
+        "open": 0,
+    }
+
+    aggregators, states = queue.reduce()
+    expected = [agg for agg in all_aggregators(True) if agg.name in NAMES]
+    expected_states = run_pass(expected, chat, workers=1, events_span=None)
+    assert [agg.finalize(s) for agg, s in zip(aggregators, states)] == [
+        agg.finalize(s) for agg, s in zip(expected, expected_states)
+    ]
+
+
+def test_attempts_run_out(corpus, tmp_path):
+    chat, events = corpus
+    queue = WorkQueue.create(tmp_path / "job", NAMES, chat, events, chunk_bytes=1 << 20)
+    assert queue.job["gaps_path"] == str(chat.with_name("gaps.jsonl"))
+    for attempt in (1, 2):
+        os.utime(queue.claim(0, attempt, "w"), (0, 0))
+    assert queue.status(0, lease_s=60, max_attempts=2) == ("failed", 2)
+    assert queue.counts(lease_s=60, max_attempts=2)["failed"] == 1
@@ -0,0 +1,429 @@
+from __future__ import annotations
+import asyncio
+import os
+import ssl
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from .irc import (
+    IDLE_TIMEOUT_S,
+    IRC_DISCONNECTS,
+    IRC_RECONNECTS,
+    PARSE_SECONDS,
+    RECONNECT_BACKOFF_MAX_S,
+    GapCallback,
+    IRCRecord,
+    backoff_delays,
+    parse_irc_bytes,
+)
+from .joins import TokenBucket
+
+
+# max bytes per IRC line (tags included) before StreamReader.readline gives up
+READ_LIMIT = 1 << 16
+
+
+class _Connection:
+    """
+    One TLS connection owned by AsyncIRCPool. Holds a shard of the joined channels
+    and keeps itself connected: on a drop it reconnects with backoff and rejoins its
+    channels, reporting per-channel gaps through the pool's callbacks.
+    """
+
+    def __init__(self, pool: "AsyncIRCPool", index: int):
+        self.pool = pool
+        self.index = index
+        self.channels: Set[str] = set()
+
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._rejoin_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_rx = 0.0
+        # channels JOINed on the current socket; only these can lose coverage
+        self._live: Set[str] = set()
+        # channels reported disconnected and not yet rejoined
+        self._down: Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(
+            self._run(), name=f"twitch-irc-conn-{self.index}"
+        )
+
+    async def _open(self) -> None:
+        pool = self.pool
+        ctx = ssl.create_default_context() if pool.use_tls else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                pool.server,
+                pool.port,
+                ssl=ctx,
+                server_hostname=pool.server if ctx else None,
+                limit=READ_LIMIT,
+            ),
+            timeout=20,
+        )
+
+        # auth + capabilities
+        self._write(f"PASS {pool.oauth}")
+        self._write(f"NICK {pool.nick}")
+        self._write("CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership")
+        await self._writer.drain()
+        self._ready.set()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        delays = backoff_delays()
+        while not self._closing:
+            opened_at = None
+            watchdog = None
+            try:
+                await self._open()
+                opened_at = loop.time()
+                if self._down:
+                    self.pool.reconnects += 1
+                    IRC_RECONNECTS.inc()
+                    print(f"[irc] conn {self.index} reconnected", file=sys.stderr)
+                self._rejoin_task = loop.create_task(self._rejoin())
+                watchdog = loop.create_task(self._watchdog())
+                await self._read_loop()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[irc] conn {self.index} error: {e}", file=sys.stderr)
+            finally:
+                self._ready.clear()
+                for task in (self._rejoin_task, watchdog):
+                    if task is not None:
+                        task.cancel()
+                self._rejoin_task = None
+                self._close_writer()
+
+            if self._closing:
+                return
+
+            # a channel whose JOIN never reached a socket had no coverage to lose
+            newly_down = sorted(self._live & self.channels)
+            self._live.clear()
+            if newly_down:
+                self.pool.disconnects += 1
+                IRC_DISCONNECTS.inc()
+                print(
+                    f"[irc] conn {self.index} disconnected, {len(newly_down)} channels affected",
+                    file=sys.stderr,
+                )
+                self.pool._notify(self.pool.on_disconnect, newly_down, time.time())
+                self._down.update(newly_down)
+
+            if opened_at is not None and loop.time() - opened_at > RECONNECT_BACKOFF_MAX_S:
+                # the connection was healthy for a while; start backing off from scratch
+                delays = backoff_delays()
+            await asyncio.sleep(next(delays))
+
+    async def _rejoin(self) -> None:
+        bucket = self.pool.join_bucket
+        for ch in sorted(self.channels):
+            wait = bucket.try_take()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = bucket.try_take()
+            if ch not in self.channels:
+                continue  # parted meanwhile
+            self._write(f"JOIN #{ch}")
+            self._live.add(ch)
+            if ch in self._down:
+                self._down.discard(ch)
+                self.pool._notify(self.pool.on_reconnect, [ch], time.time())
+        if self._writer is not None:
+            await self._writer.drain()
+
+    async def _watchdog(self) -> None:
+        # Twitch PINGs about every 5 minutes; a silent socket is a dead one
+        loop = asyncio.get_running_loop()
+        self._last_rx = loop.time()
+        while True:
+            await asyncio.sleep(30)
+            if loop.time() - self._last_rx > IDLE_TIMEOUT_S:
+                print(f"[irc] conn {self.index} idle for {IDLE_TIMEOUT_S:.0f}s, reconnecting", file=sys.stderr)
+                self._close_writer()
+                return
+
+    async def _read_loop(self) -> None:
+        assert self._reader is not None
+        reader = self._reader
+        on_privmsg = self.pool.on_privmsg
+        on_usernotice = self.pool.on_usernotice
+        clock = asyncio.get_running_loop().time
+        perf = time.perf_counter
+        while True:
+            line = await reader.readline()
+            if not line:
+                # disconnected
+                return
+            self._last_rx = clock()
+            t0 = perf()
+            evt = parse_irc_bytes(line)
+            PARSE_SECONDS.observe(perf() - t0)
+            if not evt:
+                continue
+            if evt.type == "PING":
+                self._write(f"PONG :{evt.payload}")
+                continue
+            if evt.type == "RECONNECT":
+                # server is about to restart; drop now and come back
+                return
+            if evt.type == "PRIVMSG":
+                try:
+                    on_privmsg(evt)
+                except Exception:
+                    # swallow to keep logging alive
+                    pass
+            elif evt.type == "USERNOTICE" and on_usernotice is not None:
+                try:
+                    on_usernotice(evt)
+                except Exception:
+                    pass
+
+    def _write(self, line: str) -> None:
+        if self._writer is None or self._writer.is_closing():
+            raise RuntimeError("IRC socket not connected.")
+        self._writer.write((line + "\r\n").encode("utf-8"))
+
+    async def wait_ready(self, timeout: float = 20) -> None:
+        await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+
+    async def send(self, line: str) -> bool:
+        """
+        Sends a line if connected. Returns False when the connection is down; JOINs
+        are then covered by the rejoin pass after the next successful open.
+        """
+        if not self.ready:
+            return False
+        self._write(line)
+        assert self._writer is not None
+        await self._writer.drain()
+        return True
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        self._reader = None
+        self._writer = None
+
+    async def close(self) -> None:
+        self._closing = True
+        if self._writer is not None and not self._writer.is_closing():
+            try:
+                self._writer.write(b"QUIT\r\n")
+                await asyncio.wait_for(self._writer.drain(), timeout=2)
+            except Exception:
+                pass
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+        self._close_writer()
+
+
+class AsyncIRCPool:
+    """
+    Twitch IRC ingest over many TLS connections multiplexed on one asyncio event loop.
+
+    Channels are sharded across connections (at most `channels_per_connection` each) and
+    parsed PRIVMSG events are handed to `on_privmsg` (USERNOTICE to `on_usernotice`)
+    from the loop thread. The public methods mirror IRCClient and are safe to call
+    from any other thread.
+
+    Each connection reconnects on its own; `on_disconnect(channels, t)` and
+    `on_reconnect(channels, t)` run on the loop thread for the channels it holds, and
+    rejoins after a reconnect are paced by `join_bucket`.
+    """
+
+    def __init__(
+        self,
+        server: str,
+        port: int,
+        use_tls: bool,
+        nick: str,
+        oauth: str,
+        on_privmsg: Callable[[IRCRecord], None],
+        channels_per_connection: int = 50,
+        on_disconnect: Optional[GapCallback] = None,
+        on_reconnect: Optional[GapCallback] = None,
+        join_bucket: Optional[TokenBucket] = None,
+        on_usernotice: Optional[Callable[[IRCRecord], None]] = None,
+    ):
+        self.server = server
+        self.port = port
+        self.use_tls = use_tls
+        self.nick = nick
+        self.oauth = oauth
+        self.on_privmsg = on_privmsg
+        self.on_usernotice = on_usernotice
+        self.channels_per_connection = max(1, int(channels_per_connection))
+        self.on_disconnect = on_disconnect
+        self.on_reconnect = on_reconnect
+        self.join_bucket = join_bucket or TokenBucket()
+
+        self.disconnects = 0
+        self.reconnects = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._conns: List[_Connection] = []
+        self._next_index = 0
+
+        # channel -> connection that holds it
+        self._joined: Dict[str, _Connection] = {}
+
+    @classmethod
+    def from_env(
+        cls,
+        server: str,
+        port: int,
+        use_tls: bool,
+        on_privmsg: Callable[[IRCRecord], None],
+        channels_per_connection: int = 50,
+        on_disconnect: Optional[GapCallback] = None,
+        on_reconnect: Optional[GapCallback] = None,
+        join_bucket: Optional[TokenBucket] = None,
+        on_usernotice: Optional[Callable[[IRCRecord], None]] = None,
+    ) -> "AsyncIRCPool":
+        nick = os.getenv("TWITCH_IRC_NICK", "").strip()
+        oauth = os.getenv("TWITCH_IRC_OAUTH", "").strip()
+        if not nick or not oauth:
+            raise RuntimeError("Missing TWITCH_IRC_NICK / TWITCH_IRC_OAUTH in environment (.env).")
+        return cls(
+            server,
+            port,
+            use_tls,
+            nick,
+            oauth,
+            on_privmsg,
+            channels_per_connection,
+            on_disconnect=on_disconnect,
+            on_reconnect=on_reconnect,
+            join_bucket=join_bucket,
+            on_usernotice=on_usernotice,
+        )
+
+    @property
+    def connection_count(self) -> int:
+        return len(self._conns)
+
+    def connect(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+            loop.close()
+
+        self._loop = loop
+        self._thread = threading.Thread(target=run, name="twitch-irc-loop", daemon=True)
+        self._thread.start()
+        started.wait()
+
+        # open the first connection eagerly so network errors surface at boot
+        self._call(self._open_first())
+
+    def close(self) -> None:
+        if not self._loop:
+            return
+        try:
+            self._call(self._close_all(), timeout=10)
+        except Exception:
+            pass
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            if self._thread:
+                self._thread.join(timeout=5)
+            self._loop = None
+            self._thread = None
+
+    def join(self, channel: str) -> None:
+        channel = channel.strip().lstrip("#").lower()
+        if not channel or channel in self._joined:
+            return
+        self._call(self._join(channel))
+
+    def part(self, channel: str) -> None:
+        channel = channel.strip().lstrip("#").lower()
+        if not channel or channel not in self._joined:
+            return
+        self._call(self._part(channel))
+
+    def _call(self, coro, timeout: float = 30):
+        if not self._loop:
+            coro.close()
+            raise RuntimeError("IRC event loop not running.")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    @staticmethod
+    def _notify(callback: Optional[GapCallback], channels: List[str], t: float) -> None:
+        if callback is None:
+            return
+        try:
+            callback(channels, t)
+        except Exception as e:
+            print(f"[irc] gap callback failed: {e}", file=sys.stderr)
+
+    async def _ensure_connection(self) -> _Connection:
+        # fullest connection with spare capacity, else open a new one; packing rather
+        # than spreading lets connections drain empty under churn and be closed
+        open_conns = [c for c in self._conns if len(c.channels) < self.channels_per_connection]
+        if open_conns:
+            return max(open_conns, key=lambda c: len(c.channels))
+        conn = _Connection(self, self._next_index)
+        self._next_index += 1
+        self._conns.append(conn)
+        conn.start()
+        return conn
+
+    async def _open_first(self) -> None:
+        conn = await self._ensure_connection()
+        await conn.wait_ready()
+
+    async def _join(self, channel: str) -> None:
+        conn = await self._ensure_connection()
+        conn.channels.add(channel)
+        self._joined[channel] = conn
+        # a connection that is still (re)opening joins it in its rejoin pass
+        if await conn.send(f"JOIN #{channel}"):
+            conn._live.add(channel)
+
+    async def _part(self, channel: str) -> None:
+        conn = self._joined.pop(channel, None)
+        if conn is None:
+            return
+        conn.channels.discard(channel)
+        conn._live.discard(channel)
+        conn._down.discard(channel)
+        if conn.channels:
+            await conn.send(f"PART #{channel}")
+            return
+        # last channel gone: close the socket and its tasks instead of idling
+        self._conns.remove(conn)
+        await conn.close()
+
+    async def _close_all(self) -> None:
+        await asyncio.gather(*(c.close() for c in self._conns), return_exceptions=True)
+        self._conns.clear()
+        self._joined.clear()
@@ -0,0 +1,347 @@
+from __future__ import annotations
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import load_config
+from .reader import iter_chat, iter_stream_dirs
+from .util import epoch_to_iso, iso_to_epoch, ms_to_iso
+
+
+# Compacts closed collector streams into the analysis data30 layout:
+#   all_chat.jsonl   {"vid", "ts", "u", "m"}            chat, merged by timestamp
+#   events.jsonl     {"vid", "ts", "type", "u", ...}    typed events (see events.py)
+#   gaps.jsonl       {"vid", "start", "end", "duration_s"}  IRC coverage gaps
+# With --partitioned, chat goes to chat/date=YYYY-MM-DD/part-NNNNN.jsonl instead,
+# one part per day per run.
+#
+# Runs are incremental: compact_state.json remembers how many chat lines, events
+# and gaps of each stream were already written, so only streams closed since the
+# last run (or reopened and closed again) contribute, and only their new lines.
+#
+# A stream the collector died in never gets an ended_at. It counts as ended once a
+# newer stream of the same channel exists or its files have not been written for
+# CRASHED_AFTER_S, with its last write as a stand-in ended_at: if a restarted
+# collector later resumes and closes it, the real ended_at differs and the new
+# lines are picked up like any reopened stream.
+
+STATE_NAME = "compact_state.json"
+CRASHED_AFTER_S = 3600
+DEFAULT_OUT = Path(__file__).resolve().parents[2] / "analysis" / "data" / "data30"
+
+# per-event keys that are collector bookkeeping, not data30 fields
+_EVENT_DROP = ("timestamp_utc", "tmi_sent_ts", "recv_ms", "channel", "user", "id", "type")
+
+
+def stream_vid(stream_dir: Path) -> str:
+    # raw_chat/channel=xqc/stream=2025-12-25T23-10-00Z -> "xqc_2025-12-25T23-10-00Z"
+    return f"{stream_dir.parent.name.split('=', 1)[1]}_{stream_dir.name.split('=', 1)[1]}"
+
+
+def _event_ms(evt: Dict) -> int:
+    ms = evt.get("sent_ms")
+    if ms is None:
+        ms = evt.get("recv_ms")
+    if ms is None:
+        ts = evt.get("timestamp_utc")
+        ms = round(iso_to_epoch(ts) * 1000) if ts else 0
+    return ms
+
+
+class StreamSource:
+    """
+    One closed stream to compact: where it starts, and how many of its chat lines,
+    events and gaps earlier runs already wrote.
+    """
+
+    def __init__(self, stream_dir: Path, meta: Dict, done: Dict):
+        self.stream_dir = stream_dir
+        self.vid = stream_vid(stream_dir)
+        self.key = f"{stream_dir.parent.name}/{stream_dir.name}"
+        self.ended_at = meta.get("ended_at")
+        started = meta.get("started_at")
+        self.start_ms = round(iso_to_epoch(started) * 1000) if started else 0
+        self.skip_chat = int(done.get("chat", 0))
+        self.skip_events = int(done.get("events", 0))
+        self.skip_gaps = int(done.get("gaps", 0))
+        self.chat = 0
+        self.events = 0
+        self.gaps = 0
+
+    def iter_chat(self) -> Iterator[Tuple[int, str]]:
+        vid = self.vid
+        for i, evt in enumerate(iter_chat(self.stream_dir, with_raw=False)):
+            if i < self.skip_chat:
+                continue
+            self.chat = i + 1 - self.skip_chat
+            line = json.dumps(
+                {"vid": vid, "ts": evt.get("timestamp_utc"), "u": evt.get("user", ""), "m": evt.get("message", "")},
+                ensure_ascii=False,
+            )
+            yield _event_ms(evt), line
+
+    def read_jsonl(self, name: str, skip: int) -> List[Dict]:
+        path = self.stream_dir / name
+        if not path.exists():
+            return []
+        out: List[Dict] = []
+        with path.open("r", encoding="utf-8") as fh:
+            for i, line in enumerate(fh):
+                if i < skip or not line.strip():
+                    continue
+                try:
+                    out.append(json.loads(line))
+                except ValueError:
+                    print(f"Skipping bad line in {path}:{i + 1}", file=sys.stderr)
+        return out
+
+    def done(self) -> Dict:
+        return {
+            "ended_at": self.ended_at,
+            "chat": self.skip_chat + self.chat,
+            "events": self.skip_events + self.events,
+            "gaps": self.skip_gaps + self.gaps,
+        }
+
+
+def merge_streams(sources: List[StreamSource]) -> Iterator[Tuple[int, str]]:
+    """
+    k-way merge of the sources' chat by timestamp. A stream is only opened once the
+    merge reaches its start time and is closed when exhausted, so memory and open
+    files scale with how many streams overlap in time, not with how many there are.
+    """
+    pending = deque(sorted(sources, key=lambda s: s.start_ms))
+    heap: List[Tuple[int, int, str, Iterator[Tuple[int, str]]]] = []
+    seq = 0
+    while pending or heap:
+        while pending and (not heap or pending[0].start_ms <= heap[0][0]):
+            it = pending.popleft().iter_chat()
+            first = next(it, None)
+            if first is not None:
+                heapq.heappush(heap, (first[0], seq, first[1], it))
+                seq += 1
+        if not heap:
+            continue
+        ms, _, line, it = heap[0]
+        yield ms, line
+        nxt = next(it, None)
+        if nxt is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (nxt[0], seq, nxt[1], it))
+            seq += 1
+
+
+class _AppendFile:
+    """
+    Append target for one run. Opening truncates anything past the size the last
+    committed run recorded (a torn tail from a crashed run); `commit` fsyncs and
+    returns the new size to record.
+    """
+
+    def __init__(self, path: Path, committed: int):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("ab") as fh:
+            if fh.tell() > committed:
+                fh.truncate(committed)
+        self._fh = path.open("a", encoding="utf-8")
+
+    def write(self, line: str) -> None:
+        self._fh.write(line + "\n")
+
+    def commit(self) -> int:
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        size = self._fh.tell()
+        self._fh.close()
+        return size
+
+
+class _PartitionedChat:
+    """
+    chat/date=YYYY-MM-DD/part-NNNNN.jsonl, one part per day touched by this run,
+    written under a .tmp name and renamed on commit. A rerun after a crash reuses
+    the run number, so it replaces rather than duplicates parts.
+    """
+
+    def __init__(self, root: Path, run: int):
+        self.root = root
+        self.run = run
+        self._files: Dict[str, object] = {}
+
+    def write(self, line: str, ms: int) -> None:
+        day = ms_to_iso(ms)[:10]
+        fh = self._files.get(day)
+        if fh is None:
+            path = self._tmp(day)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fh = self._files[day] = path.open("w", encoding="utf-8")
+        fh.write(line + "\n")
+
+    def _tmp(self, day: str) -> Path:
+        return self.root / f"date={day}" / f"part-{self.run:05d}.jsonl.tmp"
+
+    def commit(self) -> None:
+        for day, fh in self._files.items():
+            fh.flush()
+            os.fsync(fh.fileno())
+            fh.close()
+            tmp = self._tmp(day)
+            tmp.replace(tmp.with_suffix(""))
+        self._files.clear()
+
+
+def load_state(out_dir: Path) -> Dict:
+    path = out_dir / STATE_NAME
+    if not path.exists():
+        return {"version": 1, "runs": 0, "files": {}, "streams": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_state(out_dir: Path, state: Dict) -> None:
+    path = out_dir / STATE_NAME
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    tmp.replace(path)
+
+
+def last_write(stream_dir: Path) -> float:
+    return max((p.stat().st_mtime for p in stream_dir.iterdir() if p.is_file()), default=0.0)
+
+
+def find_sources(
+    data_root: Path, state: Dict, crashed_after_s: float = CRASHED_AFTER_S, now: Optional[float] = None
+) -> List[StreamSource]:
+    """
+    Closed streams with something not compacted yet: never seen, or closed again
+    (ended_at changed) after a restart appended to them. Streams left open by a
+    crashed collector count as closed at their last write (see above).
+    """
+    now = time.time() if now is None else now
+    stream_dirs = list(iter_stream_dirs(data_root))
+    # stream=<started_at> folder names sort by start time
+    newest: Dict[Path, str] = {}
+    for sdir in stream_dirs:
+        newest[sdir.parent] = max(newest.get(sdir.parent, sdir.name), sdir.name)
+
+    sources: List[StreamSource] = []
+    for sdir in stream_dirs:
+        meta_path = sdir / "meta.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if not meta.get("ended_at"):
+            written = last_write(sdir)
+            if sdir.name == newest[sdir.parent] and now - written < crashed_after_s:
+                continue  # still live
+            meta["ended_at"] = epoch_to_iso(written)
+            meta["crashed"] = True
+        key = f"{sdir.parent.name}/{sdir.name}"
+        done = state["streams"].get(key, {})
+        if done.get("ended_at") == meta["ended_at"]:
+            continue
+        if meta.get("crashed"):
+            print(f"[compact] {key} was never closed, taking ended_at={meta['ended_at']}", file=sys.stderr)
+        sources.append(StreamSource(sdir, meta, done))
+    return sources
+
+
+def compact(
+    data_root: Path, out_dir: Path, partitioned: bool = False, crashed_after_s: float = CRASHED_AFTER_S
+) -> Dict[str, int]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(out_dir)
+    sources = find_sources(data_root, state, crashed_after_s)
+    if not sources:
+        return {"streams": 0, "chat": 0, "events": 0, "gaps": 0}
+
+    run = int(state.get("runs", 0)) + 1
+    files = state.setdefault("files", {})
+    events_out = _AppendFile(out_dir / "events.jsonl", files.get("events.jsonl", 0))
+    gaps_out = _AppendFile(out_dir / "gaps.jsonl", files.get("gaps.jsonl", 0))
+
+    chat = 0
+    if partitioned:
+        parts = _PartitionedChat(out_dir / "chat", run)
+        for ms, line in merge_streams(sources):
+            parts.write(line, ms)
+            chat += 1
+        parts.commit()
+    else:
+        chat_out = _AppendFile(out_dir / "all_chat.jsonl", files.get("all_chat.jsonl", 0))
+        for _, line in merge_streams(sources):
+            chat_out.write(line)
+            chat += 1
+        files["all_chat.jsonl"] = chat_out.commit()
+
+    # events and gaps are small: merge them in memory
+    events: List[Tuple[int, str]] = []
+    gaps: List[Tuple[str, str]] = []
+    for src in sources:
+        new_events = src.read_jsonl("events.jsonl", src.skip_events)
+        src.events = len(new_events)
+        for evt in new_events:
+            row = {
+                "vid": src.vid,
+                "ts": evt.get("timestamp_utc"),
+                "type": evt.get("type", ""),
+                "u": evt.get("user", ""),
+            }
+            row.update({k: v for k, v in evt.items() if k not in _EVENT_DROP})
+            events.append((_event_ms(evt), json.dumps(row, ensure_ascii=False)))
+        new_gaps = src.read_jsonl("gaps.jsonl", src.skip_gaps)
+        src.gaps = len(new_gaps)
+        for gap in new_gaps:
+            row = {
+                "vid": src.vid,
+                "start": gap.get("disconnected_at"),
+                "end": gap.get("reconnected_at"),
+                "duration_s": gap.get("duration_s"),
+            }
+            gaps.append((row["start"] or "", json.dumps(row, ensure_ascii=False)))
+    for _, line in sorted(events, key=lambda e: e[0]):
+        events_out.write(line)
+    for _, line in sorted(gaps, key=lambda g: g[0]):
+        gaps_out.write(line)
+    files["events.jsonl"] = events_out.commit()
+    files["gaps.jsonl"] = gaps_out.commit()
+
+    for src in sources:
+        state["streams"][src.key] = src.done()
+    state["runs"] = run
+    save_state(out_dir, state)
+    return {"streams": len(sources), "chat": chat, "events": len(events), "gaps": len(gaps)}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Compact closed collector streams into the data30 layout.")
+    ap.add_argument("--config", required=True, help="Path to config.yaml (for data_root)")
+    ap.add_argument("--out", type=Path, default=DEFAULT_OUT, help=f"Output directory (default {DEFAULT_OUT})")
+    ap.add_argument("--partitioned", action="store_true", help="Write chat as chat/date=YYYY-MM-DD/part-NNNNN.jsonl")
+    ap.add_argument(
+        "--crashed-after",
+        type=float,
+        default=CRASHED_AFTER_S,
+        help=f"Treat an unclosed stream as ended once unwritten for this many seconds (default {CRASHED_AFTER_S})",
+    )
+    args = ap.parse_args()
+
+    cfg = load_config(args.config)
+    counts = compact(cfg.data_root, args.out, partitioned=args.partitioned, crashed_after_s=args.crashed_after)
+    print(
+        f"[compact] {counts['streams']} streams: {counts['chat']} chat lines, "
+        f"{counts['events']} events, {counts['gaps']} gaps -> {args.out}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
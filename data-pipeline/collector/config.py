@@ -1,6 +1,6 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional
 from pathlib import Path
 import yaml
 
@@ -9,6 +9,17 @@ import yaml
 class HelixCfg:
     poll_seconds: int = 60
     batch_size: int = 100
+    # concurrent batch requests over the pooled session
+    max_workers: int = 8
+    # adaptive scheduling: live channels every poll_seconds, offline ones between
+    # min_poll_seconds (near their usual go-live) and max_poll_seconds (dormant)
+    min_poll_seconds: int = 15
+    max_poll_seconds: int = 600
+    tick_seconds: float = 5
+    # rate-limit points never spent, left for retries and manual calls
+    ratelimit_reserve: int = 10
+    base_url: str = "https://api.twitch.tv/helix"
+    oauth_url: str = "https://id.twitch.tv/oauth2/token"
 
 
 @dataclass(frozen=True)
@@ -16,12 +27,65 @@ class IRCCfg:
     server: str = "irc.chat.twitch.tv"
     port: int = 6697
     use_tls: bool = True
-    join_delay_s: float = 1.2
+    # JOIN token bucket: join_rate JOINs per join_window_s (Twitch: 20 / 10s, verified bots 2000 / 10s)
+    join_rate: int = 20
+    join_window_s: float = 10.0
+    # "thread": one blocking socket (IRCClient); "asyncio": sharded connections (AsyncIRCPool)
+    engine: str = "thread"
+    channels_per_connection: int = 50
+
+
+@dataclass(frozen=True)
+class StorageCfg:
+    # chat group commit: flush a stream's batch at this many events or this age
+    batch_max_events: int = 500
+    batch_max_ms: int = 250
+    # "none" | "flush" | "fsync"
+    durability: str = "flush"
+    fsync_interval_ms: int = 1000
+    # chat file layout: "jsonl" (one chat.jsonl) or "segments" (rotated, compressed)
+    chat_layout: str = "jsonl"
+    # "gzip" | "zstd" (Python 3.14+) | "none"
+    segment_codec: str = "gzip"
+    segment_max_mb: int = 256
+    segment_max_minutes: int = 60
+    # chat line layout: "full" | "raw" | "compact" (see schema.py)
+    chat_schema: str = "full"
+    # per-stream 1s / 1m rollups (rollups.json), rewritten every rollup_checkpoint_s
+    rollups: bool = False
+    rollup_checkpoint_s: int = 300
+    # cap on open stream files (chat, snapshots, events); cold ones close and reopen on demand. 0 = no cap
+    max_open_files: int = 0
+
+
+@dataclass(frozen=True)
+class QueueCfg:
+    # bounded handoff between IRC reads and storage writes
+    max_events: int = 100_000
+    # "block" | "drop_oldest" | "spill"; unset: "block" for the thread engine, "drop_oldest" for
+    # asyncio ("block" would stall the event loop, so every connection, and is rejected there)
+    overflow: str = "block"
+    # journal directory for overflow="spill"; keep it off the data_root disk
+    spill_dir: Optional[Path] = None
+
+
+@dataclass(frozen=True)
+class TelemetryCfg:
+    # Prometheus text at http://host:port/metrics; keep host on localhost
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9464
 
 
 @dataclass(frozen=True)
 class StreamsCfg:
     channels: List[str]
+    # optional extra list, one channel per line ("#" comments); watched and hot-reloaded
+    channels_file: Optional[Path] = None
+    # how often to check config / channels_file for changes
+    reload_seconds: float = 10.0
+    # unix socket accepting "add|remove <channel...>", "reload", "list"
+    control_socket: Optional[Path] = None
 
 
 @dataclass(frozen=True)
@@ -30,6 +94,11 @@ class AppCfg:
     streams: StreamsCfg
     helix: HelixCfg
     irc: IRCCfg
+    storage: StorageCfg = StorageCfg()
+    queue: QueueCfg = QueueCfg()
+    telemetry: TelemetryCfg = TelemetryCfg()
+    # ingest processes; >1 runs a supervisor that shards channels over workers
+    workers: int = 1
 
 
 def load_config(path: str | Path) -> AppCfg:
@@ -37,26 +106,99 @@ def load_config(path: str | Path) -> AppCfg:
     obj: Dict[str, Any] = yaml.safe_load(p.read_text(encoding="utf-8"))
 
     data_root = Path(obj["data_root"])
-    streams = StreamsCfg(channels=[c.strip().lstrip("#").lower() for c in obj["streams"]["channels"]])
+    streams_obj = obj.get("streams", {}) or {}
+    streams = StreamsCfg(
+        channels=list(dict.fromkeys(c.strip().lstrip("#").lower() for c in streams_obj.get("channels") or [])),
+        channels_file=Path(streams_obj["channels_file"]) if streams_obj.get("channels_file") else None,
+        reload_seconds=float(streams_obj.get("reload_seconds", 10.0)),
+        control_socket=Path(streams_obj["control_socket"]) if streams_obj.get("control_socket") else None,
+    )
 
     helix_obj = obj.get("helix", {}) or {}
     irc_obj = obj.get("irc", {}) or {}
+    storage_obj = obj.get("storage", {}) or {}
+    queue_obj = obj.get("queue", {}) or {}
+    telemetry_obj = obj.get("telemetry", {}) or {}
 
     helix = HelixCfg(
         poll_seconds=int(helix_obj.get("poll_seconds", 60)),
         batch_size=int(helix_obj.get("batch_size", 100)),
+        max_workers=int(helix_obj.get("max_workers", 8)),
+        min_poll_seconds=int(helix_obj.get("min_poll_seconds", 15)),
+        max_poll_seconds=int(helix_obj.get("max_poll_seconds", 600)),
+        tick_seconds=float(helix_obj.get("tick_seconds", 5)),
+        ratelimit_reserve=int(helix_obj.get("ratelimit_reserve", 10)),
+        base_url=str(helix_obj.get("base_url", "https://api.twitch.tv/helix")),
+        oauth_url=str(helix_obj.get("oauth_url", "https://id.twitch.tv/oauth2/token")),
     )
 
     irc = IRCCfg(
         server=str(irc_obj.get("server", "irc.chat.twitch.tv")),
         port=int(irc_obj.get("port", 6697)),
         use_tls=bool(irc_obj.get("use_tls", True)),
-        join_delay_s=float(irc_obj.get("join_delay_s", 1.2)),
+        join_rate=int(irc_obj.get("join_rate", 20)),
+        join_window_s=float(irc_obj.get("join_window_s", 10.0)),
+        engine=str(irc_obj.get("engine", "thread")).strip().lower(),
+        channels_per_connection=int(irc_obj.get("channels_per_connection", 50)),
+    )
+
+    storage = StorageCfg(
+        batch_max_events=int(storage_obj.get("batch_max_events", 500)),
+        batch_max_ms=int(storage_obj.get("batch_max_ms", 250)),
+        durability=str(storage_obj.get("durability", "flush")).strip().lower(),
+        fsync_interval_ms=int(storage_obj.get("fsync_interval_ms", 1000)),
+        chat_layout=str(storage_obj.get("chat_layout", "jsonl")).strip().lower(),
+        segment_codec=str(storage_obj.get("segment_codec", "gzip")).strip().lower(),
+        segment_max_mb=int(storage_obj.get("segment_max_mb", 256)),
+        segment_max_minutes=int(storage_obj.get("segment_max_minutes", 60)),
+        chat_schema=str(storage_obj.get("chat_schema", "full")).strip().lower(),
+        rollups=bool(storage_obj.get("rollups", False)),
+        rollup_checkpoint_s=int(storage_obj.get("rollup_checkpoint_s", 300)),
+        max_open_files=int(storage_obj.get("max_open_files", 0)),
+    )
+
+    default_overflow = "drop_oldest" if irc.engine == "asyncio" else "block"
+    queue = QueueCfg(
+        max_events=int(queue_obj.get("max_events", 100_000)),
+        overflow=str(queue_obj.get("overflow") or default_overflow).strip().lower(),
+        spill_dir=Path(queue_obj["spill_dir"]) if queue_obj.get("spill_dir") else None,
+    )
+
+    telemetry = TelemetryCfg(
+        enabled=bool(telemetry_obj.get("enabled", False)),
+        host=str(telemetry_obj.get("host", "127.0.0.1")),
+        port=int(telemetry_obj.get("port", 9464)),
     )
 
+    workers = int(obj.get("workers", 1))
+    if workers < 1:
+        raise ValueError(f"workers must be >= 1, got {workers}")
+    if irc.engine not in ("thread", "asyncio"):
+        raise ValueError(f"irc.engine must be 'thread' or 'asyncio', got {irc.engine!r}")
+    if storage.durability not in ("none", "flush", "fsync"):
+        raise ValueError(f"storage.durability must be 'none', 'flush' or 'fsync', got {storage.durability!r}")
+    if storage.chat_layout not in ("jsonl", "segments"):
+        raise ValueError(f"storage.chat_layout must be 'jsonl' or 'segments', got {storage.chat_layout!r}")
+    if storage.segment_codec not in ("gzip", "zstd", "none"):
+        raise ValueError(f"storage.segment_codec must be 'gzip', 'zstd' or 'none', got {storage.segment_codec!r}")
+    if storage.chat_schema not in ("full", "raw", "compact"):
+        raise ValueError(f"storage.chat_schema must be 'full', 'raw' or 'compact', got {storage.chat_schema!r}")
+    if storage.max_open_files < 0:
+        raise ValueError(f"storage.max_open_files must be >= 0, got {storage.max_open_files}")
+    if queue.overflow not in ("block", "drop_oldest", "spill"):
+        raise ValueError(f"queue.overflow must be 'block', 'drop_oldest' or 'spill', got {queue.overflow!r}")
+    if queue.overflow == "block" and irc.engine == "asyncio":
+        raise ValueError("queue.overflow 'block' would stall the asyncio event loop; use 'drop_oldest' or 'spill'")
+    if queue.overflow == "spill" and queue.spill_dir is None:
+        raise ValueError("queue.overflow 'spill' requires queue.spill_dir")
+
     return AppCfg(
         data_root=data_root,
         streams=streams,
         helix=helix,
         irc=irc,
+        storage=storage,
+        queue=queue,
+        telemetry=telemetry,
+        workers=workers,
     )
\ No newline at end of file
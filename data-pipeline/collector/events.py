@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import Dict, Optional, Union
+
+from .irc import IRCRecord
+
+
+# USERNOTICE msg-id -> event type written to events.jsonl (other msg-ids are ignored)
+USERNOTICE_TYPES: Dict[str, str] = {
+    "sub": "sub",
+    "resub": "resub",
+    "subgift": "subgift",
+    "anonsubgift": "subgift",
+    "submysterygift": "submysterygift",
+    "anonsubmysterygift": "submysterygift",
+    "raid": "raid",
+}
+EVENT_TYPES = ("sub", "resub", "subgift", "submysterygift", "raid", "bits")
+
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _tier(plan: Optional[str]) -> Optional[str]:
+    # msg-param-sub-plan: "Prime", "1000", "2000", "3000"
+    if not plan:
+        return None
+    return "prime" if plan.lower() == "prime" else plan[:1]
+
+
+def extract_event(evt: Union[Dict, IRCRecord]) -> Optional[Dict]:
+    """
+    Returns the typed event for a USERNOTICE (sub, resub, subgift, submysterygift,
+    raid) or a PRIVMSG carrying a `bits` tag, else None.
+
+    Event lines: {"type", "timestamp_utc", "tmi_sent_ts", "recv_ms", "channel", "user", "id"}
+    plus per type
+      sub / resub       tier ("1" | "2" | "3" | "prime"), months, message
+      subgift           tier, recipient, months
+      submysterygift    tier, count
+      raid              viewers
+      bits              bits, message
+    """
+    if isinstance(evt, IRCRecord):
+        kind = evt.type
+        tag = evt.tag
+    else:
+        kind = evt.get("type")
+        tags = evt.get("tags") or {}
+        tag = tags.get
+
+    if kind == "PRIVMSG":
+        bits = _int(tag("bits"))
+        if not bits:
+            return None
+        out = _base("bits", evt, tag)
+        out["bits"] = bits
+        out["message"] = evt.get("message", "")
+        return out
+
+    if kind != "USERNOTICE":
+        return None
+    etype = USERNOTICE_TYPES.get(tag("msg-id") or "")
+    if etype is None:
+        return None
+
+    out = _base(etype, evt, tag)
+    if etype in ("sub", "resub"):
+        out["tier"] = _tier(tag("msg-param-sub-plan"))
+        out["months"] = _int(tag("msg-param-cumulative-months"))
+        out["message"] = evt.get("message", "")
+    elif etype == "subgift":
+        out["tier"] = _tier(tag("msg-param-sub-plan"))
+        out["recipient"] = tag("msg-param-recipient-user-name") or ""
+        out["months"] = _int(tag("msg-param-gift-months")) or 1
+    elif etype == "submysterygift":
+        out["tier"] = _tier(tag("msg-param-sub-plan"))
+        out["count"] = _int(tag("msg-param-mass-gift-count"))
+    elif etype == "raid":
+        out["viewers"] = _int(tag("msg-param-viewerCount"))
+    return out
+
+
+def _base(etype: str, evt: Union[Dict, IRCRecord], tag) -> Dict:
+    return {
+        "type": etype,
+        "timestamp_utc": evt.get("timestamp_utc"),
+        "tmi_sent_ts": _int(tag("tmi-sent-ts")),
+        "recv_ms": evt.get("recv_ms"),
+        "channel": evt.get("channel", ""),
+        "user": (tag("login") if evt.get("type") == "USERNOTICE" else None) or evt.get("user", ""),
+        "id": tag("id") or "",
+    }
@@ -0,0 +1,436 @@
+from __future__ import annotations
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .schema import decode_event
+from .segments import open_chat_file
+from .util import ms_to_iso
+
+
+# Local stand-ins for Twitch IRC and Helix, for load tests (see loadtest.py).
+
+_WORDS = (
+    "lol", "pog", "gg", "kekw", "omegalul", "what", "no", "way", "he", "is", "actually", "so", "bad",
+    "good", "chat", "clip", "it", "that", "LUL", "PogChamp", "Kappa", "monkaS", "5head", "true", "W", "L",
+)
+_COLORS = ("", "#FF0000", "#1E90FF", "#9ACD32", "#FF7F50", "#8A2BE2", "#DAA520")
+_BADGES = ("", "", "subscriber/12,premium/1", "subscriber/3", "moderator/1", "vip/1", "glhf-pledge/1")
+
+# id, room-id, tmi-sent-ts and the channel are filled in per message: %s, %s, %d, %s
+_PRIVMSG = (
+    "@badge-info={info};badges={badges};color={color};display-name={name};emotes=;first-msg=0;flags=;"
+    "id=%s;mod={mod};returning-chatter=0;room-id=%s;subscriber={sub};tmi-sent-ts=%d;turbo=0;"
+    "user-id={uid};user-type= :{login}!{login}@{login}.tmi.twitch.tv PRIVMSG #%s :{message}\r\n"
+)
+_BITS = (
+    "@badge-info=;badges=bits/1000;bits={bits};color=;display-name={name};emotes=;first-msg=0;flags=;"
+    "id=%s;mod=0;returning-chatter=0;room-id=%s;subscriber=0;tmi-sent-ts=%d;turbo=0;"
+    "user-id={uid};user-type= :{login}!{login}@{login}.tmi.twitch.tv PRIVMSG #%s :Cheer{bits} {message}\r\n"
+)
+_SUB = (
+    "@badge-info=subscriber/{months};badges=subscriber/0;color=;display-name={name};emotes=;flags=;"
+    "id=%s;login={login};mod=0;msg-id=resub;msg-param-cumulative-months={months};"
+    "msg-param-sub-plan=1000;room-id=%s;subscriber=1;system-msg=;tmi-sent-ts=%d;user-id={uid};user-type= "
+    ":tmi.twitch.tv USERNOTICE #%s :{message}\r\n"
+)
+
+
+def _template(fmt: str, **fields) -> bytes:
+    # tags and trailing text must not carry separators that would split the line
+    # (fields are %-escaped: the result is itself a %-format for the per-message values)
+    clean = {k: str(v).replace("\r", " ").replace("\n", " ").replace("%", "%%") for k, v in fields.items()}
+    for k in ("name", "login", "info", "badges", "color"):
+        if k in clean:
+            clean[k] = clean[k].replace(";", "").replace(" ", "")
+    return fmt.format(**clean).encode("utf-8")
+
+
+def synthetic_templates(count: int = 2000, seed: int = 1) -> List[bytes]:
+    """
+    Chat line templates with the tag set Twitch sends today: mostly PRIVMSGs of
+    varied length, ~0.5% cheers and ~0.2% resub USERNOTICEs.
+    """
+    rng = random.Random(seed)
+    out: List[bytes] = []
+    for i in range(count):
+        login = f"viewer{rng.randrange(1_000_000)}"
+        words = rng.choices(_WORDS, k=max(1, int(rng.expovariate(1 / 7))))
+        common = {"name": login, "login": login, "uid": rng.randrange(10**8, 10**9), "message": " ".join(words)}
+        roll = rng.random()
+        if roll < 0.005:
+            out.append(_template(_BITS, bits=rng.choice((1, 100, 500, 1000)), **common))
+        elif roll < 0.007:
+            out.append(_template(_SUB, months=rng.randrange(1, 60), **common))
+        else:
+            badges = rng.choice(_BADGES)
+            out.append(
+                _template(
+                    _PRIVMSG,
+                    info="subscriber/12" if badges.startswith("subscriber") else "",
+                    badges=badges,
+                    color=rng.choice(_COLORS),
+                    mod=int(badges.startswith("moderator")),
+                    sub=int(badges.startswith("subscriber")),
+                    **common,
+                )
+            )
+    return out
+
+
+def replay_templates(paths: Iterable[Path], limit: int = 100_000) -> List[bytes]:
+    """
+    Chat line templates from recorded chat files (chat.jsonl or segments, any schema).
+    Users, messages and tags are kept; channel, room, id and tmi-sent-ts are re-stamped.
+    """
+    out: List[bytes] = []
+    for path in paths:
+        with open_chat_file(Path(path)) as fh:
+            for line in fh:
+                try:
+                    evt = decode_event(json.loads(line), with_raw=False)
+                except ValueError:
+                    continue
+                if evt.get("type") != "PRIVMSG":
+                    continue
+                tags = {k: v for k, v in (evt.get("tags") or {}).items() if k not in ("id", "room-id", "tmi-sent-ts")}
+                tag_str = "".join(f"{k}={v};" for k, v in tags.items()).replace(" ", "\\s")
+                tag_str = tag_str.replace("%", "%%").replace("{", "{{").replace("}", "}}")
+                login = evt.get("user") or "viewer"
+                fmt = (
+                    "@" + tag_str + "id=%s;room-id=%s;tmi-sent-ts=%d "
+                    ":{login}!{login}@{login}.tmi.twitch.tv PRIVMSG #%s :{message}\r\n"
+                )
+                out.append(_template(fmt, login=login, message=evt.get("message", "")))
+                if len(out) >= limit:
+                    return out
+    return out
+
+
+class _IRCConn(asyncio.Protocol):
+    def __init__(self, server: "FakeIRCServer"):
+        self.server = server
+        self.transport: Optional[asyncio.Transport] = None
+        self.channels: Set[str] = set()
+        self.nick = "justinfan"
+        self._buf = b""
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+        self.server._conns.add(self)
+
+    def connection_lost(self, exc) -> None:
+        self.server._conns.discard(self)
+        for ch in self.channels:
+            self.server._part(self, ch)
+        self.channels.clear()
+
+    def data_received(self, data: bytes) -> None:
+        self._buf += data
+        *lines, self._buf = self._buf.split(b"\n")
+        for raw in lines:
+            self._command(raw.decode("utf-8", errors="replace").strip())
+
+    def _command(self, line: str) -> None:
+        cmd, _, arg = line.partition(" ")
+        cmd = cmd.upper()
+        out = []
+        if cmd == "NICK":
+            self.nick = arg.strip()
+            out.append(f":tmi.twitch.tv 001 {self.nick} :Welcome, GLHF!")
+        elif cmd == "CAP":
+            out.append(f":tmi.twitch.tv CAP * ACK :{arg.partition(':')[2]}")
+        elif cmd == "JOIN":
+            for ch in arg.replace("#", "").split(","):
+                ch = ch.strip().lower()
+                if ch and ch not in self.channels:
+                    self.channels.add(ch)
+                    self.server._join(self, ch)
+                    out.append(f":{self.nick}!{self.nick}@{self.nick}.tmi.twitch.tv JOIN #{ch}")
+        elif cmd == "PART":
+            for ch in arg.replace("#", "").split(","):
+                ch = ch.strip().lower()
+                if ch in self.channels:
+                    self.channels.discard(ch)
+                    self.server._part(self, ch)
+                    out.append(f":{self.nick}!{self.nick}@{self.nick}.tmi.twitch.tv PART #{ch}")
+        elif cmd == "PONG":
+            self.server.pongs += 1
+        if out and self.transport is not None:
+            self.transport.write("".join(f"{x}\r\n" for x in out).encode("utf-8"))
+
+
+class FakeIRCServer:
+    """
+    Plain-TCP Twitch IRC stand-in on its own asyncio thread. Accepts any PASS/NICK,
+    acknowledges CAP/JOIN/PART, PINGs every `ping_s`, and sends `rate` chat lines
+    per second spread over the joined channels (Zipf-weighted, so a few channels are
+    busy and most are quiet), stamped with the send time as tmi-sent-ts.
+
+    A connection whose unsent backlog passes `max_backlog_bytes` is treated the way
+    Twitch treats a slow reader: lines for it are shed and counted, not queued.
+    """
+
+    def __init__(
+        self,
+        templates: List[bytes],
+        rate: float = 1000.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ping_s: float = 60.0,
+        tick_s: float = 0.005,
+        max_backlog_bytes: int = 64 * 1024 * 1024,
+        seed: int = 1,
+    ):
+        if not templates:
+            raise ValueError("FakeIRCServer needs at least one line template")
+        self.templates = templates
+        self.rate = float(rate)
+        self.host = host
+        self.port = port
+        self.ping_s = float(ping_s)
+        self.tick_s = float(tick_s)
+        self.max_backlog_bytes = int(max_backlog_bytes)
+
+        self.sent = 0
+        self.sent_chat = 0  # PRIVMSGs among `sent`; the rest are USERNOTICEs
+        self.shed = 0
+        self.pongs = 0
+        self.sending = False
+
+        self._is_chat = [b" PRIVMSG #" in t for t in templates]
+        self._rng = random.Random(seed)
+        self._conns: Set[_IRCConn] = set()
+        self._members: Dict[str, Set[_IRCConn]] = {}
+        self._rank: Dict[str, int] = {}
+        self._weights: Tuple[List[str], List[float]] = ([], [])
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    @property
+    def joined(self) -> int:
+        return sum(1 for conns in self._members.values() if conns)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="fake-irc", daemon=True)
+        self._thread.start()
+        self._started.wait(10)
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def _run(self) -> None:
+        loop = self._loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(loop.create_server(lambda: _IRCConn(self), self.host, self.port))
+        self.port = server.sockets[0].getsockname()[1]
+        tasks = [loop.create_task(self._generate()), loop.create_task(self._ping())]
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            for conn in list(self._conns):
+                if conn.transport is not None:
+                    conn.transport.abort()
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    def _join(self, conn: _IRCConn, ch: str) -> None:
+        self._members.setdefault(ch, set()).add(conn)
+        self._rank.setdefault(ch, len(self._rank))
+        self._weights = ([], [])
+
+    def _part(self, conn: _IRCConn, ch: str) -> None:
+        members = self._members.get(ch)
+        if members is not None:
+            members.discard(conn)
+            if not members:
+                del self._members[ch]
+        self._weights = ([], [])
+
+    def _cum_weights(self) -> Tuple[List[str], List[float]]:
+        if not self._weights[0] and self._members:
+            channels = sorted(self._members, key=self._rank.__getitem__)
+            cum, total = [], 0.0
+            for i, _ in enumerate(channels):
+                total += 1.0 / (i + 1)
+                cum.append(total)
+            self._weights = (channels, cum)
+        return self._weights
+
+    async def _ping(self) -> None:
+        while True:
+            await asyncio.sleep(self.ping_s)
+            for conn in list(self._conns):
+                if conn.transport is not None:
+                    conn.transport.write(b"PING :tmi.twitch.tv\r\n")
+
+    async def _generate(self) -> None:
+        rng = self._rng
+        templates = self.templates
+        is_chat = self._is_chat
+        n_templates = len(templates)
+        due = 0.0
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.tick_s)
+            now = time.monotonic()
+            if not self.sending:
+                last, due = now, 0.0
+                continue
+            due += (now - last) * self.rate
+            last = now
+            n = int(due)
+            channels, cum = self._cum_weights()
+            if n <= 0 or not channels:
+                continue
+            due -= n
+            ts = time.time_ns() // 1_000_000
+            out: Dict[_IRCConn, Tuple[List[bytes], List[int]]] = {}
+            for ch in rng.choices(channels, cum_weights=cum, k=n):
+                i = rng.randrange(n_templates)
+                line = templates[i] % (b"%x" % next(self._ids), b"%d" % (self._rank[ch] + 1), ts, ch.encode())
+                for conn in self._members.get(ch, ()):
+                    lines, chat = out.setdefault(conn, ([], [0]))
+                    lines.append(line)
+                    chat[0] += is_chat[i]
+            for conn, (lines, chat) in out.items():
+                transport = conn.transport
+                if transport is None or transport.is_closing():
+                    continue
+                if transport.get_write_buffer_size() > self.max_backlog_bytes:
+                    self.shed += len(lines)
+                    continue
+                transport.write(b"".join(lines))
+                self.sent += len(lines)
+                self.sent_chat += chat[0]
+
+
+class FakeHelixServer:
+    """
+    Helix stand-in on a local HTTP port: /oauth2/token, /helix/streams and
+    /helix/users for `channels`, with Ratelimit-* headers. Channels start live;
+    `set_live` (or `toggle`) flips them, and each new live session gets a fresh
+    started_at so the collector opens a new stream directory.
+    """
+
+    def __init__(self, channels: Iterable[str], host: str = "127.0.0.1", port: int = 0):
+        self.channels = list(channels)
+        self.ids = {ch: str(1000 + i) for i, ch in enumerate(self.channels)}
+        self.started: Dict[str, Optional[str]] = {}
+        now = time.time_ns() // 1_000_000
+        for ch in self.channels:
+            self.started[ch] = ms_to_iso(now - now % 1000)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self._server.server_address[0]}:{self.port}/helix"
+
+    @property
+    def oauth_url(self) -> str:
+        return f"http://{self._server.server_address[0]}:{self.port}/oauth2/token"
+
+    def live(self) -> List[str]:
+        with self._lock:
+            return [ch for ch, st in self.started.items() if st is not None]
+
+    def set_live(self, ch: str, live: bool) -> None:
+        with self._lock:
+            if live and self.started.get(ch) is None:
+                now = time.time_ns() // 1_000_000
+                self.started[ch] = ms_to_iso(now - now % 1000)
+            elif not live:
+                self.started[ch] = None
+
+    def toggle(self, fraction: float, rng: random.Random) -> Tuple[int, int]:
+        """
+        Flips a random `fraction` of the channels between live and offline.
+        """
+        flipped = rng.sample(self.channels, max(1, int(len(self.channels) * fraction)))
+        on = off = 0
+        for ch in flipped:
+            live = self.started.get(ch) is None
+            self.set_live(ch, live)
+            on, off = on + live, off + (not live)
+        return on, off
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-helix", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _streams(self, logins: List[str]) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "user_login": ch,
+                    "user_id": self.ids[ch],
+                    "started_at": self.started[ch],
+                    "title": f"load test {ch}",
+                    "game_name": "Just Chatting",
+                    "viewer_count": 1000,
+                }
+                for ch in logins
+                if self.started.get(ch) is not None
+            ]
+
+    def _handler(self):
+        helix = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, obj: Dict) -> None:
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Ratelimit-Limit", "800")
+                self.send_header("Ratelimit-Remaining", "799")
+                self.send_header("Ratelimit-Reset", str(int(time.time()) + 60))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self) -> None:
+                self._reply({"access_token": "fake", "expires_in": 86400, "token_type": "bearer"})
+
+            def do_GET(self) -> None:
+                url = urlsplit(self.path)
+                query = parse_qs(url.query)
+                helix.requests += 1
+                if url.path.endswith("/streams"):
+                    self._reply({"data": helix._streams([l.lower() for l in query.get("user_login", [])])})
+                elif url.path.endswith("/users"):
+                    logins = [l.lower() for l in query.get("login", []) if l.lower() in helix.ids]
+                    self._reply({"data": [{"login": l, "id": helix.ids[l]} for l in logins]})
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
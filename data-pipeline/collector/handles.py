@@ -0,0 +1,148 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .telemetry import REGISTRY
+
+
+FILE_OPENS = REGISTRY.counter("collector_file_opens_total", "Append-mode opens of pooled stream files.")
+FILE_EVICTIONS = REGISTRY.counter("collector_file_evictions_total", "Pooled stream files closed to stay under the cap.")
+
+
+class HandlePool:
+    """
+    Caps the number of OS file descriptors held by pooled stream files.
+
+    Files open on demand and stay open while used; once `max_open` are open, the
+    least recently used idle one is closed. Its PooledFile keeps its own write
+    buffer and reopens in append mode on the next flush. `max_open` 0 means no cap.
+    """
+
+    def __init__(self, max_open: int = 512):
+        self.max_open = max(0, int(max_open))
+        self._lru: "OrderedDict[PooledFile, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def open_count(self) -> int:
+        return len(self._lru)
+
+    def _acquire(self, f: "PooledFile"):
+        # caller holds f._lock
+        with self._lock:
+            if f._fh is not None:
+                self._lru.move_to_end(f)
+                return f._fh
+            if self.max_open:
+                for victim in list(self._lru):
+                    if len(self._lru) < self.max_open:
+                        break
+                    # a file busy in another thread is skipped, not waited for
+                    if not victim._lock.acquire(blocking=False):
+                        continue
+                    try:
+                        victim._close_fd()
+                        del self._lru[victim]
+                        FILE_EVICTIONS.inc()
+                    finally:
+                        victim._lock.release()
+            f._fh = f.path.open("ab", buffering=0)
+            FILE_OPENS.inc()
+            self._lru[f] = None
+            return f._fh
+
+    def _release(self, f: "PooledFile") -> None:
+        # caller holds f._lock
+        with self._lock:
+            self._lru.pop(f, None)
+        f._close_fd()
+
+
+class PooledFile:
+    """
+    Append-only binary file whose descriptor comes from a HandlePool.
+
+    Writes collect in a per-file buffer and reach the OS when it passes
+    `buffer_size`, on `flush()`, `fileno()` and `close()`. Quacks enough like a file
+    (write/flush/fileno/tell/name) to sit under GzipFile / ZstdFile.
+    """
+
+    def __init__(self, path: Path, pool: HandlePool, buffer_size: int = 1 << 16):
+        self.path = Path(path)
+        self.name = str(path)
+        self.mode = "ab"
+        self.pool = pool
+        self.buffer_size = max(0, int(buffer_size))
+        self.closed = False
+
+        self._fh = None
+        self._buf = bytearray()
+        self._lock = threading.Lock()
+        try:
+            self._size = self.path.stat().st_size
+        except OSError:
+            self._size = 0
+
+    def write(self, data) -> int:
+        with self._lock:
+            if self.closed:
+                raise ValueError(f"write to closed file {self.name}")
+            self._buf += data
+            if len(self._buf) >= self.buffer_size:
+                self._drain()
+        return len(data)
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self.closed:
+                self._drain()
+
+    def fileno(self) -> int:
+        with self._lock:
+            self._drain()
+            return self.pool._acquire(self).fileno()
+
+    def tell(self) -> int:
+        return self._size + len(self._buf)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                self._drain()
+            finally:
+                self.closed = True
+                self.pool._release(self)
+
+    def _drain(self) -> None:
+        # caller holds self._lock
+        if not self._buf:
+            return
+        fh = self.pool._acquire(self)
+        view = memoryview(self._buf)
+        written = 0
+        while written < len(view):
+            written += fh.write(view[written:])
+        view.release()
+        self._size += written
+        self._buf.clear()
+
+    def _close_fd(self) -> None:
+        fh, self._fh = self._fh, None
+        if fh is not None:
+            try:
+                fh.close()
+            except OSError:
+                pass
+
+    # GzipFile / ZstdFile probe these on their fileobj
+    def writable(self) -> bool:
+        return True
+
+    def readable(self) -> bool:
+        return False
+
+    def seekable(self) -> bool:
+        return False
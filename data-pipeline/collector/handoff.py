@@ -0,0 +1,313 @@
+from __future__ import annotations
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .irc import IRCRecord, parse_irc_bytes
+
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+
+class HandoffQueue:
+    """
+    Bounded single-producer / single-consumer handoff between IRC reads and storage.
+
+    The fast path is a deque append plus an Event check, so the reader never takes a
+    lock unless it has to wake the consumer. When `maxsize` records are waiting the
+    overflow policy decides what happens to the next put:
+      block       - the reader waits for the consumer (may delay PONGs; thread engine
+                    only, on the asyncio loop it would stall every connection)
+      drop_oldest - the oldest queued record is discarded and counted in `dropped`
+      spill       - records go to an on-disk journal in `spill_dir` until the consumer
+                    has caught up, then are replayed in order
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 100_000,
+        overflow: str = "block",
+        spill_dir: Optional[Path] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        if overflow == "spill" and spill_dir is None:
+            raise ValueError("overflow='spill' needs a spill_dir")
+        self.maxsize = max(1, int(maxsize))
+        self.overflow = overflow
+        self.spill_dir = Path(spill_dir) if spill_dir is not None else None
+
+        self._items: Deque[IRCRecord] = deque()
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+        self._not_full.set()
+
+        # spill journal; producer appends to _journal, consumer replays from _replay
+        self._spill_lock = threading.Lock()
+        self._spilling = False
+        self._journal = None
+        self._journal_path: Optional[Path] = None
+        self._journal_count = 0
+        self._replay = None
+        self._replay_path: Optional[Path] = None
+        self._replay_count = 0
+        self._spill_seq = 0
+
+        self.enqueued = 0
+        self.dequeued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.high_watermark = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._items) + self._journal_count + self._replay_count
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "memory_depth": len(self._items),
+            "spill_depth": self._journal_count + self._replay_count,
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+        }
+
+    def put(self, item: IRCRecord) -> None:
+        self.enqueued += 1
+        items = self._items
+
+        if self._spilling:
+            self._spill(item)
+            return
+
+        if len(items) >= self.maxsize:
+            if self.overflow == "drop_oldest":
+                try:
+                    items.popleft()
+                    self.dropped += 1
+                except IndexError:
+                    pass
+            elif self.overflow == "spill":
+                self._spill(item)
+                return
+            else:
+                while len(items) >= self.maxsize:
+                    self._not_full.clear()
+                    if len(items) >= self.maxsize:
+                        self._not_full.wait(0.1)
+
+        items.append(item)
+        n = len(items)
+        if n > self.high_watermark:
+            self.high_watermark = n
+        if not self._not_empty.is_set():
+            self._not_empty.set()
+
+    def get_batch(self, max_items: int = 1000, timeout: float = 0.1) -> List[IRCRecord]:
+        """
+        Returns up to `max_items` records in arrival order, waiting up to `timeout`
+        seconds for the first one. Spilled records are replayed before anything queued
+        after them.
+        """
+        if self._replay is not None or (not self._items and self._journal_count):
+            batch = self._read_replay(max_items)
+            if batch:
+                self.dequeued += len(batch)
+                return batch
+
+        items = self._items
+        if not items:
+            self._not_empty.clear()
+            if not items:
+                self._not_empty.wait(timeout)
+
+        batch: List[IRCRecord] = []
+        popleft = items.popleft
+        try:
+            while len(batch) < max_items:
+                batch.append(popleft())
+        except IndexError:
+            pass
+
+        if batch:
+            self.dequeued += len(batch)
+            if len(items) < self.maxsize and not self._not_full.is_set():
+                self._not_full.set()
+        return batch
+
+    def close(self) -> None:
+        with self._spill_lock:
+            for fh in (self._journal, self._replay):
+                if fh is not None:
+                    fh.close()
+            self._journal = None
+            self._replay = None
+
+    def _spill(self, item: IRCRecord) -> None:
+        with self._spill_lock:
+            if self._journal is None:
+                assert self.spill_dir is not None
+                self.spill_dir.mkdir(parents=True, exist_ok=True)
+                self._spill_seq += 1
+                self._journal_path = self.spill_dir / f"journal-{os.getpid()}-{self._spill_seq}.log"
+                self._journal = self._journal_path.open("wb")
+            self._spilling = True
+            # "<recv_ms> <raw line>\n"; raw IRC lines never contain \n
+            self._journal.write(b"%d " % item.recv_ms + item.raw_bytes + b"\n")
+            self._journal_count += 1
+            self.spilled += 1
+
+    def _read_replay(self, max_items: int) -> List[IRCRecord]:
+        if self._replay is None:
+            with self._spill_lock:
+                if self._journal is None:
+                    return []
+                # hand the journal to the consumer; new overflow starts a fresh one
+                self._journal.close()
+                self._replay_path = self._journal_path
+                self._replay_count = self._journal_count
+                self._journal = None
+                self._journal_path = None
+                self._journal_count = 0
+                self._spilling = False
+            assert self._replay_path is not None
+            self._replay = self._replay_path.open("rb")
+
+        batch: List[IRCRecord] = []
+        for line in self._replay:
+            ts, _, raw = line.partition(b" ")
+            rec = parse_irc_bytes(raw, recv_ms=int(ts))
+            self._replay_count -= 1
+            if rec is not None:
+                batch.append(rec)
+            if len(batch) >= max_items:
+                return batch
+
+        self._replay.close()
+        self._replay = None
+        self._replay_count = 0
+        if self._replay_path is not None:
+            self._replay_path.unlink(missing_ok=True)
+            self._replay_path = None
+        return batch
+
+
+class HandoffWorker:
+    """
+    Consumer thread: drains a HandoffQueue in batches into `handle_batch` and calls
+    `on_tick` (e.g. Storage.flush_due) at most every `tick_s` seconds. `call` and
+    `submit` run other work on the same thread, ordered with the records.
+    """
+
+    def __init__(
+        self,
+        queue: HandoffQueue,
+        handle_batch: Callable[[List[IRCRecord]], None],
+        on_tick: Optional[Callable[[], None]] = None,
+        tick_s: float = 0.1,
+        batch_size: int = 1000,
+    ):
+        self.queue = queue
+        self.handle_batch = handle_batch
+        self.on_tick = on_tick
+        self.tick_s = tick_s
+        self.batch_size = batch_size
+
+        self.processed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # (records enqueued when submitted, fn, done), run in submission order
+        self._calls: Deque[Tuple[int, Callable[[], None], threading.Event]] = deque()
+        self._calls_lock = threading.Lock()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain: bool = True, timeout: float = 10) -> None:
+        if drain:
+            self.sync(timeout=timeout)
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self._run_calls(force=True)
+
+    def sync(self, timeout: float = 10) -> bool:
+        """
+        Waits until everything put on the queue before this call has been handled
+        (or dropped). Returns False on timeout.
+        """
+        target = self.queue.enqueued
+        deadline = time.monotonic() + timeout
+        while self.processed + self.queue.dropped < target:
+            if time.monotonic() >= deadline or not (self._thread and self._thread.is_alive()):
+                return False
+            time.sleep(0.01)
+        return True
+
+    def call(self, fn: Callable[[], None], timeout: float = 10) -> bool:
+        """
+        Runs `fn` on the worker thread once every record put on the queue before
+        this call has been handled (or dropped), e.g. to close a stream behind its
+        last queued chat. Waits up to `timeout` for it to finish and returns False
+        if it has not; it still runs later. Runs here if the worker is not running.
+        """
+        return self.submit(fn).wait(timeout)
+
+    def submit(self, fn: Callable[[], None]) -> threading.Event:
+        """
+        `call` without the wait, for threads that must not block (IRC readers).
+        Returns an Event set once `fn` has run.
+        """
+        done = threading.Event()
+        with self._calls_lock:
+            self._calls.append((self.queue.enqueued, fn, done))
+        if not (self._thread and self._thread.is_alive()):
+            self._run_calls(force=True)
+        return done
+
+    def _run_calls(self, force: bool = False) -> None:
+        while True:
+            with self._calls_lock:
+                if not self._calls:
+                    return
+                target, fn, done = self._calls[0]
+                if not force and self.processed + self.queue.dropped < target:
+                    return
+                self._calls.popleft()
+            try:
+                fn()
+            except Exception as e:
+                print(f"[writer] call failed: {e}", file=sys.stderr)
+            finally:
+                done.set()
+
+    def _run(self) -> None:
+        next_tick = time.monotonic() + self.tick_s
+        while not self._stop.is_set():
+            batch = self.queue.get_batch(self.batch_size, timeout=self.tick_s)
+            if batch:
+                try:
+                    self.handle_batch(batch)
+                except Exception:
+                    # swallow to keep logging alive
+                    pass
+                self.processed += len(batch)
+            now = time.monotonic()
+            if self.on_tick and now >= next_tick:
+                next_tick = now + self.tick_s
+                try:
+                    self.on_tick()
+                except Exception:
+                    pass
+            if self._calls:
+                self._run_calls()
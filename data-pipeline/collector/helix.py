@@ -1,9 +1,14 @@
 from __future__ import annotations
+import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
 
 
 TWITCH_OAUTH_URL = "https://id.twitch.tv/oauth2/token"
@@ -20,31 +25,101 @@ class StreamInfo:
     viewer_count: int
 
 
+@dataclass
+class RateLimit:
+    # from the Ratelimit-* headers of the most recent Helix response
+    limit: int = 800
+    remaining: int = 800
+    reset: float = 0.0  # epoch seconds when the bucket refills
+    updated_at: float = 0.0
+
+
 class HelixClient:
-    def __init__(self, client_id: str, client_secret: str):
+    """
+    Helix API client. Requests share one pooled keep-alive session, batches are
+    fetched concurrently on up to `max_workers` threads, and the login -> id cache
+    is persisted to `user_id_cache_path` when given.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        max_workers: int = 8,
+        user_id_cache_path: Optional[Path] = None,
+        base_url: str = HELIX_BASE,
+        oauth_url: str = TWITCH_OAUTH_URL,
+    ):
         self.client_id = client_id
         self.client_secret = client_secret
+        self.base_url = base_url.rstrip("/")
+        self.oauth_url = oauth_url
+        self.rate_limit = RateLimit()
+        self._rate_lock = threading.Lock()
         self._access_token: Optional[str] = None
         self._expires_at: float = 0.0  # epoch seconds
+        self._token_lock = threading.Lock()
+
+        self.max_workers = max(1, int(max_workers))
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_workers)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor: Optional[ThreadPoolExecutor] = None
 
         # cache login->id
         self._user_id_cache: Dict[str, str] = {}
+        self._user_id_cache_path = user_id_cache_path
+        self._load_user_id_cache()
 
     @classmethod
-    def from_env(cls) -> "HelixClient":
+    def from_env(
+        cls,
+        max_workers: int = 8,
+        user_id_cache_path: Optional[Path] = None,
+        base_url: str = HELIX_BASE,
+        oauth_url: str = TWITCH_OAUTH_URL,
+    ) -> "HelixClient":
         cid = os.getenv("TWITCH_CLIENT_ID", "").strip()
         sec = os.getenv("TWITCH_CLIENT_SECRET", "").strip()
         if not cid or not sec:
             raise RuntimeError("Missing TWITCH_CLIENT_ID / TWITCH_CLIENT_SECRET in environment (.env).")
-        return cls(cid, sec)
+        return cls(
+            cid,
+            sec,
+            max_workers=max_workers,
+            user_id_cache_path=user_id_cache_path,
+            base_url=base_url,
+            oauth_url=oauth_url,
+        )
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._session.close()
+
+    def _map(self, fn, items: List) -> List:
+        # run per-batch requests concurrently, results in input order
+        if len(items) <= 1:
+            return [fn(x) for x in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="helix")
+        return list(self._executor.map(fn, items))
 
     def _ensure_token(self) -> None:
         now = time.time()
         if self._access_token and now < self._expires_at - 60:
             return
+        with self._token_lock:
+            if self._access_token and time.time() < self._expires_at - 60:
+                return
+            self._fetch_token()
 
-        resp = requests.post(
-            TWITCH_OAUTH_URL,
+    def _fetch_token(self) -> None:
+        now = time.time()
+        resp = self._session.post(
+            self.oauth_url,
             params={
                 "client_id": self.client_id,
                 "client_secret": self.client_secret,
@@ -66,25 +141,50 @@ class HelixClient:
             "Authorization": f"Bearer {self._access_token}",
         }
 
-    def get_user_ids(self, logins: List[str]) -> Dict[str, str]:
+    def _get(self, url: str, params: List, headers: Dict[str, str]) -> Dict:
+        resp = self._session.get(url, headers=headers, params=params, timeout=20)
+        self._note_rate_limit(resp)
+        if resp.status_code == 429:
+            # bucket empty: wait for the refill once, then let a second 429 raise
+            time.sleep(min(60.0, max(1.0, self.rate_limit.reset - time.time())))
+            resp = self._session.get(url, headers=headers, params=params, timeout=20)
+            self._note_rate_limit(resp)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _note_rate_limit(self, resp: requests.Response) -> None:
+        h = resp.headers
+        if "Ratelimit-Remaining" not in h:
+            return
+        try:
+            limit = int(h.get("Ratelimit-Limit", self.rate_limit.limit))
+            remaining = int(h["Ratelimit-Remaining"])
+            reset = float(h.get("Ratelimit-Reset", 0))
+        except ValueError:
+            return
+        with self._rate_lock:
+            self.rate_limit = RateLimit(limit, remaining, reset, time.time())
+
+    def get_user_ids(self, logins: List[str], batch_size: int = 100) -> Dict[str, str]:
         logins = [l.strip().lower() for l in logins if l.strip()]
         out: Dict[str, str] = {}
 
-        missing = [l for l in logins if l not in self._user_id_cache]
+        missing = sorted({l for l in logins if l not in self._user_id_cache})
         if missing:
-            # Helix users endpoint supports multiple login params
-            url = f"{HELIX_BASE}/users"
-            params = []
-            for l in missing:
-                params.append(("login", l))
-
-            resp = requests.get(url, headers=self._headers(), params=params, timeout=20)
-            resp.raise_for_status()
-            data = resp.json().get("data", [])
-            for row in data:
-                login = row["login"].lower()
-                uid = row["id"]
-                self._user_id_cache[login] = uid
+            # Helix users endpoint supports up to 100 login params per request
+            url = f"{self.base_url}/users"
+            headers = self._headers()
+
+            def fetch(chunk: List[str]) -> List[Dict]:
+                return self._get(url, [("login", l) for l in chunk], headers).get("data", [])
+
+            chunks = [missing[i : i + batch_size] for i in range(0, len(missing), batch_size)]
+            for data in self._map(fetch, chunks):
+                for row in data:
+                    login = row["login"].lower()
+                    uid = row["id"]
+                    self._user_id_cache[login] = uid
+            self._save_user_id_cache()
 
         for l in logins:
             uid = self._user_id_cache.get(l)
@@ -100,18 +200,20 @@ class HelixClient:
         live: Dict[str, StreamInfo] = {}
         logins = [l.strip().lower() for l in logins if l.strip()]
 
-        url = f"{HELIX_BASE}/streams"
-        for i in range(0, len(logins), batch_size):
-            chunk = logins[i : i + batch_size]
-            params = []
-            for l in chunk:
-                params.append(("user_login", l))
+        url = f"{self.base_url}/streams"
+        headers = self._headers()
+
+        def fetch(chunk: List[str]) -> List[Dict]:
+            return self._get(url, [("user_login", l) for l in chunk], headers).get("data", [])
 
-            resp = requests.get(url, headers=self._headers(), params=params, timeout=20)
-            resp.raise_for_status()
-            rows = resp.json().get("data", [])
+        chunks = [logins[i : i + batch_size] for i in range(0, len(logins), batch_size)]
+        new_ids = False
+        for rows in self._map(fetch, chunks):
             for r in rows:
                 login = r["user_login"].lower()
+                if login not in self._user_id_cache:
+                    self._user_id_cache[login] = str(r["user_id"])
+                    new_ids = True
                 live[login] = StreamInfo(
                     user_login=login,
                     user_id=str(r["user_id"]),
@@ -120,4 +222,25 @@ class HelixClient:
                     game_name=str(r.get("game_name", "")),
                     viewer_count=int(r.get("viewer_count", 0)),
                 )
-        return live
\ No newline at end of file
+        if new_ids:
+            self._save_user_id_cache()
+        return live
+
+    def _load_user_id_cache(self) -> None:
+        path = self._user_id_cache_path
+        if not path or not path.exists():
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self._user_id_cache.update({str(k).lower(): str(v) for k, v in data.items()})
+
+    def _save_user_id_cache(self) -> None:
+        path = self._user_id_cache_path
+        if not path:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self._user_id_cache, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        tmp.replace(path)
@@ -0,0 +1,305 @@
+from __future__ import annotations
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .aio_irc import AsyncIRCPool
+from .config import AppCfg
+from .events import extract_event
+from .handoff import HandoffQueue, HandoffWorker
+from .irc import IRCClient, IRCRecord
+from .joins import JoinScheduler, TokenBucket
+from .storage import ActiveStream, Storage
+from .telemetry import REGISTRY
+from .util import epoch_to_iso, iso_to_epoch, utc_now_iso
+
+
+class Ingest:
+    """
+    Everything below the Helix poll loop: one IRC engine, the handoff queue, the
+    storage writer thread and the open streams. The poll loop (or a supervisor
+    worker) drives it with `open_streams` / `snapshot` / `close_streams`, passing
+    stream info dicts {"channel", "user_id", "started_at", "title", "game_name",
+    "viewer_count"}.
+
+    `join_rate` overrides cfg.irc.join_rate, e.g. a worker's share of the account's
+    join limit when several processes share one Twitch login.
+    """
+
+    # how long the poll loop waits for a close queued on the writer thread
+    call_timeout_s = 10.0
+
+    def __init__(self, cfg: AppCfg, join_rate: Optional[int] = None):
+        self.cfg = cfg
+        self.storage = Storage(cfg.data_root, cfg.storage)
+        self.storage.ensure_root()
+
+        self.active_streams: Dict[str, ActiveStream] = {}
+        # channel back live while its close is still queued -> (latest stream info,
+        # set once that close has run); opened as soon as it is set
+        self.reopening: Dict[str, Tuple[Dict, threading.Event]] = {}
+        # channel -> epoch the IRC connection carrying it dropped; cleared on rejoin
+        self.gap_started: Dict[str, float] = {}
+
+        # IRC reads only enqueue; the writer thread owns storage writes and time-based flushes
+        self.queue = HandoffQueue(
+            maxsize=cfg.queue.max_events,
+            overflow=cfg.queue.overflow,
+            spill_dir=cfg.queue.spill_dir,
+        )
+        self.writer = HandoffWorker(
+            self.queue,
+            self._write_batch,
+            on_tick=self.storage.flush_due,
+            tick_s=max(0.01, cfg.storage.batch_max_ms / 2000.0),
+        )
+
+        queue = self.queue
+        self._chat_messages = REGISTRY.counter(
+            "collector_chat_messages_total", "Chat messages handed to storage.", ("channel",)
+        )
+        REGISTRY.gauge("collector_queue_depth", "Records waiting in the handoff queue.", fn=lambda: queue.depth)
+        REGISTRY.gauge(
+            "collector_queue_high_watermark", "Deepest the handoff queue has been.", fn=lambda: queue.high_watermark
+        )
+        REGISTRY.counter("collector_queue_dropped_total", "Records dropped on queue overflow.", fn=lambda: queue.dropped)
+        REGISTRY.counter("collector_queue_spilled_total", "Records spilled to the journal.", fn=lambda: queue.spilled)
+        REGISTRY.gauge(
+            "collector_active_streams", "Streams currently being recorded.", fn=lambda: len(self.active_streams)
+        )
+
+        # one join budget shared by new joins and rejoins after a reconnect
+        self.join_bucket = TokenBucket(join_rate or cfg.irc.join_rate, cfg.irc.join_window_s)
+
+        if cfg.irc.engine == "asyncio":
+            self.irc = AsyncIRCPool.from_env(
+                server=cfg.irc.server,
+                port=cfg.irc.port,
+                use_tls=cfg.irc.use_tls,
+                on_privmsg=self._on_irc_event,
+                on_usernotice=self._on_irc_event,
+                channels_per_connection=cfg.irc.channels_per_connection,
+                on_disconnect=self._on_disconnect,
+                on_reconnect=self._on_reconnect,
+                join_bucket=self.join_bucket,
+            )
+        else:
+            self.irc = IRCClient.from_env(
+                server=cfg.irc.server,
+                port=cfg.irc.port,
+                use_tls=cfg.irc.use_tls,
+                on_privmsg=self._on_irc_event,
+                on_usernotice=self._on_irc_event,
+                on_disconnect=self._on_disconnect,
+                on_reconnect=self._on_reconnect,
+                join_bucket=self.join_bucket,
+            )
+
+        # JOIN/PART run on their own rate-limited thread; the poll loop only gets callbacks
+        self.joiner = JoinScheduler(self.irc, bucket=self.join_bucket)
+        self._last_queue_log = 0.0
+
+    @property
+    def active_channels(self) -> Set[str]:
+        # a closing stream is already offline; one waiting to reopen is live
+        live = {ch for ch, stream in self.active_streams.items() if not stream.closing}
+        return live | set(self.reopening)
+
+    def start(self) -> None:
+        self.writer.start()
+        self.irc.connect()
+        print(f"[irc] connected engine={self.cfg.irc.engine}")
+        self.joiner.start()
+
+    def open_streams(self, infos: Iterable[Dict]) -> None:
+        for info in infos:
+            ch = info["channel"]
+            stream = self.active_streams.get(ch)
+            if ch in self.reopening:
+                self.reopening[ch] = (info, self.reopening[ch][1])
+                continue
+            if stream is not None and stream.closing:
+                # back live before its close ran: the close goes first (calls run in order)
+                self.reopening[ch] = (info, self.writer.submit(lambda: None))
+                continue
+            if stream is not None:
+                continue
+            self._open_stream(info)
+        self._reopen_closed(timeout=self.call_timeout_s)
+
+    def _open_stream(self, info: Dict) -> None:
+        ch = info["channel"]
+        stream = self.storage.open_stream(info)
+        self.active_streams[ch] = stream
+
+        self.joiner.join(ch, self._on_join_done)
+
+        # initial snapshot
+        self.storage.append_snapshot(stream, self._snapshot_row(stream, info, utc_now_iso()))
+
+        print(f"[live] {ch} started_at={info['started_at']} title={info['title']!r}")
+
+    def _reopen_closed(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        for ch, (info, closed) in list(self.reopening.items()):
+            if not closed.wait(max(0.0, deadline - time.monotonic())):
+                print(f"[off] close of {ch} still queued behind chat, reopening on a later poll", file=sys.stderr)
+                continue
+            del self.reopening[ch]
+            self._open_stream(info)
+
+    def snapshot(self, infos: Iterable[Dict]) -> None:
+        """
+        Updates + snapshots channels that are still live (every poll), and opens
+        any waiting on their earlier close.
+        """
+        poll_ts = utc_now_iso()
+        for info in infos:
+            ch = info["channel"]
+            if ch in self.reopening:
+                self.reopening[ch] = (info, self.reopening[ch][1])
+                continue
+            stream = self.active_streams.get(ch)
+            if stream is None or stream.closing:
+                continue
+            stream.title = info["title"]
+            stream.game_name = info["game_name"]
+            stream.viewer_count = info["viewer_count"]
+            self.storage.append_snapshot(stream, self._snapshot_row(stream, info, poll_ts))
+        self._reopen_closed(timeout=0)
+
+    def close_streams(self, channels: Iterable[str]) -> None:
+        channels = list(channels)
+        for ch in channels:
+            # offline again before its reopen: its earlier close stands
+            self.reopening.pop(ch, None)
+        streams = [self.active_streams.get(ch) for ch in channels]
+        streams = [s for s in streams if s is not None and not s.closing]
+        if not streams:
+            return
+        for stream in streams:
+            stream.closing = True
+            self.joiner.part(stream.channel, self._on_join_done)
+        # The writer thread closes them, behind the chat already queued for them, so
+        # no batch can write to a stream mid-close (PARTs are asynchronous and chat
+        # keeps arriving meanwhile); later records find no stream and are dropped.
+        if not self.writer.call(lambda: self._close(streams), timeout=self.call_timeout_s):
+            print(f"[off] close of {len(streams)} streams still queued behind chat", file=sys.stderr)
+
+    def _close(self, streams: List[ActiveStream]) -> None:
+        for stream in streams:
+            if self.active_streams.get(stream.channel) is stream:
+                del self.active_streams[stream.channel]
+            ended_at = utc_now_iso()
+            self._close_gap(stream, ended_at)
+            self.storage.close_stream(stream, ended_at=ended_at)
+            print(f"[off] {stream.channel} ended_at={ended_at}")
+
+    def log_queue(self, now: float, every_s: float) -> None:
+        queue = self.queue
+        qs = queue.stats()
+        if now - self._last_queue_log >= every_s and (
+            qs["dropped"] or qs["spill_depth"] or qs["depth"] > queue.maxsize // 2
+        ):
+            self._last_queue_log = now
+            print(
+                f"[queue] depth={qs['depth']} high={qs['high_watermark']} "
+                f"dropped={qs['dropped']} spilled={qs['spilled']}",
+                file=sys.stderr,
+            )
+
+    def stop(self) -> None:
+        ended_at = utc_now_iso()
+        self.joiner.stop()
+        for ch in list(self.active_streams):
+            try:
+                self.irc.part(ch)
+            except Exception:
+                pass
+        try:
+            self.irc.close()
+        except Exception:
+            pass
+        self.writer.stop(drain=True)
+        self.queue.close()
+        for stream in list(self.active_streams.values()):
+            self._close_gap(stream, ended_at)
+            self.storage.close_stream(stream, ended_at=ended_at)
+        self.active_streams.clear()
+
+    @staticmethod
+    def _snapshot_row(stream: ActiveStream, info: Dict, ts: str) -> Dict:
+        return {
+            "timestamp_utc": ts,
+            "channel": stream.channel,
+            "started_at": stream.started_at,
+            "viewer_count": info["viewer_count"],
+            "title": info["title"],
+            "game_name": info["game_name"],
+        }
+
+    def _write_batch(self, batch: List[IRCRecord]) -> None:
+        storage = self.storage
+        active_streams = self.active_streams
+        counts: Dict[str, int] = {}
+        for evt in batch:
+            stream = active_streams.get(evt.channel)
+            if not stream:
+                continue
+            if evt.type == "PRIVMSG":
+                storage.append_chat(stream, evt)
+                counts[evt.channel] = counts.get(evt.channel, 0) + 1
+                if evt.tag("bits") is None:
+                    continue
+            typed = extract_event(evt)
+            if typed is not None:
+                storage.append_event(stream, typed)
+        for ch, n in counts.items():
+            self._chat_messages.inc(n, ch)
+
+    # PRIVMSG and USERNOTICE share the queue so events keep their order with chat
+    def _on_irc_event(self, evt: IRCRecord) -> None:
+        self.queue.put(evt)
+
+    def _on_join_done(self, ch: str, action: str, err: Optional[Exception]) -> None:
+        if err is not None:
+            print(f"[irc] {action.lower()} #{ch} failed: {err}", file=sys.stderr)
+        elif action == "JOIN":
+            print(f"[irc] joined #{ch} (pending={self.joiner.pending})")
+
+    def _record_gap(self, stream: ActiveStream, started: float, ended: Optional[float], end_epoch: float) -> None:
+        self.storage.append_gap(stream, {
+            "channel": stream.channel,
+            "disconnected_at": epoch_to_iso(started),
+            "reconnected_at": epoch_to_iso(ended) if ended is not None else None,
+            "duration_s": round(max(0.0, end_epoch - started), 3),
+        })
+
+    # IRC threads only queue these: gaps are tracked on the writer thread, in order
+    # with the closes there, so none lands in a stream that is already finalized
+    def _on_disconnect(self, channels: List[str], t: float) -> None:
+        self.writer.submit(lambda: self._disconnected(channels, t))
+
+    def _on_reconnect(self, channels: List[str], t: float) -> None:
+        self.writer.submit(lambda: self._reconnected(channels, t))
+
+    def _disconnected(self, channels: List[str], t: float) -> None:
+        for ch in channels:
+            if ch in self.active_streams:
+                self.gap_started.setdefault(ch, t)
+
+    def _reconnected(self, channels: List[str], t: float) -> None:
+        for ch in channels:
+            started = self.gap_started.pop(ch, None)
+            stream = self.active_streams.get(ch)
+            if started is None or stream is None:
+                continue
+            self._record_gap(stream, started, t, t)
+            print(f"[irc] #{ch} rejoined after {t - started:.1f}s gap", file=sys.stderr)
+
+    def _close_gap(self, stream: ActiveStream, ended_at: str) -> None:
+        # stream ended (or collector stopped) while still disconnected
+        started = self.gap_started.pop(stream.channel, None)
+        if started is not None:
+            self._record_gap(stream, started, None, iso_to_epoch(ended_at))
@@ -1,83 +1,314 @@
 from __future__ import annotations
 import os
+import random
 import socket
 import ssl
+import sys
 import threading
 import time
-from typing import Callable, Dict, Optional, Tuple
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from .util import utc_now_iso
+from .joins import TokenBucket
+from .telemetry import PARSE_BUCKETS, REGISTRY
+from .util import ms_to_iso, now_ms
 
 
 def _parse_tags(tag_str: str) -> Dict[str, str]:
     # a=b;c=d;flag= -> {"a":"b","c":"d","flag":""}
     tags: Dict[str, str] = {}
     for part in tag_str.split(";"):
-        if "=" in part:
-            k, v = part.split("=", 1)
-            tags[k] = v
-        else:
-            tags[part] = ""
+        k, _, v = part.partition("=")
+        tags[k] = v
     return tags
 
 
-def parse_irc_line(line: str) -> Optional[Dict]:
+class IRCRecord:
     """
-    Parses a Twitch IRC line. Returns a dict for PRIVMSG lines, else None.
+    Compact view of one Twitch IRC line: the undecoded line buffer plus offsets.
+
+    Nothing is decoded up front. `channel`, `user`, `message` and `raw` decode their
+    slice on access, `tag(key)` pulls a single tag straight out of the bytes, and the
+    full `tags` dict is only built (once) if someone asks for it. Supports `evt["key"]`
+    / `evt.get()` for the fields of the old dict events; `to_dict()` materializes one.
+
+    Times are integer epoch milliseconds: `recv_ms` when we read the line, `sent_ms`
+    from Twitch's tmi-sent-ts tag. `time_ms` (and `timestamp_utc`) is the server time
+    when the line has one, so our own queueing delay stays out of the timeline.
     """
-    raw = line.rstrip("\r\n")
-    tags = {}
-    prefix = ""
-    cmd = ""
-    params = ""
-    trailing = ""
 
-    s = raw
+    __slots__ = (
+        "type",
+        "buf",
+        "start",
+        "end",
+        "recv_ms",
+        "_sent_ms",
+        "_tags_span",
+        "_prefix_span",
+        "_params_span",
+        "_trailing_start",
+        "_tags",
+    )
 
-    if s.startswith("@"):
-        tags_part, s = s.split(" ", 1)
-        tags = _parse_tags(tags_part[1:])
+    def __init__(
+        self,
+        type: str,
+        buf: bytes,
+        start: int,
+        end: int,
+        recv_ms: int,
+        tags_span: Tuple[int, int],
+        prefix_span: Tuple[int, int],
+        params_span: Tuple[int, int],
+        trailing_start: int,
+    ):
+        self.type = type
+        self.buf = buf
+        self.start = start
+        self.end = end
+        self.recv_ms = recv_ms
+        self._sent_ms: Optional[int] = -1  # -1 until tmi-sent-ts is looked up
+        self._tags_span = tags_span
+        self._prefix_span = prefix_span
+        self._params_span = params_span
+        self._trailing_start = trailing_start  # -1 when the line has no trailing param
+        self._tags: Optional[Dict[str, str]] = None
 
-    if s.startswith(":"):
-        prefix, s = s[1:].split(" ", 1)
+    @property
+    def raw_bytes(self) -> bytes:
+        return self.buf[self.start : self.end]
 
-    if " :" in s:
-        before, trailing = s.split(" :", 1)
-    else:
-        before = s
+    @property
+    def raw(self) -> str:
+        return self.buf[self.start : self.end].decode("utf-8", errors="replace")
 
-    parts = before.split()
-    if not parts:
-        return None
-    cmd = parts[0]
-    params = " ".join(parts[1:])
+    @property
+    def raw_tags(self) -> bytes:
+        ts, te = self._tags_span
+        return self.buf[ts:te]
+
+    @property
+    def params(self) -> str:
+        ps, pe = self._params_span
+        return self.buf[ps:pe].decode("utf-8", errors="replace").strip()
+
+    @property
+    def trailing(self) -> str:
+        if self._trailing_start < 0:
+            return ""
+        return self.buf[self._trailing_start : self.end].decode("utf-8", errors="replace")
+
+    @property
+    def channel(self) -> str:
+        channel = self.params.split(" ", 1)[0]
+        if channel.startswith("#"):
+            channel = channel[1:]
+        return channel.lower()
+
+    @property
+    def user(self) -> str:
+        if self.type == "USERNOTICE":
+            # sent by tmi.twitch.tv on the user's behalf
+            return self.tag("login", "") or ""
+        # prefix like: user!user@user.tmi.twitch.tv
+        ps, pe = self._prefix_span
+        bang = self.buf.find(b"!", ps, pe)
+        return self.buf[ps : bang if bang >= 0 else pe].decode("utf-8", errors="replace")
+
+    @property
+    def message(self) -> str:
+        return self.trailing
+
+    @property
+    def payload(self) -> str:
+        return self.trailing or self.params
+
+    @property
+    def sent_ms(self) -> Optional[int]:
+        if self._sent_ms == -1:
+            v = self.tag("tmi-sent-ts")
+            try:
+                self._sent_ms = int(v) if v else None
+            except ValueError:
+                self._sent_ms = None
+        return self._sent_ms
+
+    @property
+    def time_ms(self) -> int:
+        sent = self.sent_ms
+        return sent if sent is not None else self.recv_ms
+
+    @property
+    def timestamp_utc(self) -> str:
+        return ms_to_iso(self.time_ms)
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        if self._tags is None:
+            ts, te = self._tags_span
+            self._tags = _parse_tags(self.buf[ts:te].decode("utf-8", errors="replace")) if te > ts else {}
+        return self._tags
+
+    def tag(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        if self._tags is not None:
+            return self._tags.get(key, default)
+        ts, te = self._tags_span
+        buf = self.buf
+        needle = key.encode("utf-8") + b"="
+        pos = ts
+        while True:
+            i = buf.find(needle, pos, te)
+            if i < 0:
+                return default
+            if i == ts or buf[i - 1] == 0x3B:  # ";"
+                vs = i + len(needle)
+                ve = buf.find(b";", vs, te)
+                return buf[vs : ve if ve >= 0 else te].decode("utf-8", errors="replace")
+            pos = i + 1
+
+    def to_dict(self) -> Dict:
+        if self.type == "PING":
+            return {"type": "PING", "raw": self.raw, "payload": self.payload}
+        return {
+            "type": self.type,
+            "timestamp_utc": self.timestamp_utc,
+            "sent_ms": self.sent_ms,
+            "recv_ms": self.recv_ms,
+            "channel": self.channel,
+            "user": self.user,
+            "message": self.message,
+            "tags": self.tags,
+            "raw": self.raw,
+        }
+
+    def __getitem__(self, key: str):
+        if key not in _RECORD_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
 
-    if cmd == "PING":
-        return {"type": "PING", "raw": raw, "payload": trailing or params}
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in _RECORD_KEYS else default
 
-    if cmd != "PRIVMSG":
+
+_RECORD_KEYS = frozenset(
+    ("type", "timestamp_utc", "sent_ms", "recv_ms", "channel", "user", "message", "tags", "raw", "payload")
+)
+_RECORD_COMMANDS = {
+    b"PRIVMSG": "PRIVMSG",
+    b"USERNOTICE": "USERNOTICE",
+    b"PING": "PING",
+    b"RECONNECT": "RECONNECT",
+}
+
+
+def parse_irc_bytes(
+    buf: bytes,
+    start: int = 0,
+    end: Optional[int] = None,
+    recv_ms: Optional[int] = None,
+) -> Optional[IRCRecord]:
+    """
+    Parses one Twitch IRC line held in buf[start:end] without decoding it.
+    Returns an IRCRecord for PRIVMSG, USERNOTICE, PING and RECONNECT lines, else None.
+
+    Parsing only records offsets: the record keeps a reference to `buf` rather than
+    a copy of the line, so a whole read chunk can be shared by every record parsed
+    out of it. Field accessors slice (and so copy) just the bytes they decode.
+    """
+    if end is None:
+        end = len(buf)
+    while end > start and buf[end - 1] in (0x0A, 0x0D):
+        end -= 1
+
+    pos = start
+    tags_span = (pos, pos)
+    if pos < end and buf[pos] == 0x40:  # "@"
+        sp = buf.find(b" ", pos, end)
+        if sp < 0:
+            return None
+        tags_span = (pos + 1, sp)
+        pos = sp + 1
+
+    prefix_span = (pos, pos)
+    if pos < end and buf[pos] == 0x3A:  # ":"
+        sp = buf.find(b" ", pos, end)
+        if sp < 0:
+            return None
+        prefix_span = (pos + 1, sp)
+        pos = sp + 1
+
+    while pos < end and buf[pos] == 0x20:
+        pos += 1
+
+    tr = buf.find(b" :", pos, end)
+    before_end = tr if tr >= 0 else end
+
+    sp = buf.find(b" ", pos, before_end)
+    cmd_end = sp if sp >= 0 else before_end
+    if cmd_end <= pos:
         return None
+    rtype = _RECORD_COMMANDS.get(buf[pos:cmd_end])
+    if rtype is None:
+        return None
+
+    return IRCRecord(
+        rtype,
+        buf,
+        start,
+        end,
+        now_ms() if recv_ms is None else recv_ms,
+        tags_span,
+        prefix_span,
+        (cmd_end, before_end),
+        tr + 2 if tr >= 0 else -1,
+    )
+
 
-    # params: "<#channel>"
-    channel = params.strip()
-    if channel.startswith("#"):
-        channel = channel[1:]
+def parse_irc_line(line: str) -> Optional[Dict]:
+    """
+    Parses a Twitch IRC line. Returns a dict (IRCRecord.to_dict) for PRIVMSG,
+    USERNOTICE, PING and RECONNECT lines, else None.
+    """
+    rec = parse_irc_bytes(line.encode("utf-8"))
+    return rec.to_dict() if rec else None
 
-    # prefix like: user!user@user.tmi.twitch.tv
-    user = prefix.split("!", 1)[0] if prefix else ""
 
-    return {
-        "type": "PRIVMSG",
-        "timestamp_utc": utc_now_iso(),
-        "channel": channel.lower(),
-        "user": user,
-        "message": trailing,
-        "tags": tags,
-        "raw": raw,
-    }
+# reconnect backoff: 1s, 2s, 4s ... capped, plus up to 25% jitter
+RECONNECT_BACKOFF_MIN_S = 1.0
+RECONNECT_BACKOFF_MAX_S = 60.0
+# Twitch PINGs about every 5 minutes; silence longer than this means a dead socket
+IDLE_TIMEOUT_S = 360.0
+# socket read timeout: each expiry just rechecks IDLE_TIMEOUT_S
+READ_TIMEOUT_S = 60.0
+RECV_BYTES = 1 << 16
+
+GapCallback = Callable[[List[str], float], None]
+
+PARSE_SECONDS = REGISTRY.histogram(
+    "collector_irc_parse_seconds", "Time to parse one IRC line.", PARSE_BUCKETS
+)
+IRC_DISCONNECTS = REGISTRY.counter("collector_irc_disconnects_total", "IRC connection drops.")
+IRC_RECONNECTS = REGISTRY.counter("collector_irc_reconnects_total", "Successful IRC reconnects.")
+
+
+def backoff_delays() -> Iterator[float]:
+    delay = RECONNECT_BACKOFF_MIN_S
+    while True:
+        yield delay * (1.0 + random.random() * 0.25)
+        delay = min(RECONNECT_BACKOFF_MAX_S, delay * 2)
 
 
 class IRCClient:
+    """
+    Single blocking Twitch IRC connection with a supervisor thread.
+
+    When the socket drops (EOF, error, RECONNECT, or no traffic for IDLE_TIMEOUT_S)
+    the client reconnects with exponential backoff and rejoins every channel in
+    `_joined`, paced by `join_bucket`. `on_disconnect(channels, at)` fires once per
+    drop and `on_reconnect([channel], at)` as each channel is joined again, so callers
+    can record exact per-channel gaps.
+    """
+
     def __init__(
         self,
         server: str,
@@ -85,7 +316,11 @@ class IRCClient:
         use_tls: bool,
         nick: str,
         oauth: str,
-        on_privmsg: Callable[[Dict], None],
+        on_privmsg: Callable[[IRCRecord], None],
+        on_disconnect: Optional[GapCallback] = None,
+        on_reconnect: Optional[GapCallback] = None,
+        join_bucket: Optional[TokenBucket] = None,
+        on_usernotice: Optional[Callable[[IRCRecord], None]] = None,
     ):
         self.server = server
         self.port = port
@@ -93,26 +328,50 @@ class IRCClient:
         self.nick = nick
         self.oauth = oauth
         self.on_privmsg = on_privmsg
+        self.on_usernotice = on_usernotice
+        self.on_disconnect = on_disconnect
+        self.on_reconnect = on_reconnect
+        self.join_bucket = join_bucket or TokenBucket()
 
         self._sock: Optional[socket.socket] = None
-        self._file = None
 
         self._stop = threading.Event()
         self._thread: Optional[threading.Thread] = None
         self._write_lock = threading.Lock()
 
+        # channels we want to be in; survives reconnects
         self._joined: Dict[str, bool] = {}
 
+        self.disconnects = 0
+        self.reconnects = 0
+
     @classmethod
-    def from_env(cls, server: str, port: int, use_tls: bool, on_privmsg: Callable[[Dict], None]) -> "IRCClient":
+    def from_env(
+        cls,
+        server: str,
+        port: int,
+        use_tls: bool,
+        on_privmsg: Callable[[IRCRecord], None],
+        on_disconnect: Optional[GapCallback] = None,
+        on_reconnect: Optional[GapCallback] = None,
+        join_bucket: Optional[TokenBucket] = None,
+        on_usernotice: Optional[Callable[[IRCRecord], None]] = None,
+    ) -> "IRCClient":
         nick = os.getenv("TWITCH_IRC_NICK", "").strip()
         oauth = os.getenv("TWITCH_IRC_OAUTH", "").strip()
         if not nick or not oauth:
             raise RuntimeError("Missing TWITCH_IRC_NICK / TWITCH_IRC_OAUTH in environment (.env).")
-        return cls(server, port, use_tls, nick, oauth, on_privmsg)
+        return cls(
+            server, port, use_tls, nick, oauth, on_privmsg, on_disconnect, on_reconnect, join_bucket, on_usernotice
+        )
 
     def connect(self) -> None:
         self._stop.clear()
+        self._open()
+        self._thread = threading.Thread(target=self._supervise, name="twitch-irc-read", daemon=True)
+        self._thread.start()
+
+    def _open(self) -> None:
         base = socket.create_connection((self.server, self.port), timeout=20)
         if self.use_tls:
             ctx = ssl.create_default_context()
@@ -120,17 +379,23 @@ class IRCClient:
         else:
             sock = base
 
-        sock.settimeout(60)
-        self._sock = sock
-        self._file = sock.makefile("r", encoding="utf-8", newline="\n")
+        sock.settimeout(READ_TIMEOUT_S)
+        with self._write_lock:
+            self._sock = sock
 
         # auth + capabilities
         self._send(f"PASS {self.oauth}")
         self._send(f"NICK {self.nick}")
         self._send("CAP REQ :twitch.tv/tags twitch.tv/commands twitch.tv/membership")
 
-        self._thread = threading.Thread(target=self._read_loop, name="twitch-irc-read", daemon=True)
-        self._thread.start()
+    def _drop(self) -> None:
+        with self._write_lock:
+            sock, self._sock = self._sock, None
+        if sock:
+            try:
+                sock.close()
+            except Exception:
+                pass
 
     def close(self) -> None:
         self._stop.set()
@@ -141,58 +406,153 @@ class IRCClient:
                         self._sock.sendall(b"QUIT\r\n")
                     except Exception:
                         pass
-                self._sock.close()
         finally:
-            self._sock = None
-            self._file = None
+            self._drop()
 
     def join(self, channel: str) -> None:
         channel = channel.strip().lstrip("#").lower()
         if not channel or self._joined.get(channel):
             return
-        self._send(f"JOIN #{channel}")
         self._joined[channel] = True
+        try:
+            self._send(f"JOIN #{channel}")
+        except Exception:
+            if self._stop.is_set() or not self._thread:
+                self._joined.pop(channel, None)
+                raise
+            # mid-reconnect: the rejoin pass picks it up
 
     def part(self, channel: str) -> None:
         channel = channel.strip().lstrip("#").lower()
         if not channel or not self._joined.get(channel):
             return
-        self._send(f"PART #{channel}")
         self._joined.pop(channel, None)
+        try:
+            self._send(f"PART #{channel}")
+        except Exception:
+            # not connected: nothing to leave
+            pass
 
     def _send(self, line: str) -> None:
-        if not self._sock:
-            raise RuntimeError("IRC socket not connected.")
         msg = (line + "\r\n").encode("utf-8")
         with self._write_lock:
+            if not self._sock:
+                raise RuntimeError("IRC socket not connected.")
             self._sock.sendall(msg)
 
+    def _supervise(self) -> None:
+        while not self._stop.is_set():
+            self._read_loop()
+            if self._stop.is_set():
+                return
+
+            dropped_at = time.time()
+            channels = sorted(self._joined)
+            self.disconnects += 1
+            IRC_DISCONNECTS.inc()
+            self._drop()
+            print(f"[irc] disconnected, {len(channels)} channels affected", file=sys.stderr)
+            self._notify(self.on_disconnect, channels, dropped_at)
+
+            for delay in backoff_delays():
+                if self._stop.wait(delay):
+                    return
+                try:
+                    self._open()
+                    break
+                except Exception as e:
+                    print(f"[irc] reconnect failed: {e}", file=sys.stderr)
+                    self._drop()
+
+            self.reconnects += 1
+            IRC_RECONNECTS.inc()
+            print(f"[irc] reconnected after {time.time() - dropped_at:.1f}s", file=sys.stderr)
+            threading.Thread(
+                target=self._rejoin, args=(channels,), name="twitch-irc-rejoin", daemon=True
+            ).start()
+
+    def _rejoin(self, dropped: List[str]) -> None:
+        # everything wanted now, including channels joined while we were down
+        dropped_set = set(dropped)
+        for ch in sorted(self._joined):
+            if not self.join_bucket.take(self._stop):
+                return
+            if not self._joined.get(ch):
+                continue  # parted meanwhile
+            try:
+                self._send(f"JOIN #{ch}")
+            except Exception:
+                return  # dropped again; the next rejoin pass covers the rest
+            if ch in dropped_set:
+                self._notify(self.on_reconnect, [ch], time.time())
+
+    @staticmethod
+    def _notify(callback: Optional[GapCallback], channels: List[str], at: float) -> None:
+        if callback is None or not channels:
+            return
+        try:
+            callback(channels, at)
+        except Exception:
+            pass
+
     def _read_loop(self) -> None:
-        assert self._file is not None
+        sock = self._sock
+        if sock is None:
+            return
+        last_rx = time.monotonic()
+        pending = b""
         while not self._stop.is_set():
+            # plain recv and our own line splitting: a socket.timeout leaves the socket
+            # usable, where a makefile() reader is dead after its first one
             try:
-                line = self._file.readline()
-                if not line:
-                    # disconnected
-                    break
-                evt = parse_irc_line(line)
-                if not evt:
-                    continue
-                if evt["type"] == "PING":
-                    payload = evt.get("payload", "")
-                    try:
-                        self._send(f"PONG :{payload}")
-                    except Exception:
-                        pass
-                    continue
-                if evt["type"] == "PRIVMSG":
-                    try:
-                        self.on_privmsg(evt)
-                    except Exception:
-                        # swallow to keep logging alive
-                        pass
+                chunk = sock.recv(RECV_BYTES)
             except socket.timeout:
-                # allow loop to continue
+                if time.monotonic() - last_rx > IDLE_TIMEOUT_S:
+                    return
                 continue
             except Exception:
-                break
\ No newline at end of file
+                return
+            if not chunk:
+                # disconnected
+                return
+            last_rx = time.monotonic()
+            recv_ms = now_ms()
+            # records parsed out of `data` share it rather than copying their line
+            data = pending + chunk if pending else chunk
+            start = 0
+            while True:
+                nl = data.find(b"\n", start)
+                if nl < 0:
+                    break
+                if not self._handle_line(data, start, nl + 1, recv_ms):
+                    return
+                start = nl + 1
+            pending = data[start:]
+
+    def _handle_line(self, data: bytes, start: int, end: int, recv_ms: int) -> bool:
+        # False when the server asked us to reconnect
+        t0 = time.perf_counter()
+        evt = parse_irc_bytes(data, start, end, recv_ms)
+        PARSE_SECONDS.observe(time.perf_counter() - t0)
+        if not evt:
+            return True
+        if evt.type == "PING":
+            try:
+                self._send(f"PONG :{evt.payload}")
+            except Exception:
+                pass
+        elif evt.type == "RECONNECT":
+            # server is about to restart; drop now and come back
+            return False
+        elif evt.type == "PRIVMSG":
+            try:
+                self.on_privmsg(evt)
+            except Exception:
+                # swallow to keep logging alive
+                pass
+        elif evt.type == "USERNOTICE" and self.on_usernotice is not None:
+            try:
+                self.on_usernotice(evt)
+            except Exception:
+                pass
+        return True
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+
+# Twitch: 20 JOIN attempts per 10 seconds per account (verified bots: 2000)
+DEFAULT_JOIN_RATE = 20
+DEFAULT_JOIN_WINDOW_S = 10.0
+
+JoinCallback = Callable[[str, str, Optional[Exception]], None]
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `capacity` tokens, refilled continuously over `window_s`.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_JOIN_RATE, window_s: float = DEFAULT_JOIN_WINDOW_S):
+        self.capacity = max(1, int(capacity))
+        self.rate = self.capacity / max(0.001, float(window_s))  # tokens per second
+        self._tokens = float(self.capacity)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """
+        Takes a token and returns 0, or returns the seconds until one is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+    def take(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Blocks until a token is taken. Returns False if `stop` was set first.
+        """
+        while True:
+            wait = self.try_take()
+            if wait <= 0:
+                return True
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class JoinScheduler:
+    """
+    Sends JOIN / PART for an IRC client on its own thread so the poll loop never
+    sleeps between joins. JOINs are paced by a TokenBucket matching Twitch's join
+    limit; PARTs are not rate limited and only wait for their turn in the queue.
+
+    Each request may carry a callback `(channel, action, error)` run on the join
+    thread once the command was sent (error None), failed, or was cancelled by a
+    later request for the same channel (action "cancelled").
+    """
+
+    def __init__(
+        self,
+        irc,
+        rate: int = DEFAULT_JOIN_RATE,
+        window_s: float = DEFAULT_JOIN_WINDOW_S,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.irc = irc
+        self.bucket = bucket or TokenBucket(rate, window_s)
+
+        self._ops: Deque[Tuple[str, str, Optional[JoinCallback]]] = deque()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._ops)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="twitch-irc-join", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def join(self, channel: str, callback: Optional[JoinCallback] = None) -> None:
+        self._submit("JOIN", channel, callback)
+
+    def part(self, channel: str, callback: Optional[JoinCallback] = None) -> None:
+        self._submit("PART", channel, callback)
+
+    def _submit(self, action: str, channel: str, callback: Optional[JoinCallback]) -> None:
+        channel = channel.strip().lstrip("#").lower()
+        if not channel:
+            return
+        cancelled = []
+        with self._cond:
+            # a PART for a channel still waiting to be joined just cancels the JOIN
+            if action == "PART":
+                for op in list(self._ops):
+                    if op[0] == "JOIN" and op[1] == channel:
+                        self._ops.remove(op)
+                        cancelled.append(op)
+                if cancelled:
+                    action = ""
+            if action:
+                self._ops.append((action, channel, callback))
+                self._cond.notify()
+        for _, ch, cb in cancelled:
+            self._done(cb, ch, "cancelled", None)
+        if not action:
+            self._done(callback, channel, "cancelled", None)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._cond:
+                while not self._ops and not self._stop.is_set():
+                    self._cond.wait(1.0)
+                if self._stop.is_set():
+                    return
+                action = self._ops[0][0]
+
+            if action == "JOIN" and not self.bucket.take(self._stop):
+                return
+
+            with self._cond:
+                if not self._ops:
+                    # cancelled while waiting for a token; the token is spent anyway
+                    continue
+                action, channel, callback = self._ops.popleft()
+
+            err: Optional[Exception] = None
+            try:
+                if action == "JOIN":
+                    self.irc.join(channel)
+                else:
+                    self.irc.part(channel)
+            except Exception as e:
+                err = e
+            self._done(callback, channel, action, err)
+
+    @staticmethod
+    def _done(callback: Optional[JoinCallback], channel: str, action: str, err: Optional[Exception]) -> None:
+        if callback is None:
+            return
+        try:
+            callback(channel, action, err)
+        except Exception:
+            pass
@@ -0,0 +1,368 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.request import urlopen
+
+import yaml
+
+from .fake_twitch import FakeHelixServer, FakeIRCServer, replay_templates, synthetic_templates
+
+
+# Runs the real collector (python -m collector.main) against local fake IRC / Helix
+# servers and reports throughput, lag, drops and memory. Example:
+#   python -m collector.loadtest --channels 200 --rate 20000 --duration 60 --workers 2
+
+PACKAGE_ROOT = Path(__file__).resolve().parent.parent
+
+
+def parse_metrics(text: str) -> Dict[Tuple[str, str], float]:
+    """
+    Prometheus text -> {(name, "{labels}"): value}.
+    """
+    out: Dict[Tuple[str, str], float] = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        head, _, value = line.rpartition(" ")
+        name, brace, labels = head.partition("{")
+        try:
+            out[(name, brace + labels)] = float(value)
+        except ValueError:
+            continue
+    return out
+
+
+def metric_sum(samples: Dict[Tuple[str, str], float], name: str) -> float:
+    return sum(v for (n, _), v in samples.items() if n == name)
+
+
+def histogram_quantile(samples: Dict[Tuple[str, str], float], name: str, q: float) -> Optional[float]:
+    """
+    Quantile from cumulative `<name>_bucket{le=...}` counts, interpolated within the
+    bucket (like PromQL's histogram_quantile). Past the last finite bound it returns
+    that bound.
+    """
+    buckets: Dict[float, float] = {}
+    for (n, labels), v in samples.items():
+        if n != name + "_bucket" or 'le="' not in labels:
+            continue
+        le = labels.split('le="', 1)[1].split('"', 1)[0]
+        bound = float("inf") if le == "+Inf" else float(le)
+        buckets[bound] = buckets.get(bound, 0.0) + v
+    if not buckets:
+        return None
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    target = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= target:
+            if bound == float("inf"):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (target - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def scrape(ports: List[int]) -> Dict[Tuple[str, str], float]:
+    # supervisor plus workers each serve their own registry; sum across them
+    merged: Dict[Tuple[str, str], float] = {}
+    for port in ports:
+        try:
+            with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as resp:
+                samples = parse_metrics(resp.read().decode("utf-8"))
+        except OSError:
+            continue
+        for key, v in samples.items():
+            merged[key] = merged.get(key, 0.0) + v
+    return merged
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """
+    Resident memory of `pid` and its descendants, from /proc (Linux only).
+    """
+    proc = Path("/proc")
+    if not proc.exists():
+        return None
+    children: Dict[int, List[int]] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    total, todo = 0, [pid]
+    page = os.sysconf("SC_PAGE_SIZE")
+    while todo:
+        p = todo.pop()
+        try:
+            total += int((proc / str(p) / "statm").read_text().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+        todo.extend(children.get(p, ()))
+    return total
+
+
+def free_ports(count: int) -> int:
+    # a base port with `count` consecutive free ports (supervisor + one per worker)
+    rng = random.Random()
+    for _ in range(100):
+        base = rng.randrange(20000, 60000 - count)
+        try:
+            for port in range(base, base + count):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", port))
+        except OSError:
+            continue
+        return base
+    raise RuntimeError("no free port range for collector telemetry")
+
+
+def write_config(
+    args, workdir: Path, channels: List[str], irc: FakeIRCServer, helix: FakeHelixServer, port: int
+) -> Path:
+    cfg = {
+        "data_root": str(workdir / "data"),
+        "workers": args.workers,
+        "streams": {"channels": channels},
+        "helix": {
+            "poll_seconds": args.poll_seconds,
+            "min_poll_seconds": args.poll_seconds,
+            "max_poll_seconds": args.poll_seconds,
+            "tick_seconds": 1,
+            "base_url": helix.base_url,
+            "oauth_url": helix.oauth_url,
+        },
+        "storage": {
+            "durability": args.durability,
+            "chat_layout": args.layout,
+            "segment_codec": args.codec,
+            "chat_schema": args.schema,
+            "rollups": True,
+            "max_open_files": args.max_open_files,
+        },
+        "queue": {"max_events": args.queue_max},
+        "irc": {
+            "server": "127.0.0.1",
+            "port": irc.port,
+            "use_tls": False,
+            # the fake server does not rate-limit joins
+            "join_rate": 100_000,
+            "join_window_s": 1,
+            "engine": args.engine,
+            "channels_per_connection": args.channels_per_connection,
+        },
+        "telemetry": {"enabled": True, "host": "127.0.0.1", "port": port},
+    }
+    if args.overflow:
+        cfg["queue"]["overflow"] = args.overflow
+    if args.overflow == "spill":
+        cfg["queue"]["spill_dir"] = str(workdir / "spill")
+    path = workdir / "config.yaml"
+    path.write_text(yaml.safe_dump(cfg, sort_keys=False), encoding="utf-8")
+    return path
+
+
+def run(args) -> Dict:
+    channels = [f"load{i:05d}" for i in range(args.channels)]
+    templates = replay_templates(args.replay) if args.replay else synthetic_templates(seed=args.seed)
+    if not templates:
+        raise SystemExit("no PRIVMSG lines found in the --replay files")
+
+    irc = FakeIRCServer(templates, rate=args.rate, ping_s=args.ping_s, seed=args.seed)
+    helix = FakeHelixServer(channels)
+    irc.start()
+    helix.start()
+
+    workdir = Path(tempfile.mkdtemp(prefix="collector-loadtest-"))
+    base_port = free_ports(args.workers + 1)
+    ports = [base_port] + ([base_port + 1 + i for i in range(args.workers)] if args.workers > 1 else [])
+    config_path = write_config(args, workdir, channels, irc, helix, base_port)
+
+    env = dict(os.environ)
+    env.update(
+        TWITCH_CLIENT_ID="loadtest",
+        TWITCH_CLIENT_SECRET="loadtest",
+        TWITCH_IRC_NICK="justinfan12345",
+        TWITCH_IRC_OAUTH="oauth:loadtest",
+        PYTHONUNBUFFERED="1",
+    )
+    log = (workdir / "collector.log").open("wb")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "collector.main", "--config", str(config_path)],
+        cwd=str(PACKAGE_ROOT),
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    print(f"[loadtest] collector pid={proc.pid} workdir={workdir}", file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    samples: List[Dict] = []
+    rss_peak = 0
+    try:
+        # warm-up: wait for the first Helix poll and the JOINs
+        deadline = time.monotonic() + args.warmup
+        while irc.joined < len(channels) and time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"collector exited with {proc.returncode}, see {workdir / 'collector.log'}")
+            time.sleep(0.5)
+        print(
+            f"[loadtest] {irc.joined}/{len(channels)} channels joined, sending {args.rate:.0f} msg/s",
+            file=sys.stderr,
+        )
+
+        irc.sending = True
+        t0 = time.monotonic()
+        next_toggle = t0 + args.toggle_s if args.toggle_s > 0 else float("inf")
+        while time.monotonic() - t0 < args.duration:
+            time.sleep(1.0)
+            now = time.monotonic()
+            if now >= next_toggle:
+                on, off = helix.toggle(args.toggle_fraction, rng)
+                print(f"[loadtest] helix toggle +{on} live -{off} offline", file=sys.stderr)
+                next_toggle = now + args.toggle_s
+            m = scrape(ports)
+            rss = rss_bytes(proc.pid) or 0
+            rss_peak = max(rss_peak, rss)
+            samples.append({
+                "t": now - t0,
+                "sent": irc.sent_chat,
+                "written": metric_sum(m, "collector_chat_messages_total"),
+                "queue_depth": metric_sum(m, "collector_queue_depth"),
+                "rss": rss,
+            })
+            s = samples[-1]
+            print(
+                f"[loadtest] t={s['t']:.0f}s sent={s['sent']} written={s['written']:.0f} "
+                f"queue={s['queue_depth']:.0f} rss={rss / 2**20:.0f}MB",
+                file=sys.stderr,
+            )
+        irc.sending = False
+        window = time.monotonic() - t0
+
+        # drain: let queued chat reach disk (or stop when it no longer moves)
+        last, still = -1.0, 0
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline:
+            written = metric_sum(scrape(ports), "collector_chat_messages_total")
+            if written >= irc.sent_chat:
+                break
+            still = still + 1 if written == last else 0
+            if still >= 5:
+                break
+            last = written
+            time.sleep(1.0)
+        final = scrape(ports)
+    finally:
+        irc.sending = False
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        log.close()
+        irc.stop()
+        helix.stop()
+
+    written = metric_sum(final, "collector_chat_messages_total")
+    per_second = [
+        (b["written"] - a["written"]) / max(1e-9, b["t"] - a["t"]) for a, b in zip(samples, samples[1:])
+    ]
+    steady = per_second[len(per_second) // 10 :] or per_second
+    report = {
+        "channels": len(channels),
+        "offered_rate": args.rate,
+        "duration_s": round(window, 1),
+        "engine": args.engine,
+        "workers": args.workers,
+        "schema": args.schema,
+        "layout": args.layout,
+        "sent": irc.sent,
+        "sent_chat": irc.sent_chat,
+        "shed_by_server": irc.shed,
+        "written": int(written),
+        # chat sent but never written; with --toggle-s this includes lines in flight
+        # for channels that went offline
+        "lost": max(0, int(irc.sent_chat - written)),
+        "queue_dropped": int(metric_sum(final, "collector_queue_dropped_total")),
+        "queue_spilled": int(metric_sum(final, "collector_queue_spilled_total")),
+        "throughput_mean": round(written / window, 1) if window else 0.0,
+        "throughput_min_1s": round(min(steady), 1) if steady else None,
+        "lag_p50_s": histogram_quantile(final, "collector_chat_lag_seconds", 0.50),
+        "lag_p90_s": histogram_quantile(final, "collector_chat_lag_seconds", 0.90),
+        "lag_p99_s": histogram_quantile(final, "collector_chat_lag_seconds", 0.99),
+        "rss_peak_mb": round(rss_peak / 2**20, 1),
+        "pongs": irc.pongs,
+        "helix_requests": helix.requests,
+        "workdir": str(workdir),
+    }
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+        report["workdir"] = None
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Load-test the collector against local fake Twitch servers.")
+    ap.add_argument("--channels", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=10_000, help="Chat lines per second across all channels")
+    ap.add_argument("--duration", type=float, default=60, help="Seconds of sending")
+    ap.add_argument("--warmup", type=float, default=60, help="Max seconds to wait for JOINs")
+    ap.add_argument("--drain", type=float, default=30, help="Max seconds to wait for the queue to drain")
+    ap.add_argument("--replay", type=Path, action="append", help="Recorded chat file to replay (repeatable)")
+    ap.add_argument("--engine", choices=("thread", "asyncio"), default="asyncio")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--channels-per-connection", type=int, default=50)
+    ap.add_argument("--schema", choices=("full", "raw", "compact"), default="compact")
+    ap.add_argument("--layout", choices=("jsonl", "segments"), default="segments")
+    ap.add_argument("--codec", choices=("gzip", "zstd", "none"), default="gzip")
+    ap.add_argument("--durability", choices=("none", "flush", "fsync"), default="flush")
+    ap.add_argument("--max-open-files", type=int, default=512)
+    ap.add_argument("--queue-max", type=int, default=100_000)
+    ap.add_argument("--overflow", choices=("block", "drop_oldest", "spill"), default=None, help="Default: per engine")
+    ap.add_argument("--poll-seconds", type=int, default=5, help="Fake Helix poll interval")
+    ap.add_argument("--toggle-s", type=float, default=0, help="Flip channels live/offline this often (0 = never)")
+    ap.add_argument("--toggle-fraction", type=float, default=0.1)
+    ap.add_argument("--ping-s", type=float, default=60)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--keep", action="store_true", help="Keep the work dir (data, config, collector.log)")
+    ap.add_argument("--json", type=Path, default=None, help="Also write the report here")
+    return ap.parse_args(argv)
+
+
+def main() -> int:
+    args = parse_args()
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json is not None:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(text + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
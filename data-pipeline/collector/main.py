@@ -1,148 +1,175 @@
 from __future__ import annotations
 import argparse
+import signal
 import sys
 import time
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
-from .config import load_config
+from .config import AppCfg, load_config
 from .helix import HelixClient, StreamInfo
-from .irc import IRCClient
-from .storage import Storage, ActiveStream
-from .util import utc_now_iso
+from .ingest import Ingest
+from .registry import ChannelRegistry, ControlServer
+from .scheduler import PollScheduler
+from .supervisor import ShardedIngest
+from .telemetry import REGISTRY, MetricsServer
+from .util import iso_to_epoch
+
+
+def stream_info(ch: str, info: StreamInfo) -> Dict:
+    return {
+        "channel": ch,
+        "user_id": info.user_id,
+        "started_at": info.started_at.replace("+00:00", "Z"),
+        "title": info.title,
+        "game_name": info.game_name,
+        "viewer_count": info.viewer_count,
+    }
+
+
+def apply_registry(registry: ChannelRegistry, scheduler: PollScheduler, ingest, now: float) -> None:
+    registry.maybe_reload(now)
+    added, removed = registry.drain()
+    if not added and not removed:
+        return
+    for ch in added:
+        # due immediately; JOINed on the next poll if live
+        scheduler.add(ch, now)
+    for ch in removed:
+        scheduler.remove(ch)
+    ingest.close_streams(sorted(removed & ingest.active_channels))
+    print(f"[registry] applied +{len(added)} -{len(removed)}, tracking {len(scheduler.channels)} channels")
+
+
+def poll_loop(
+    cfg: AppCfg,
+    helix: HelixClient,
+    scheduler: PollScheduler,
+    ingest,
+    registry: Optional[ChannelRegistry] = None,
+) -> None:
+    """
+    Polls Helix on the scheduler's timetable and drives `ingest` (an Ingest, or a
+    ShardedIngest in supervisor mode) with streams going live, still live and offline.
+    Channel registry changes are applied between polls.
+    """
+    while True:
+        time.sleep(max(0.0, scheduler.next_wakeup(time.time()) - time.time()))
+        now = time.time()
+        ingest.log_queue(now, cfg.helix.poll_seconds)
+        if registry is not None:
+            apply_registry(registry, scheduler, ingest, now)
+        due = scheduler.due(now)
+        if not due:
+            continue
+        try:
+            live: Dict[str, StreamInfo] = helix.get_live_streams(
+                due,
+                batch_size=cfg.helix.batch_size,
+            )
+        except Exception as e:
+            print(f"[helix] error: {e}", file=sys.stderr)
+            scheduler.note_rate_limit(helix.rate_limit)
+            time.sleep(max(5, cfg.helix.tick_seconds))
+            continue
+        scheduler.note_rate_limit(helix.rate_limit)
+        scheduler.record(
+            due,
+            {ch: iso_to_epoch(info.started_at) for ch, info in live.items()},
+            now,
+        )
+
+        # only channels polled this round can change state
+        polled_set = set(due)
+        live_set = set(live.keys())
+        active_set = ingest.active_channels & polled_set
+
+        went_live = sorted(live_set - active_set)
+        went_offline = sorted(active_set - live_set)
+
+        # 1) Handle newly live channels
+        ingest.open_streams([stream_info(ch, live[ch]) for ch in went_live])
+
+        # 2) Update + snapshot for channels still live (every poll)
+        ingest.snapshot([stream_info(ch, live[ch]) for ch in sorted(live_set & active_set)])
+
+        # 3) Handle channels that went offline
+        ingest.close_streams(went_offline)
 
 
 def main() -> int:
     ap = argparse.ArgumentParser()
     ap.add_argument("--config", required=True, help="Path to config.yaml")
+    ap.add_argument("--workers", type=int, default=None, help="Ingest processes (overrides config 'workers')")
     args = ap.parse_args()
 
     load_dotenv()
     cfg = load_config(args.config)
+    workers = args.workers if args.workers is not None else cfg.workers
 
-    storage = Storage(cfg.data_root)
-    storage.ensure_root()
-
-    helix = HelixClient.from_env()
-
-    active_streams: Dict[str, ActiveStream] = {}
+    helix = HelixClient.from_env(
+        max_workers=cfg.helix.max_workers,
+        user_id_cache_path=cfg.data_root / "helix_user_ids.json",
+        base_url=cfg.helix.base_url,
+        oauth_url=cfg.helix.oauth_url,
+    )
+    registry = ChannelRegistry(Path(args.config), reload_seconds=cfg.streams.reload_seconds)
+    # SIGHUP: reload channels now instead of waiting for the mtime check
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: registry.request_reload())
+
+    scheduler = PollScheduler(
+        sorted(registry.channels),
+        live_interval_s=cfg.helix.poll_seconds,
+        min_interval_s=cfg.helix.min_poll_seconds,
+        max_interval_s=cfg.helix.max_poll_seconds,
+        tick_s=cfg.helix.tick_seconds,
+        batch_size=cfg.helix.batch_size,
+        reserve=cfg.helix.ratelimit_reserve,
+        history_path=cfg.data_root / "poll_history.json",
+    )
+    REGISTRY.gauge(
+        "collector_helix_ratelimit_remaining",
+        "Helix rate-limit points left in the window.",
+        fn=lambda: helix.rate_limit.remaining,
+    )
 
-    def on_privmsg(evt: Dict) -> None:
-        ch = evt["channel"]
-        stream = active_streams.get(ch)
-        if not stream:
-            return
-        storage.append_chat(stream, evt)
+    # one process does everything, or a supervisor polls Helix and shards channels over workers
+    if workers > 1:
+        ingest = ShardedIngest(args.config, workers)
+    else:
+        ingest = Ingest(cfg)
 
-    irc = IRCClient.from_env(
-        server=cfg.irc.server,
-        port=cfg.irc.port,
-        use_tls=cfg.irc.use_tls,
-        on_privmsg=on_privmsg,
-    )
+    metrics_server: Optional[MetricsServer] = None
+    if cfg.telemetry.enabled:
+        metrics_server = MetricsServer(cfg.telemetry.host, cfg.telemetry.port)
+        metrics_server.start()
 
     print(f"[boot] data_root={cfg.data_root}")
-    print(f"[boot] tracking {len(cfg.streams.channels)} channels")
+    control: Optional[ControlServer] = None
+    if cfg.streams.control_socket is not None:
+        control = ControlServer(registry, cfg.streams.control_socket)
+        control.start()
 
-    irc.connect()
-    print("[irc] connected")
+    print(f"[boot] tracking {len(registry)} channels, workers={workers}")
 
+    ingest.start()
     try:
-        while True:
-            try:
-                live: Dict[str, StreamInfo] = helix.get_live_streams(
-                    cfg.streams.channels,
-                    batch_size=cfg.helix.batch_size,
-                )
-            except Exception as e:
-                print(f"[helix] error: {e}", file=sys.stderr)
-                time.sleep(max(5, cfg.helix.poll_seconds))
-                continue
-
-            live_set = set(live.keys())
-            active_set = set(active_streams.keys())
-
-            went_live = sorted(live_set - active_set)
-            went_offline = sorted(active_set - live_set)
-
-            # 1) Handle newly live channels
-            for ch in went_live:
-                info = live[ch]
-                stream = storage.open_stream({
-                    "channel": ch,
-                    "user_id": info.user_id,
-                    "started_at": info.started_at.replace("+00:00", "Z"),
-                    "title": info.title,
-                    "game_name": info.game_name,
-                    "viewer_count": info.viewer_count,
-                })
-                active_streams[ch] = stream
-
-                irc.join(ch)
-                time.sleep(cfg.irc.join_delay_s)
-
-                # initial snapshot
-                storage.append_snapshot(stream, {
-                    "timestamp_utc": utc_now_iso(),
-                    "channel": ch,
-                    "started_at": stream.started_at,
-                    "viewer_count": info.viewer_count,
-                    "title": info.title,
-                    "game_name": info.game_name,
-                })
-
-                print(f"[live] {ch} started_at={info.started_at} title={info.title!r}")
-
-            # 2) Update + snapshot for channels still live (every poll)
-            poll_ts = utc_now_iso()
-            for ch in sorted(live_set & set(active_streams.keys())):
-                info = live[ch]
-                stream = active_streams[ch]
-
-                stream.title = info.title
-                stream.game_name = info.game_name
-                stream.viewer_count = info.viewer_count
-
-                storage.append_snapshot(stream, {
-                    "timestamp_utc": poll_ts,
-                    "channel": ch,
-                    "started_at": stream.started_at,
-                    "viewer_count": info.viewer_count,
-                    "title": info.title,
-                    "game_name": info.game_name,
-                })
-
-            # 3) Handle channels that went offline
-            for ch in went_offline:
-                stream = active_streams.pop(ch, None)
-                if not stream:
-                    continue
-
-                irc.part(ch)
-                ended_at = utc_now_iso()
-                storage.close_stream(stream, ended_at=ended_at)
-                print(f"[off] {ch} ended_at={ended_at}")
-
-            time.sleep(cfg.helix.poll_seconds)
-
+        poll_loop(cfg, helix, scheduler, ingest, registry)
     except KeyboardInterrupt:
         print("\n[shutdown] ctrl-c")
     finally:
-        ended_at = utc_now_iso()
-        for ch, stream in list(active_streams.items()):
-            try:
-                irc.part(ch)
-            except Exception:
-                pass
-            storage.close_stream(stream, ended_at=ended_at)
-        try:
-            irc.close()
-        except Exception:
-            pass
+        if control is not None:
+            control.stop()
+        ingest.stop()
+        helix.close()
+        if metrics_server is not None:
+            metrics_server.stop()
 
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .rollups import ROLLUP_SECONDS_NAME, ROLLUPS_NAME, merge_rows, read_second_rows
+from .schema import decode_event
+from .segments import MANIFEST_NAME, open_chat_file
+from .util import iso_to_epoch
+
+
+def iter_stream_dirs(data_root: Path) -> Iterator[Path]:
+    """
+    Yields every raw_chat/channel=*/stream=* directory under data_root, sorted.
+    """
+    yield from sorted((Path(data_root) / "raw_chat").glob("channel=*/stream=*"))
+
+
+def chat_files(stream_dir: Path, start: Optional[float] = None, end: Optional[float] = None) -> List[Path]:
+    """
+    Chat files of one stream in write order: the legacy chat.jsonl, then segments.
+    With a manifest, segments entirely outside [start, end] (epoch seconds) are skipped.
+    """
+    files: List[Path] = []
+    legacy = stream_dir / "chat.jsonl"
+    if legacy.exists():
+        files.append(legacy)
+
+    manifest = stream_dir / MANIFEST_NAME
+    if manifest.exists():
+        segments = json.loads(manifest.read_text(encoding="utf-8")).get("segments", [])
+        for seg in sorted(segments, key=lambda s: s["index"]):
+            lo, hi = seg.get("min_ts_epoch"), seg.get("max_ts_epoch")
+            if lo is not None and hi is not None:
+                if (start is not None and hi < start) or (end is not None and lo > end):
+                    continue
+            files.append(stream_dir / seg["file"])
+    else:
+        files.extend(sorted(stream_dir.glob("chat-*.jsonl*")))
+    return files
+
+
+def load_rollups(stream_dir: Path) -> Optional[Dict]:
+    """
+    A stream's rollups.json (see rollups.py), or None if it was never written.
+    For a stream still being written, "second" includes the journaled rows.
+    """
+    path = stream_dir / ROLLUPS_NAME
+    if not path.exists():
+        return None
+    obj = json.loads(path.read_text(encoding="utf-8"))
+    seconds_path = stream_dir / ROLLUP_SECONDS_NAME
+    if seconds_path.exists():
+        obj["second"] = merge_rows(read_second_rows(seconds_path) + obj.get("second", []))
+    return obj
+
+
+def iter_chat(
+    stream_dir: Path,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    with_raw: bool = True,
+) -> Iterator[Dict]:
+    """
+    Yields a stream's chat events in the full layout, whatever schema version and
+    file layout they were written with. `start` / `end` (epoch seconds) filter events
+    and let whole segments be skipped via the manifest.
+    """
+    for path in chat_files(stream_dir, start, end):
+        yield from _iter_file(path, start, end, with_raw)
+
+
+def _iter_file(path: Path, start: Optional[float], end: Optional[float], with_raw: bool) -> Iterator[Dict]:
+    with open_chat_file(path) as fh:
+        line_number = 0
+        try:
+            for line_number, line in enumerate(fh, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    evt = decode_event(json.loads(line), with_raw=with_raw)
+                except ValueError:
+                    # torn line after a crash, or an unknown schema version
+                    print(f"Skipping bad chat line in {path}:{line_number}", file=sys.stderr)
+                    continue
+                if start is not None or end is not None:
+                    ts = evt.get("timestamp_utc")
+                    t = iso_to_epoch(ts) if ts else None
+                    if t is not None and ((start is not None and t < start) or (end is not None and t > end)):
+                        continue
+                yield evt
+        except EOFError:
+            # segment still open for writing (or cut short by a crash)
+            print(f"Truncated chat segment {path} after line {line_number}", file=sys.stderr)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+import os
+import re
+import socketserver
+import sys
+import threading
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from .config import load_config
+
+
+# Twitch logins: 1-25 of [a-z0-9_]; anything else (spaces, CR/LF) must never reach IRC
+CHANNEL_RE = re.compile(r"^[a-z0-9_]{1,25}$")
+
+
+def normalize_channel(name: str) -> Optional[str]:
+    ch = name.strip().lstrip("#").lower()
+    return ch if CHANNEL_RE.match(ch) else None
+
+
+def read_channels_file(path: Path) -> List[str]:
+    out: List[str] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            out.append(line)
+    return out
+
+
+class ChannelRegistry:
+    """
+    The set of tracked channels: config.yaml's streams.channels plus the optional
+    streams.channels_file, hot-reloadable without a restart.
+
+    Every change (file reload, `add` / `remove` from the control socket) is folded
+    into a pending diff that the poll loop picks up with `drain()` and applies as
+    scheduler add/remove plus PARTs for channels that were live. With a
+    channels_file, `add` / `remove` are written back to it so a later reload keeps
+    them (removing a channel listed in config.yaml itself, or any change without a
+    channels_file, lasts until the next reload).
+    """
+
+    def __init__(self, config_path: Path, reload_seconds: float = 10.0):
+        self.config_path = Path(config_path)
+        self.reload_seconds = float(reload_seconds)
+        self.channels_file: Optional[Path] = None
+
+        self._lock = threading.Lock()
+        self._channels: Set[str] = set()
+        self._added: Set[str] = set()
+        self._removed: Set[str] = set()
+        self._mtimes: Tuple[float, float] = (0.0, 0.0)
+        self._reload_requested = False
+        self._checked_at = 0.0
+
+        self._channels = self._load()
+        self._mtimes = self._stat()
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._channels
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+    @property
+    def channels(self) -> Set[str]:
+        with self._lock:
+            return set(self._channels)
+
+    def _load(self) -> Set[str]:
+        streams = load_config(self.config_path).streams
+        self.channels_file = streams.channels_file
+        names = list(streams.channels)
+        if self.channels_file is not None and self.channels_file.exists():
+            names.extend(read_channels_file(self.channels_file))
+        out: Set[str] = set()
+        for name in names:
+            ch = normalize_channel(name)
+            if ch is None:
+                print(f"[registry] ignoring invalid channel {name!r}", file=sys.stderr)
+                continue
+            out.add(ch)
+        return out
+
+    def _stat(self) -> Tuple[float, float]:
+        def mtime(p: Optional[Path]) -> float:
+            try:
+                return os.stat(p).st_mtime if p is not None else 0.0
+            except OSError:
+                return 0.0
+
+        return mtime(self.config_path), mtime(self.channels_file)
+
+    def request_reload(self) -> None:
+        # safe from a signal handler: only sets a flag
+        self._reload_requested = True
+
+    def maybe_reload(self, now: float) -> None:
+        """
+        Reloads when asked to, or when config.yaml / channels_file changed on disk
+        (checked at most every `reload_seconds`).
+        """
+        if not self._reload_requested:
+            if now - self._checked_at < self.reload_seconds:
+                return
+            self._checked_at = now
+            if self._stat() == self._mtimes:
+                return
+        self._reload_requested = False
+        self.reload()
+
+    def reload(self) -> Tuple[int, int]:
+        try:
+            new = self._load()
+        except Exception as e:
+            print(f"[registry] reload failed, keeping {len(self._channels)} channels: {e}", file=sys.stderr)
+            return 0, 0
+        self._mtimes = self._stat()
+        with self._lock:
+            added = new - self._channels
+            removed = self._channels - new
+            self._apply(added, removed)
+        if added or removed:
+            print(f"[registry] reloaded: +{len(added)} -{len(removed)} ({len(new)} channels)")
+        return len(added), len(removed)
+
+    def add(self, names: Iterable[str]) -> Tuple[int, List[str]]:
+        return self._edit(names, add=True)
+
+    def remove(self, names: Iterable[str]) -> Tuple[int, List[str]]:
+        return self._edit(names, add=False)
+
+    def _edit(self, names: Iterable[str], add: bool) -> Tuple[int, List[str]]:
+        valid: Set[str] = set()
+        invalid: List[str] = []
+        for name in names:
+            ch = normalize_channel(name)
+            if ch is None:
+                invalid.append(name)
+            else:
+                valid.add(ch)
+        with self._lock:
+            if add:
+                changed = valid - self._channels
+                self._apply(changed, set())
+            else:
+                changed = valid & self._channels
+                self._apply(set(), changed)
+            if changed and self.channels_file is not None:
+                self._write_channels_file()
+        return len(changed), invalid
+
+    def _apply(self, added: Set[str], removed: Set[str]) -> None:
+        # fold into the pending diff: add-then-remove before a drain cancels out
+        self._channels |= added
+        self._channels -= removed
+        for ch in added:
+            if ch in self._removed:
+                self._removed.discard(ch)
+            else:
+                self._added.add(ch)
+        for ch in removed:
+            if ch in self._added:
+                self._added.discard(ch)
+            else:
+                self._removed.add(ch)
+
+    def _write_channels_file(self) -> None:
+        # everything not already in config.yaml lives in the file
+        assert self.channels_file is not None
+        base = {normalize_channel(c) for c in load_config(self.config_path).streams.channels}
+        lines = sorted(self._channels - base)
+        path = self.channels_file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text("".join(f"{ch}\n" for ch in lines), encoding="utf-8")
+        tmp.replace(path)
+        self._mtimes = self._stat()
+
+    def drain(self) -> Tuple[Set[str], Set[str]]:
+        """
+        Returns and clears (added, removed) since the last drain.
+        """
+        with self._lock:
+            added, removed = self._added, self._removed
+            self._added, self._removed = set(), set()
+        return added, removed
+
+
+class ControlServer:
+    """
+    Line protocol on a local unix socket, one command per connection line:
+      add <channel...>      remove <channel...>      reload      list      count
+    Replies "ok ..." or "error ...". Changes reach the poll loop via the registry.
+    """
+
+    def __init__(self, registry: ChannelRegistry, path: Path):
+        self.registry = registry
+        self.path = Path(path)
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def handle(self, line: str) -> str:
+        parts = line.split()
+        if not parts:
+            return "error empty command"
+        cmd, args = parts[0].lower(), parts[1:]
+        reg = self.registry
+        if cmd in ("add", "remove"):
+            n, invalid = (reg.add if cmd == "add" else reg.remove)(args)
+            msg = f"ok {cmd} {n}"
+            if invalid:
+                msg += " invalid " + " ".join(invalid)
+            return msg
+        if cmd == "reload":
+            added, removed = reg.reload()
+            return f"ok +{added} -{removed}"
+        if cmd == "list":
+            return "ok " + " ".join(sorted(reg.channels))
+        if cmd == "count":
+            return f"ok {len(reg)}"
+        return f"error unknown command {cmd!r}"
+
+    def start(self) -> None:
+        control = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for raw in self.rfile:
+                    reply = control.handle(raw.decode("utf-8", errors="replace"))
+                    self.wfile.write((reply + "\n").encode("utf-8"))
+
+        if self.path.exists():
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._server = socketserver.ThreadingUnixStreamServer(str(self.path), Handler)
+        self._server.daemon_threads = True
+        os.chmod(self.path, 0o600)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="control-socket", daemon=True)
+        self._thread.start()
+        print(f"[registry] control socket at {self.path}")
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+        self._server = None
@@ -0,0 +1,292 @@
+from __future__ import annotations
+import base64
+import json
+import math
+import re
+import threading
+from hashlib import blake2b
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+ROLLUPS_NAME = "rollups.json"
+# per-second rows drained at each checkpoint of a live stream, folded back into
+# rollups.json when it closes
+ROLLUP_SECONDS_NAME = "rollups-seconds.jsonl"
+ROLLUP_FIELDS = ("msgs", "chatters", "bits", "subs", "mentions")
+SUB_EVENT_TYPES = ("sub", "resub", "subgift")
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Approximate distinct counter: 2**p one-byte registers, ~1.04/sqrt(2**p) error
+    (p=10: 3.3% in 1 KiB, p=12: 1.6% in 4 KiB). Hashes are blake2b, so registers
+    written by different processes can be merged.
+    """
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 12, registers: Optional[bytes] = None):
+        if not 4 <= p <= 16:
+            raise ValueError(f"p must be in 4..16, got {p}")
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+        if len(self.registers) != self.m:
+            raise ValueError(f"expected {self.m} registers, got {len(self.registers)}")
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash64(value))
+
+    def add_hash(self, h: int) -> None:
+        bits = 64 - self.p
+        idx = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("cannot merge HyperLogLogs with different p")
+        regs = self.registers
+        for i, r in enumerate(other.registers):
+            if r > regs[i]:
+                regs[i] = r
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        est = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if est <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                est = m * math.log(m / zeros)
+        return int(round(est))
+
+    def to_b64(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def from_b64(cls, p: int, data: str) -> "HyperLogLog":
+        return cls(p, base64.b64decode(data))
+
+
+class _Bucket:
+    __slots__ = ("key", "msgs", "bits", "subs", "mentions", "users")
+
+    def __init__(self, key: int, users):
+        self.key = key
+        self.msgs = 0
+        self.bits = 0
+        self.subs = 0
+        self.mentions = 0
+        self.users = users
+
+    def row(self, base: int, chatters: int) -> List[int]:
+        return [self.key - base, self.msgs, chatters, self.bits, self.subs, self.mentions]
+
+
+class StreamRollup:
+    """
+    Per-stream counters at 1s and 1m resolution, updated as chat and events are
+    written: messages, unique chatters, bits, subs (sub/resub/subgift) and
+    messages mentioning the channel (`@channel` as a whole word).
+
+    Only the current second and minute are open; finished buckets become sparse
+    rows `[offset, msgs, chatters, bits, subs, mentions]` (offset in seconds or
+    minutes from the stream start). Chatters are exact per second and approximate
+    (HyperLogLog) per minute and for the whole stream. Buckets are keyed by the
+    server send time (tmi-sent-ts), or the receive time when a line has none; an
+    event older than the open bucket is counted in it.
+
+    Finished second rows stay in `seconds` only until `drain_seconds` hands them
+    off (Storage appends them to ROLLUP_SECONDS_NAME at each checkpoint), so a long
+    stream does not hold, and rewrite, every second it has seen.
+    """
+
+    def __init__(self, channel: str, started_epoch: float, hll_p: int = 12, minute_hll_p: int = 10):
+        self.channel = channel
+        self.base_s = int(started_epoch)
+        self.base_m = self.base_s // 60
+        self.minute_hll_p = minute_hll_p
+        self._mention = re.compile(r"@" + re.escape(channel) + r"\b", re.I)
+
+        self.seconds: List[List[int]] = []
+        self.minutes: List[List[int]] = []
+        self.totals = {"msgs": 0, "bits": 0, "subs": 0, "mentions": 0}
+        self.chatters = HyperLogLog(hll_p)
+
+        self._sec: Optional[_Bucket] = None
+        self._min: Optional[_Bucket] = None
+        self._lock = threading.Lock()
+
+    def add_chat(self, t: float, user: str, message: str) -> None:
+        mentioned = "@" in message and self._mention.search(message) is not None
+        with self._lock:
+            sec, minute = self._buckets(t)
+            sec.msgs += 1
+            minute.msgs += 1
+            self.totals["msgs"] += 1
+            if user:
+                h = hash64(user)
+                sec.users.add(user)
+                minute.users.add_hash(h)
+                self.chatters.add_hash(h)
+            if mentioned:
+                sec.mentions += 1
+                minute.mentions += 1
+                self.totals["mentions"] += 1
+
+    def add_event(self, t: float, event: Dict) -> None:
+        etype = event.get("type")
+        bits = int(event.get("bits") or 0) if etype == "bits" else 0
+        subs = 1 if etype in SUB_EVENT_TYPES else 0
+        if not bits and not subs:
+            return
+        with self._lock:
+            sec, minute = self._buckets(t)
+            for b in (sec, minute):
+                b.bits += bits
+                b.subs += subs
+            self.totals["bits"] += bits
+            self.totals["subs"] += subs
+
+    def _buckets(self, t: float):
+        s = int(t)
+        sec = self._sec
+        if sec is None or s > sec.key:
+            if sec is not None:
+                self._close(self.seconds, sec.row(self.base_s, len(sec.users)))
+            sec = self._sec = _Bucket(s, set())
+        m = s // 60
+        minute = self._min
+        if minute is None or m > minute.key:
+            if minute is not None:
+                self._close(self.minutes, minute.row(self.base_m, minute.users.estimate()))
+            minute = self._min = _Bucket(m, HyperLogLog(self.minute_hll_p))
+        return sec, minute
+
+    @staticmethod
+    def _close(rows: List[List[int]], row: List[int]) -> None:
+        last = rows[-1] if rows else None
+        if last is not None and last[0] == row[0]:
+            # same bucket again after a restart: counts add up, chatters can only be bounded
+            rows[-1] = [row[0]] + [a + b for a, b in zip(last[1:], row[1:])]
+            rows[-1][2] = max(last[2], row[2])
+        else:
+            rows.append(row)
+
+    def drain_seconds(self) -> List[List[int]]:
+        """
+        Takes the finished second rows; the open second is not included.
+        """
+        with self._lock:
+            rows, self.seconds = self.seconds, []
+            return rows
+
+    def to_dict(self) -> Dict:
+        """
+        Snapshot including the still-open second and minute. "second" holds only
+        rows not yet drained.
+        """
+        with self._lock:
+            seconds = list(self.seconds)
+            minutes = list(self.minutes)
+            if self._sec is not None:
+                self._close(seconds, self._sec.row(self.base_s, len(self._sec.users)))
+            if self._min is not None:
+                self._close(minutes, self._min.row(self.base_m, self._min.users.estimate()))
+            totals = dict(self.totals, chatters=self.chatters.estimate())
+            return {
+                "version": 1,
+                "channel": self.channel,
+                "start_epoch": self.base_s,
+                "fields": ["offset"] + list(ROLLUP_FIELDS),
+                "second": seconds,
+                "minute": minutes,
+                "totals": totals,
+                "chatters_hll": {"p": self.chatters.p, "registers": self.chatters.to_b64()},
+            }
+
+    @classmethod
+    def from_dict(cls, obj: Dict) -> "StreamRollup":
+        """
+        Resumes a checkpoint, e.g. when a restarted collector reopens the same stream.
+        """
+        hll = obj.get("chatters_hll") or {}
+        rollup = cls(obj.get("channel", ""), obj.get("start_epoch", 0), hll_p=hll.get("p", 12))
+        rollup.seconds = [list(r) for r in obj.get("second", [])]
+        rollup.minutes = [list(r) for r in obj.get("minute", [])]
+        for k in rollup.totals:
+            rollup.totals[k] = int((obj.get("totals") or {}).get(k, 0))
+        if hll.get("registers"):
+            rollup.chatters = HyperLogLog.from_b64(rollup.chatters.p, hll["registers"])
+        return rollup
+
+
+def merge_rows(rows: List[List[int]]) -> List[List[int]]:
+    """
+    Orders rows by offset and folds repeats of a bucket (a restart reopening it)
+    the way StreamRollup does.
+    """
+    out: List[List[int]] = []
+    for row in sorted(rows, key=lambda r: r[0]):
+        StreamRollup._close(out, list(row))
+    return out
+
+
+def append_second_rows(path: Path, rows: List[List[int]]) -> None:
+    if not rows:
+        return
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write("".join(json.dumps(row, separators=(",", ":")) + "\n" for row in rows))
+
+
+def read_second_rows(path: Path) -> List[List[int]]:
+    if not path.exists():
+        return []
+    rows = []
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # torn last line after a crash
+                continue
+    return rows
+
+
+def rollup_rows(obj: Dict, resolution: str = "second") -> List[Dict]:
+    """
+    Expands one resolution of a rollups.json object into dicts with an absolute
+    `epoch` (start of the bucket) and one key per field.
+    """
+    step = 1 if resolution == "second" else 60
+    base = obj["start_epoch"] if step == 1 else (obj["start_epoch"] // 60) * 60
+    out = []
+    for row in obj.get(resolution, []):
+        item = {"epoch": base + row[0] * step}
+        item.update(zip(ROLLUP_FIELDS, row[1:]))
+        out.append(item)
+    return out
+
+
+def unique_chatters(objs: List[Dict]) -> int:
+    """
+    Approximate distinct chatters across several streams' rollups.
+    """
+    merged: Optional[HyperLogLog] = None
+    for obj in objs:
+        hll = obj.get("chatters_hll") or {}
+        if not hll.get("registers"):
+            continue
+        part = HyperLogLog.from_b64(hll["p"], hll["registers"])
+        if merged is None:
+            merged = part
+        else:
+            merged.merge(part)
+    return merged.estimate() if merged is not None else 0
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import json
+import math
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from .helix import RateLimit
+
+
+HOURS_PER_WEEK = 24 * 7
+
+
+def hour_of_week(ts: float) -> int:
+    dt = datetime.fromtimestamp(ts, timezone.utc)
+    return dt.weekday() * 24 + dt.hour
+
+
+class PollScheduler:
+    """
+    Decides which channels to include in each Helix /streams poll.
+
+    Every channel has its own next-poll time:
+      live channels     every `live_interval_s` (snapshots + offline detection)
+      offline, near a   every `min_interval_s`, when the current hour-of-week (+-1h) holds
+      usual go-live     at least `hot_share` of the channel's recorded go-lives
+      offline, other    every `live_interval_s`, or `max_interval_s` once the last
+                        go-live (or, never live, the first poll) is older than `dormant_days`
+
+    Requests are spread over the Helix rate-limit window: each tick may spend only its
+    share of the remaining points (minus `reserve`) until the window resets, and overdue
+    channels queue up for later ticks instead of bursting into 429s.
+
+    Go-live history (hour-of-week histogram + last go-live) persists to `history_path`.
+    All methods take `now` so the schedule can be driven by a fake clock.
+    """
+
+    def __init__(
+        self,
+        channels: Iterable[str],
+        live_interval_s: float = 60,
+        min_interval_s: float = 15,
+        max_interval_s: float = 600,
+        tick_s: float = 5,
+        batch_size: int = 100,
+        reserve: int = 10,
+        hot_share: float = 0.1,
+        dormant_days: float = 14,
+        history_path: Optional[Path] = None,
+    ):
+        self.live_interval_s = float(live_interval_s)
+        self.min_interval_s = min(float(min_interval_s), self.live_interval_s)
+        self.max_interval_s = max(float(max_interval_s), self.live_interval_s)
+        self.tick_s = float(tick_s)
+        self.batch_size = max(1, int(batch_size))
+        self.reserve = max(0, int(reserve))
+        self.hot_share = float(hot_share)
+        self.dormant_s = float(dormant_days) * 86400
+        self.history_path = history_path
+
+        self.rate_limit = RateLimit()
+        self._next: Dict[str, float] = {}
+        self._live: Set[str] = set()
+        # channel -> {"hours": [168 go-live counts], "last_live": epoch, "first_seen": epoch}
+        self._history: Dict[str, Dict] = {}
+        self._load_history()
+
+        for ch in channels:
+            self.add(ch)
+
+    @property
+    def channels(self) -> Set[str]:
+        return set(self._next)
+
+    def add(self, channel: str, now: float = 0.0) -> None:
+        # new channels are due immediately
+        self._next.setdefault(channel, now)
+
+    def remove(self, channel: str) -> None:
+        self._next.pop(channel, None)
+        self._live.discard(channel)
+
+    def note_rate_limit(self, rl: RateLimit) -> None:
+        self.rate_limit = rl
+
+    def budget(self, now: float) -> int:
+        """
+        Helix requests this tick may spend.
+        """
+        rl = self.rate_limit
+        if rl.updated_at == 0.0 or now >= rl.reset:
+            # no headers yet, or the window has refilled
+            return max(1, rl.limit - self.reserve)
+        spendable = rl.remaining - self.reserve
+        if spendable <= 0:
+            return 0
+        ticks_left = max(1.0, (rl.reset - now) / self.tick_s)
+        return max(1, math.floor(spendable / ticks_left))
+
+    def due(self, now: float) -> List[str]:
+        """
+        Channels to poll now, most overdue first, capped by the rate-limit budget.
+        """
+        ready = [(t, ch) for ch, t in self._next.items() if t <= now]
+        if not ready:
+            return []
+        ready.sort()
+        cap = self.budget(now) * self.batch_size
+        return [ch for _, ch in ready[:cap]]
+
+    def next_wakeup(self, now: float) -> float:
+        if not self._next or not self.budget(now):
+            return now + self.tick_s
+        return max(now, min(min(self._next.values()), now + self.tick_s))
+
+    def record(self, polled: Iterable[str], live_started: Dict[str, float], now: float) -> None:
+        """
+        Updates schedules after a poll. `live_started` maps each live polled channel
+        to its stream's started_at (epoch seconds).
+        """
+        history_changed = False
+        for ch in polled:
+            if ch not in self._next:
+                continue
+            if ch not in self._history:
+                self._history[ch] = {"hours": [0] * HOURS_PER_WEEK, "last_live": 0.0, "first_seen": now}
+                history_changed = True
+            started = live_started.get(ch)
+            if started is not None:
+                if ch not in self._live:
+                    self._live.add(ch)
+                    history_changed |= self._note_go_live(ch, started)
+                self._next[ch] = now + self.live_interval_s
+            else:
+                self._live.discard(ch)
+                self._next[ch] = now + self.offline_interval(ch, now)
+        if history_changed:
+            self._save_history()
+
+    def offline_interval(self, channel: str, now: float) -> float:
+        h = self._history.get(channel)
+        if not h:
+            return self.live_interval_s
+        hours = h["hours"]
+        total = sum(hours)
+        if total:
+            how = hour_of_week(now)
+            near = hours[(how - 1) % HOURS_PER_WEEK] + hours[how] + hours[(how + 1) % HOURS_PER_WEEK]
+            if near / total >= self.hot_share:
+                return self.min_interval_s
+        # never slower than the fixed poll outside hot hours, until the channel goes quiet
+        if now - max(h["last_live"], h.get("first_seen", now)) >= self.dormant_s:
+            return self.max_interval_s
+        return self.live_interval_s
+
+    def _note_go_live(self, channel: str, started: float) -> bool:
+        h = self._history.setdefault(
+            channel, {"hours": [0] * HOURS_PER_WEEK, "last_live": 0.0, "first_seen": started}
+        )
+        if started <= h["last_live"]:
+            # same stream seen again, e.g. after a collector restart
+            return False
+        h["hours"][hour_of_week(started)] += 1
+        h["last_live"] = started
+        return True
+
+    def _load_history(self) -> None:
+        path = self.history_path
+        if not path or not path.exists():
+            return
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for ch, h in data.items():
+            hours = list(h.get("hours", []))
+            if len(hours) == HOURS_PER_WEEK:
+                last_live = float(h.get("last_live", 0.0))
+                self._history[ch] = {
+                    "hours": hours,
+                    "last_live": last_live,
+                    "first_seen": float(h.get("first_seen", last_live)),
+                }
+
+    def _save_history(self) -> None:
+        path = self.history_path
+        if not path:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self._history, separators=(",", ":")) + "\n", encoding="utf-8")
+        tmp.replace(path)
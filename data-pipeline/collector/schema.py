@@ -0,0 +1,180 @@
+from __future__ import annotations
+import json
+from typing import Callable, Dict, Optional, Union
+
+from .irc import IRCRecord, parse_irc_bytes
+from .util import iso_to_epoch, ms_to_iso
+
+
+# On-disk chat line layouts. Every non-legacy line carries its schema version in "v".
+#
+#   full    (v1, no "v" key)  {"type", "timestamp_utc", "sent_ms", "recv_ms", "channel", "user", "message",
+#                              "tags", "raw"}  (sent_ms / recv_ms only in newer files)
+#   raw     (v2)              {"v": 2, "t": <recv epoch s>, "r": <raw IRC line>}
+#                             fields and tags are parsed from "r" on read
+#   compact (v3)              {"v": 3, "t": <recv epoch s>, "c": channel, "u": user, "m": message,
+#                              "g": {<tag>: value}} with common tag names interned to short keys
+#
+# "t" is our receive time at millisecond precision; the server time travels in the
+# tmi-sent-ts tag, and decoded events take timestamp_utc from it when present.
+
+CHAT_SCHEMAS = ("full", "raw", "compact")
+SCHEMA_VERSIONS = {"full": 1, "raw": 2, "compact": 3}
+
+# Interned Twitch tag names. Short keys only ever appear inside "g", never collide with
+# real tag names, and must never be reassigned (append new ones instead).
+TAG_KEYS: Dict[str, str] = {
+    "badge-info": "a",
+    "badges": "b",
+    "bits": "B",
+    "client-nonce": "n",
+    "color": "c",
+    "display-name": "d",
+    "emote-only": "E",
+    "emotes": "e",
+    "first-msg": "f",
+    "flags": "F",
+    "id": "i",
+    "mod": "m",
+    "reply-parent-msg-id": "R",
+    "returning-chatter": "r",
+    "room-id": "o",
+    "subscriber": "s",
+    "tmi-sent-ts": "t",
+    "turbo": "T",
+    "user-id": "u",
+    "user-type": "y",
+    "vip": "v",
+}
+TAG_NAMES: Dict[str, str] = {v: k for k, v in TAG_KEYS.items()}
+
+EventLike = Union[Dict, IRCRecord]
+
+
+def _fields(evt: EventLike):
+    if isinstance(evt, IRCRecord):
+        return evt.recv_ms / 1000, evt.channel, evt.user, evt.message, evt.tags
+    ts = evt.get("timestamp_utc")
+    return (
+        iso_to_epoch(ts) if ts else None,
+        evt.get("channel", ""),
+        evt.get("user", ""),
+        evt.get("message", ""),
+        evt.get("tags") or {},
+    )
+
+
+def _encode_full(evt: EventLike) -> str:
+    return json.dumps(evt.to_dict() if isinstance(evt, IRCRecord) else evt, ensure_ascii=False)
+
+
+def _encode_raw(evt: EventLike) -> str:
+    if isinstance(evt, IRCRecord):
+        t, raw = evt.recv_ms / 1000, evt.raw
+    else:
+        t, raw = _fields(evt)[0], evt.get("raw", "")
+    return json.dumps({"v": 2, "t": round(t, 3) if t is not None else None, "r": raw}, ensure_ascii=False)
+
+
+def _encode_compact(evt: EventLike) -> str:
+    keys = TAG_KEYS
+    if isinstance(evt, IRCRecord) and evt._tags is None:
+        # intern straight from the tag bytes instead of building evt.tags first
+        t, channel, user, message = evt.recv_ms / 1000, evt.channel, evt.user, evt.message
+        g = {}
+        raw_tags = evt.raw_tags
+        if raw_tags:
+            for part in raw_tags.decode("utf-8", errors="replace").split(";"):
+                k, _, v = part.partition("=")
+                g[keys.get(k, k)] = v
+    else:
+        t, channel, user, message, tags = _fields(evt)
+        g = {keys.get(k, k): v for k, v in tags.items()}
+    return json.dumps(
+        {"v": 3, "t": round(t, 3) if t is not None else None, "c": channel, "u": user, "m": message, "g": g},
+        ensure_ascii=False,
+    )
+
+
+_ENCODERS: Dict[str, Callable[[EventLike], str]] = {
+    "full": _encode_full,
+    "raw": _encode_raw,
+    "compact": _encode_compact,
+}
+
+
+def chat_encoder(schema: str) -> Callable[[EventLike], str]:
+    """
+    Returns a function that serializes one chat event to a JSON line (no newline).
+    """
+    try:
+        return _ENCODERS[schema]
+    except KeyError:
+        raise ValueError(f"chat schema must be one of {CHAT_SCHEMAS}, got {schema!r}") from None
+
+
+def decode_event(obj: Dict, with_raw: bool = True) -> Dict:
+    """
+    Turns one decoded JSON chat line of any schema version back into the full layout.
+    For compact lines `raw` is rebuilt from the fields unless `with_raw` is False.
+    """
+    v = obj.get("v")
+    if v is None:
+        return obj
+
+    if v == 2:
+        rec = parse_irc_bytes(obj["r"].encode("utf-8"), recv_ms=_recv_ms(obj) or 0)
+        if rec is None:
+            return {"type": "UNKNOWN", "timestamp_utc": _ts(obj, None), "raw": obj["r"]}
+        evt = rec.to_dict()
+        if obj.get("t") is None:
+            evt["recv_ms"] = None
+            if evt["sent_ms"] is None:
+                evt["timestamp_utc"] = None
+        if not with_raw:
+            evt.pop("raw", None)
+        return evt
+
+    if v == 3:
+        names = TAG_NAMES
+        tags = {names.get(k, k): val for k, val in (obj.get("g") or {}).items()}
+        sent_ms = _int(tags.get("tmi-sent-ts"))
+        evt = {
+            "type": "PRIVMSG",
+            "timestamp_utc": _ts(obj, sent_ms),
+            "sent_ms": sent_ms,
+            "recv_ms": _recv_ms(obj),
+            "channel": obj.get("c", ""),
+            "user": obj.get("u", ""),
+            "message": obj.get("m", ""),
+            "tags": tags,
+        }
+        if with_raw:
+            evt["raw"] = _rebuild_raw(evt)
+        return evt
+
+    raise ValueError(f"unknown chat schema version {v!r}")
+
+
+def _int(v) -> Optional[int]:
+    try:
+        return int(v) if v else None
+    except ValueError:
+        return None
+
+
+def _recv_ms(obj: Dict) -> Optional[int]:
+    t = obj.get("t")
+    return round(t * 1000) if t is not None else None
+
+
+def _ts(obj: Dict, sent_ms: Optional[int]):
+    ms = sent_ms if sent_ms is not None else _recv_ms(obj)
+    return ms_to_iso(ms) if ms is not None else None
+
+
+def _rebuild_raw(evt: Dict) -> str:
+    user = evt["user"]
+    tags = ";".join(f"{k}={v}" for k, v in evt["tags"].items())
+    head = f"@{tags} " if tags else ""
+    return f"{head}:{user}!{user}@{user}.tmi.twitch.tv PRIVMSG #{evt['channel']} :{evt['message']}"
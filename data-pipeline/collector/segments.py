@@ -0,0 +1,274 @@
+from __future__ import annotations
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .handles import HandlePool, PooledFile
+from .schema import decode_event
+from .util import epoch_to_iso, iso_to_epoch
+
+
+try:  # Python 3.14+
+    from compression import zstd as _zstd  # type: ignore[import-not-found]
+except ImportError:
+    _zstd = None
+
+
+MANIFEST_NAME = "segments.json"
+SEGMENT_CODECS = ("gzip", "zstd", "none")
+_SUFFIX = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst", "none": ".jsonl"}
+
+# rewrite the manifest for the open segment at most this often
+MANIFEST_REFRESH_S = 10.0
+
+
+def codec_available(codec: str) -> bool:
+    return codec in ("gzip", "none") or (codec == "zstd" and _zstd is not None)
+
+
+def open_chat_file(path: Path):
+    """
+    Opens any chat file (chat.jsonl or a segment) for binary line reads.
+    """
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.name.endswith(".zst"):
+        if _zstd is None:
+            raise RuntimeError(f"{path}: zstd segments need Python 3.14+")
+        return _zstd.open(path, "rb")
+    return path.open("rb")
+
+
+def _open_append(path: Path, pool: Optional[HandlePool], buffering: int = 1 << 16):
+    # pooled files keep their buffer while the descriptor is closed for a cold stream
+    if pool is None:
+        return path.open("ab", buffering=buffering)
+    return PooledFile(path, pool, buffer_size=buffering)
+
+
+class PlainChatFile:
+    """
+    Single append-only chat.jsonl, the original layout.
+    """
+
+    def __init__(self, path: Path, buffering: int = 1 << 16, pool: Optional[HandlePool] = None):
+        self.path = path
+        self._fh = _open_append(path, pool, buffering)
+
+    def write_batch(self, data: bytes, lines: int, min_ts: Optional[float], max_ts: Optional[float]) -> None:
+        self._fh.write(data)
+
+    def flush(self, sync: bool = False) -> None:
+        self._fh.flush()
+
+    def fileno(self) -> int:
+        return self._fh.fileno()
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class SegmentedChatFile:
+    """
+    Chat sink that writes compressed `chat-NNNNN.jsonl.<ext>` segments in a stream
+    directory, starting a new one once the current segment holds `max_bytes` of
+    uncompressed JSONL or has been open `max_seconds`. With a HandlePool the segment's
+    descriptor may be closed between batches; the compressor keeps writing one stream
+    into the reopened file.
+
+    `segments.json` lists every segment with its on-disk and raw byte sizes, line
+    count and min/max event timestamp, so readers can skip segments by time range.
+    It is rewritten atomically on rotation, on close, and periodically while open.
+
+    `flush()` hands the OS only the blocks the compressor has finished; its tail
+    stays buffered, since a sync flush after every small batch inflates quiet
+    channels' segments up to ~2x. `flush(sync=True)` (before an fsync) and closing
+    or rotating a segment write out everything. A crash can lose the unflushed
+    tail; the torn end is cut off on recovery.
+    """
+
+    def __init__(
+        self,
+        stream_dir: Path,
+        codec: str = "gzip",
+        max_bytes: int = 256 * 1024 * 1024,
+        max_seconds: float = 3600,
+        level: Optional[int] = None,
+        pool: Optional[HandlePool] = None,
+    ):
+        if codec not in SEGMENT_CODECS:
+            raise ValueError(f"codec must be one of {SEGMENT_CODECS}, got {codec!r}")
+        if not codec_available(codec):
+            raise RuntimeError(f"codec {codec!r} is not available in this Python build")
+        self.stream_dir = stream_dir
+        self.codec = codec
+        self.max_bytes = max(1, int(max_bytes))
+        self.max_seconds = max(1.0, float(max_seconds))
+        self.level = level
+        self.pool = pool
+        self.manifest_path = stream_dir / MANIFEST_NAME
+
+        self._segments: List[Dict] = self._load_manifest()
+        self._raw = None
+        self._fh = None
+        self._cur: Optional[Dict] = None
+        self._opened_at = 0.0
+        self._manifest_written_at = 0.0
+        self._open_segment()
+
+    def write_batch(self, data: bytes, lines: int, min_ts: Optional[float], max_ts: Optional[float]) -> None:
+        cur = self._cur
+        if cur is None:
+            raise ValueError("write to closed SegmentedChatFile")
+        if cur["lines"] and (
+            cur["raw_bytes"] + len(data) > self.max_bytes or time.time() - self._opened_at >= self.max_seconds
+        ):
+            self._rotate()
+            cur = self._cur
+            assert cur is not None
+
+        self._fh.write(data)
+        cur["raw_bytes"] += len(data)
+        cur["lines"] += lines
+        if min_ts is not None:
+            if cur["min_epoch"] is None or min_ts < cur["min_epoch"]:
+                cur["min_epoch"] = min_ts
+            if cur["max_epoch"] is None or max_ts > cur["max_epoch"]:
+                cur["max_epoch"] = max_ts
+
+    def flush(self, sync: bool = False) -> None:
+        if self._fh is None:
+            return
+        if sync or self._fh is self._raw:
+            self._fh.flush()
+        self._raw.flush()
+        if time.monotonic() - self._manifest_written_at >= MANIFEST_REFRESH_S:
+            self._write_manifest()
+
+    def fileno(self) -> int:
+        return self._raw.fileno()
+
+    def close(self) -> None:
+        if self._fh is None:
+            return
+        self._close_segment()
+        self._write_manifest()
+
+    def _open_segment(self) -> None:
+        index = max((s["index"] for s in self._segments), default=0) + 1
+        name = f"chat-{index:05d}{_SUFFIX[self.codec]}"
+        self._raw = _open_append(self.stream_dir / name, self.pool)
+        if self.codec == "gzip":
+            self._fh = gzip.GzipFile(fileobj=self._raw, mode="ab", compresslevel=self.level or 6)
+        elif self.codec == "zstd":
+            self._fh = _zstd.ZstdFile(self._raw, mode="a", level=self.level)
+        else:
+            self._fh = self._raw
+        self._opened_at = time.time()
+        self._cur = {
+            "index": index,
+            "file": name,
+            "codec": self.codec,
+            "bytes": 0,
+            "raw_bytes": 0,
+            "lines": 0,
+            "min_epoch": None,
+            "max_epoch": None,
+            "opened_at": epoch_to_iso(self._opened_at),
+            "closed_at": None,
+        }
+        self._segments.append(self._cur)
+        self._write_manifest()
+
+    def _close_segment(self) -> None:
+        cur = self._cur
+        if self._fh is not self._raw:
+            self._fh.close()
+        self._raw.close()
+        self._fh = None
+        self._raw = None
+        if cur is not None:
+            cur["closed_at"] = epoch_to_iso(time.time())
+            cur["bytes"] = (self.stream_dir / cur["file"]).stat().st_size
+        self._cur = None
+
+    def _rotate(self) -> None:
+        self._close_segment()
+        self._open_segment()
+
+    def _load_manifest(self) -> List[Dict]:
+        # a restarted collector reopening the same stream keeps the earlier segments
+        if not self.manifest_path.exists():
+            return []
+        try:
+            segments = json.loads(self.manifest_path.read_text(encoding="utf-8")).get("segments", [])
+        except (OSError, ValueError):
+            return []
+        for seg in segments:
+            seg["min_epoch"] = seg.pop("min_ts_epoch", None)
+            seg["max_epoch"] = seg.pop("max_ts_epoch", None)
+            seg.pop("min_ts", None)
+            seg.pop("max_ts", None)
+            if seg.get("closed_at") is None:
+                # unclean shutdown: the manifest entry is stale; this writer starts a new
+                # segment, so close that one from what actually reached the disk
+                _recover_segment(self.stream_dir / seg["file"], seg)
+        return segments
+
+    def _write_manifest(self) -> None:
+        if self._cur is not None and self._raw is not None:
+            self._cur["bytes"] = self._raw.tell()
+        out = []
+        for seg in self._segments:
+            row = {k: v for k, v in seg.items() if k not in ("min_epoch", "max_epoch")}
+            row["min_ts"] = epoch_to_iso(seg["min_epoch"]) if seg["min_epoch"] is not None else None
+            row["max_ts"] = epoch_to_iso(seg["max_epoch"]) if seg["max_epoch"] is not None else None
+            row["min_ts_epoch"] = seg["min_epoch"]
+            row["max_ts_epoch"] = seg["max_epoch"]
+            out.append(row)
+        manifest = {"version": 1, "segments": out}
+        tmp = self.manifest_path.with_suffix(self.manifest_path.suffix + ".tmp")
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+        self._manifest_written_at = time.monotonic()
+
+
+def _recover_segment(path: Path, seg: Dict) -> None:
+    """
+    Recounts a segment left open by a crash: on-disk and raw size, lines and event
+    time range up to the last readable line (a torn compressed tail is cut off),
+    and closes it at the file's mtime with `recovered` set.
+    """
+    seg.update(bytes=0, raw_bytes=0, lines=0, min_epoch=None, max_epoch=None, recovered=True)
+    if not path.exists():
+        seg["closed_at"] = epoch_to_iso(time.time())
+        return
+    st = path.stat()
+    seg["bytes"] = st.st_size
+    seg["closed_at"] = epoch_to_iso(st.st_mtime)
+    try:
+        with open_chat_file(path) as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                seg["raw_bytes"] += len(line)
+                if not line.strip():
+                    continue
+                seg["lines"] += 1
+                try:
+                    ts = decode_event(json.loads(line), with_raw=False).get("timestamp_utc")
+                except (ValueError, KeyError, TypeError):
+                    continue
+                if not ts:
+                    continue
+                t = iso_to_epoch(ts)
+                if seg["min_epoch"] is None or t < seg["min_epoch"]:
+                    seg["min_epoch"] = t
+                if seg["max_epoch"] is None or t > seg["max_epoch"]:
+                    seg["max_epoch"] = t
+    except Exception:
+        # torn compressed tail (gzip EOFError, zstd errors): keep what was read
+        pass
@@ -1,10 +1,21 @@
 from __future__ import annotations
 import json
-from dataclasses import dataclass
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Union
 
-from .util import iso_to_folder, safe_name
+from .config import StorageCfg
+from .handles import HandlePool, PooledFile
+from .irc import IRCRecord
+from .rollups import ROLLUP_SECONDS_NAME, ROLLUPS_NAME, StreamRollup, append_second_rows, merge_rows, read_second_rows
+from .schema import SCHEMA_VERSIONS, chat_encoder
+from .segments import PlainChatFile, SegmentedChatFile
+from .telemetry import REGISTRY
+from .util import iso_to_epoch, iso_to_folder, safe_name
+from .writer import ChatWriter
 
 
 @dataclass
@@ -21,13 +32,42 @@ class ActiveStream:
     meta_path: Path
     snapshots_path: Path
 
-    chat_fh: object
-    snapshots_fh: object
+    chat_writer: ChatWriter
+    snapshots_fh: PooledFile
+
+    # IRC disconnect windows during this stream (also in gaps.jsonl, opened on the first one)
+    gaps: List[Dict] = field(default_factory=list)
+    gaps_fh: Optional[PooledFile] = None
+
+    # typed sub / raid / bits events (events.jsonl), opened on the first one
+    events_fh: Optional[PooledFile] = None
+    events: int = 0
+
+    # live 1s / 1m rollups when storage.rollups is on
+    rollup: Optional[StreamRollup] = None
+    rollup_saved_at: float = 0.0
+
+    # set when a close is queued behind the stream's pending chat
+    closing: bool = False
 
 
 class Storage:
-    def __init__(self, data_root: Path):
+    def __init__(self, data_root: Path, cfg: Optional[StorageCfg] = None):
         self.data_root = data_root
+        self.cfg = cfg or StorageCfg()
+        # every stream file's descriptor comes from here, so thousands of live
+        # streams stay under ulimit -n (cfg.max_open_files)
+        self.handles = HandlePool(self.cfg.max_open_files)
+        handles = self.handles
+        REGISTRY.gauge(
+            "collector_open_files", "Stream files currently holding a descriptor.", fn=lambda: handles.open_count
+        )
+
+        # stream_dir -> open stream, for time-based flushes
+        self._streams: Dict[Path, ActiveStream] = {}
+        self._streams_lock = threading.Lock()
+        self._flusher_stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
 
     def ensure_root(self) -> None:
         self.data_root.mkdir(parents=True, exist_ok=True)
@@ -51,9 +91,26 @@ class Storage:
         snapshots_path = sdir / "stream_snapshots.jsonl"
         meta_path = sdir / "meta.json"
 
-        # Line-buffered so each \n flushes, without fsync per line
-        chat_fh = chat_path.open("a", encoding="utf-8", buffering=1)
-        snapshots_fh = snapshots_path.open("a", encoding="utf-8", buffering=1)
+        # Chat goes through the group-commit writer; snapshots are rare, flush each one
+        if self.cfg.chat_layout == "segments":
+            chat_sink = SegmentedChatFile(
+                sdir,
+                codec=self.cfg.segment_codec,
+                max_bytes=self.cfg.segment_max_mb * 1024 * 1024,
+                max_seconds=self.cfg.segment_max_minutes * 60,
+                pool=self.handles,
+            )
+        else:
+            chat_sink = PlainChatFile(chat_path, pool=self.handles)
+        chat_writer = ChatWriter(
+            chat_sink,
+            max_events=self.cfg.batch_max_events,
+            max_delay_ms=self.cfg.batch_max_ms,
+            durability=self.cfg.durability,
+            fsync_interval_ms=self.cfg.fsync_interval_ms,
+            encode=chat_encoder(self.cfg.chat_schema),
+        )
+        snapshots_fh = PooledFile(snapshots_path, self.handles)
 
         meta = {
             "channel": channel,
@@ -63,10 +120,12 @@ class Storage:
             "title": info.get("title", ""),
             "game_name": info.get("game_name", ""),
             "viewer_count": info.get("viewer_count", 0),
+            "chat_layout": self.cfg.chat_layout,
+            "chat_schema": SCHEMA_VERSIONS[self.cfg.chat_schema],
         }
         self._atomic_write_json(meta_path, meta)
 
-        return ActiveStream(
+        stream = ActiveStream(
             channel=channel,
             started_at=started_at,
             user_id=info.get("user_id", ""),
@@ -77,31 +136,72 @@ class Storage:
             chat_path=chat_path,
             meta_path=meta_path,
             snapshots_path=snapshots_path,
-            chat_fh=chat_fh,
+            chat_writer=chat_writer,
             snapshots_fh=snapshots_fh,
         )
+        if self.cfg.rollups:
+            stream.rollup = self._load_rollup(stream)
+            stream.rollup_saved_at = time.monotonic()
+        with self._streams_lock:
+            self._streams[sdir] = stream
+        return stream
+
+    def append_chat(self, stream: ActiveStream, evt: Union[Dict, IRCRecord]) -> None:
+        stream.chat_writer.append(evt)
+        if stream.rollup is not None:
+            if isinstance(evt, IRCRecord):
+                t = evt.time_ms / 1000.0
+            else:
+                t = iso_to_epoch(evt["timestamp_utc"]) if evt.get("timestamp_utc") else time.time()
+            stream.rollup.add_chat(t, evt.get("user", ""), evt.get("message", ""))
 
-    def append_chat(self, stream: ActiveStream, evt: Dict) -> None:
-        stream.chat_fh.write(json.dumps(evt, ensure_ascii=False) + "\n")
+    def append_event(self, stream: ActiveStream, event: Dict) -> None:
+        if stream.events_fh is None:
+            stream.events_fh = PooledFile(stream.stream_dir / "events.jsonl", self.handles)
+        stream.events_fh.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+        stream.events_fh.flush()
+        stream.events += 1
+        if stream.rollup is not None:
+            ts = event.get("timestamp_utc")
+            stream.rollup.add_event(iso_to_epoch(ts) if ts else time.time(), event)
 
     def append_snapshot(self, stream: ActiveStream, snap: Dict) -> None:
-        stream.snapshots_fh.write(json.dumps(snap, ensure_ascii=False) + "\n")
+        stream.snapshots_fh.write((json.dumps(snap, ensure_ascii=False) + "\n").encode("utf-8"))
+        stream.snapshots_fh.flush()
+
+    def append_gap(self, stream: ActiveStream, gap: Dict) -> None:
+        """
+        Records a window with no chat coverage, e.g. an IRC disconnect. Written right
+        away (gaps are rare) so a crash later in the stream does not lose them.
+        """
+        stream.gaps.append(gap)
+        if stream.gaps_fh is None:
+            stream.gaps_fh = PooledFile(stream.stream_dir / "gaps.jsonl", self.handles)
+        stream.gaps_fh.write((json.dumps(gap, ensure_ascii=False) + "\n").encode("utf-8"))
+        stream.gaps_fh.flush()
 
     def close_stream(self, stream: ActiveStream, ended_at: str, last_meta: Optional[Dict] = None) -> None:
-        # Close chat
-        try:
-            stream.chat_fh.flush()
-            stream.chat_fh.close()
-        except Exception:
-            pass
+        with self._streams_lock:
+            self._streams.pop(stream.stream_dir, None)
 
-        # Close snapshots
+        # Drain pending chat batch, then close
         try:
-            stream.snapshots_fh.flush()
-            stream.snapshots_fh.close()
+            stream.chat_writer.close()
         except Exception:
             pass
 
+        if stream.rollup is not None:
+            self.save_rollup(stream, final=True)
+
+        # Close snapshots / events / gaps
+        for fh in (stream.snapshots_fh, stream.events_fh, stream.gaps_fh):
+            if fh is None:
+                continue
+            try:
+                fh.close()
+            except Exception:
+                pass
+
         meta = {
             "channel": stream.channel,
             "user_id": stream.user_id,
@@ -110,12 +210,88 @@ class Storage:
             "title": stream.title,
             "game_name": stream.game_name,
             "viewer_count": stream.viewer_count,
+            "chat_layout": self.cfg.chat_layout,
+            "chat_schema": SCHEMA_VERSIONS[self.cfg.chat_schema],
+            "events": stream.events,
+            "gaps": len(stream.gaps),
+            "gap_seconds": round(sum(g.get("duration_s") or 0.0 for g in stream.gaps), 3),
         }
         if last_meta:
             meta.update(last_meta)
 
         self._atomic_write_json(stream.meta_path, meta)
 
+    def flush_due(self) -> None:
+        """
+        Flushes every stream whose pending chat batch has hit its time threshold,
+        and checkpoints rollups every `rollup_checkpoint_s`.
+        """
+        now = time.monotonic()
+        with self._streams_lock:
+            streams = list(self._streams.values())
+        for stream in streams:
+            try:
+                stream.chat_writer.flush_if_due(now)
+            except Exception:
+                pass
+            if stream.rollup is not None and now - stream.rollup_saved_at >= self.cfg.rollup_checkpoint_s:
+                try:
+                    self.save_rollup(stream)
+                except OSError as e:
+                    print(f"[storage] rollup checkpoint failed for {stream.channel}: {e}", file=sys.stderr)
+
+    def save_rollup(self, stream: ActiveStream, final: bool = False) -> None:
+        """
+        Checkpoints a live rollup: finished seconds are appended to
+        ROLLUP_SECONDS_NAME and rollups.json is rewritten without them. The final
+        save folds those rows back into rollups.json and removes the journal.
+        """
+        assert stream.rollup is not None
+        seconds_path = stream.stream_dir / ROLLUP_SECONDS_NAME
+        append_second_rows(seconds_path, stream.rollup.drain_seconds())
+        obj = stream.rollup.to_dict()
+        if final:
+            obj["second"] = merge_rows(read_second_rows(seconds_path) + obj["second"])
+        else:
+            # the open second is still counting; it is journaled once it closes
+            obj["second"] = []
+        path = stream.stream_dir / ROLLUPS_NAME
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(obj, separators=(",", ":")) + "\n", encoding="utf-8")
+        tmp.replace(path)
+        if final:
+            seconds_path.unlink(missing_ok=True)
+        stream.rollup_saved_at = time.monotonic()
+
+    def _load_rollup(self, stream: ActiveStream) -> StreamRollup:
+        # a restarted collector reopening the same stream continues its rollups
+        path = stream.stream_dir / ROLLUPS_NAME
+        if path.exists():
+            try:
+                return StreamRollup.from_dict(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, KeyError):
+                pass
+        return StreamRollup(stream.channel, iso_to_epoch(stream.started_at))
+
+    def start_flusher(self) -> None:
+        if self._flusher and self._flusher.is_alive():
+            return
+        self._flusher_stop.clear()
+        interval = max(0.01, self.cfg.batch_max_ms / 2000.0)
+
+        def run() -> None:
+            while not self._flusher_stop.wait(interval):
+                self.flush_due()
+
+        self._flusher = threading.Thread(target=run, name="storage-flush", daemon=True)
+        self._flusher.start()
+
+    def stop_flusher(self) -> None:
+        self._flusher_stop.set()
+        if self._flusher:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+
     def _atomic_write_json(self, path: Path, obj: Dict) -> None:
         tmp = path.with_suffix(path.suffix + ".tmp")
         tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
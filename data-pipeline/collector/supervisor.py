@@ -0,0 +1,201 @@
+from __future__ import annotations
+import bisect
+import multiprocessing as mp
+import queue as queue_mod
+import signal
+import sys
+import time
+from hashlib import blake2b
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import load_config
+from .telemetry import REGISTRY, MetricsServer
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring of worker ids with `vnodes` points each. Channel placement
+    is stable across restarts, and growing from N to N+1 workers moves only ~1/(N+1)
+    of the channels.
+    """
+
+    def __init__(self, nodes: Iterable[int], vnodes: int = 64):
+        points: List[Tuple[int, int]] = []
+        for node in nodes:
+            for v in range(vnodes):
+                points.append((_point(f"worker-{node}#{v}"), node))
+        if not points:
+            raise ValueError("HashRing needs at least one node")
+        points.sort()
+        self._keys = [p for p, _ in points]
+        self._nodes = [n for _, n in points]
+
+    def node_for(self, channel: str) -> int:
+        i = bisect.bisect(self._keys, _point(channel)) % len(self._keys)
+        return self._nodes[i]
+
+
+def worker_main(config_path: str, index: int, workers: int, commands) -> None:
+    """
+    Entry point of one worker process: an Ingest for its shard of the channels,
+    driven by ("live", [info]), ("snapshot", [info]), ("offline", [channel]) and
+    ("stop", None) commands from the supervisor.
+    """
+    # ctrl-c goes to the whole process group; let the supervisor sequence shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from dotenv import load_dotenv
+
+    from .ingest import Ingest
+
+    load_dotenv()
+    cfg = load_config(config_path)
+    # the join limit is per Twitch account, which every worker shares
+    ingest = Ingest(cfg, join_rate=max(1, cfg.irc.join_rate // workers))
+
+    metrics_server: Optional[MetricsServer] = None
+    if cfg.telemetry.enabled:
+        metrics_server = MetricsServer(cfg.telemetry.host, cfg.telemetry.port + 1 + index)
+        metrics_server.start()
+
+    print(f"[worker {index}] started", file=sys.stderr)
+    ingest.start()
+    try:
+        while True:
+            try:
+                cmd, payload = commands.get(timeout=cfg.helix.tick_seconds)
+            except queue_mod.Empty:
+                ingest.log_queue(time.time(), cfg.helix.poll_seconds)
+                continue
+            if cmd == "live":
+                ingest.open_streams(payload)
+            elif cmd == "snapshot":
+                ingest.snapshot(payload)
+            elif cmd == "offline":
+                ingest.close_streams(payload)
+            elif cmd == "stop":
+                break
+    finally:
+        ingest.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        print(f"[worker {index}] stopped", file=sys.stderr)
+
+
+class ShardedIngest:
+    """
+    Supervisor side of multi-process ingest. Starts `workers` processes (spawned,
+    so no Helix threads are forked), each owning the channels the HashRing assigns
+    it with its own IRC connections, queue and storage writers, and forwards
+    stream state changes to the owning worker. Same driving interface as Ingest.
+
+    A worker that dies is respawned and re-sent its live channels; it reopens the
+    same stream directories, so segments and rollups continue.
+    """
+
+    def __init__(self, config_path: str, workers: int):
+        self.config_path = str(config_path)
+        self.workers = max(1, int(workers))
+        self.ring = HashRing(range(self.workers))
+        self._ctx = mp.get_context("spawn")
+        self._procs: List[Optional[mp.process.BaseProcess]] = [None] * self.workers
+        self._queues: List = [None] * self.workers
+        # channel -> latest stream info, to replay into a respawned worker
+        self._live: Dict[str, Dict] = {}
+        self.restarts = 0
+
+        REGISTRY.gauge(
+            "collector_workers_alive",
+            "Ingest worker processes currently running.",
+            fn=lambda: sum(1 for p in self._procs if p is not None and p.is_alive()),
+        )
+        REGISTRY.counter("collector_worker_restarts_total", "Ingest workers respawned.", fn=lambda: self.restarts)
+
+    @property
+    def active_channels(self) -> Set[str]:
+        return set(self._live)
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            self._spawn(i)
+        print(f"[supervisor] started {self.workers} workers")
+
+    def _spawn(self, index: int) -> None:
+        q = self._ctx.Queue()
+        p = self._ctx.Process(
+            target=worker_main,
+            args=(self.config_path, index, self.workers, q),
+            name=f"collector-worker-{index}",
+            daemon=True,
+        )
+        p.start()
+        self._procs[index] = p
+        self._queues[index] = q
+
+    def _shard(self, items: Iterable, key) -> Dict[int, List]:
+        out: Dict[int, List] = {}
+        for item in items:
+            out.setdefault(self.ring.node_for(key(item)), []).append(item)
+        return out
+
+    def _send(self, index: int, cmd: str, payload) -> None:
+        self._queues[index].put((cmd, payload))
+
+    def open_streams(self, infos: Iterable[Dict]) -> None:
+        infos = [info for info in infos if info["channel"] not in self._live]
+        for info in infos:
+            self._live[info["channel"]] = info
+            print(f"[live] {info['channel']} -> worker {self.ring.node_for(info['channel'])}")
+        for index, part in self._shard(infos, lambda i: i["channel"]).items():
+            self._send(index, "live", part)
+
+    def snapshot(self, infos: Iterable[Dict]) -> None:
+        infos = list(infos)
+        for info in infos:
+            if info["channel"] in self._live:
+                self._live[info["channel"]] = info
+        for index, part in self._shard(infos, lambda i: i["channel"]).items():
+            self._send(index, "snapshot", part)
+
+    def close_streams(self, channels: Iterable[str]) -> None:
+        # the worker's Ingest closes them on its writer thread, after their queued chat
+        channels = [ch for ch in channels if self._live.pop(ch, None) is not None]
+        for index, part in self._shard(channels, lambda ch: ch).items():
+            self._send(index, "offline", part)
+
+    def log_queue(self, now: float, every_s: float) -> None:
+        # queues live in the workers, which log their own; use the tick to watch them
+        self.check_workers()
+
+    def check_workers(self) -> None:
+        for i, p in enumerate(self._procs):
+            if p is None or p.is_alive():
+                continue
+            print(f"[supervisor] worker {i} exited with {p.exitcode}, restarting", file=sys.stderr)
+            self.restarts += 1
+            self._spawn(i)
+            mine = [info for ch, info in sorted(self._live.items()) if self.ring.node_for(ch) == i]
+            if mine:
+                self._send(i, "live", mine)
+
+    def stop(self, timeout: float = 30) -> None:
+        for i, p in enumerate(self._procs):
+            if p is not None and p.is_alive():
+                self._send(i, "stop", None)
+        deadline = time.monotonic() + timeout
+        for p in self._procs:
+            if p is None:
+                continue
+            p.join(max(0.1, deadline - time.monotonic()))
+            if p.is_alive():
+                print(f"[supervisor] {p.name} did not stop, terminating", file=sys.stderr)
+                p.terminate()
+                p.join(5)
+        for q in self._queues:
+            if q is not None:
+                q.close()
+        self._live.clear()
@@ -1,12 +1,44 @@
 from __future__ import annotations
 from datetime import datetime, timezone
 import re
+import time
+from typing import Tuple
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+def epoch_to_iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+# "YYYY-MM-DDTHH:MM:SS" for the last second formatted; chat arrives in order, so
+# nearly every message hits it and only the millisecond suffix is built
+_iso_second: Tuple[int, str] = (-1, "")
+
+
+def ms_to_iso(ms: int) -> str:
+    """
+    Epoch milliseconds -> "2025-12-25T23:10:00.123Z", via a per-second cached prefix.
+    """
+    global _iso_second
+    sec, frac = divmod(ms, 1000)
+    cached_sec, prefix = _iso_second
+    if sec != cached_sec:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        _iso_second = (sec, prefix)
+    return f"{prefix}.{frac:03d}Z"
+
+
+def iso_to_epoch(ts: str) -> float:
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+
 def iso_to_folder(ts: str) -> str:
     # "2025-12-25T23:10:00Z" -> "2025-12-25T23-10-00Z"
     return ts.replace(":", "-")
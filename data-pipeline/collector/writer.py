@@ -0,0 +1,155 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+from .irc import IRCRecord
+from .schema import chat_encoder
+from .telemetry import LAG_BUCKETS, REGISTRY
+from .util import iso_to_epoch
+
+
+DURABILITY_POLICIES = ("none", "flush", "fsync")
+
+ENCODE_SECONDS = REGISTRY.histogram("collector_chat_encode_seconds", "Time to serialize one chat batch.")
+WRITE_SECONDS = REGISTRY.histogram(
+    "collector_chat_write_seconds", "Time to write one chat batch to its sink, including flush/fsync."
+)
+CHAT_BATCHES = REGISTRY.counter("collector_chat_batches_total", "Chat batches written.")
+LAG_SECONDS = REGISTRY.histogram(
+    "collector_chat_lag_seconds", "Delay from Twitch's tmi-sent-ts to the chat batch reaching the sink.", LAG_BUCKETS
+)
+
+
+def _event_time(evt: Union[Dict, IRCRecord]) -> Optional[float]:
+    if isinstance(evt, IRCRecord):
+        return evt.time_ms / 1000.0
+    ts = evt.get("timestamp_utc")
+    return iso_to_epoch(ts) if ts else None
+
+
+def _sent_time(evt: Union[Dict, IRCRecord]) -> Optional[float]:
+    # tmi-sent-ts: Twitch's server-side send time, epoch milliseconds
+    if isinstance(evt, IRCRecord):
+        ms = evt.sent_ms
+        return ms / 1000.0 if ms is not None else None
+    ms = (evt.get("tags") or {}).get("tmi-sent-ts")
+    try:
+        return int(ms) / 1000.0 if ms else None
+    except ValueError:
+        return None
+
+
+class ChatWriter:
+    """
+    Group-commit buffer in front of one stream's chat sink (see segments.py).
+
+    Events are queued as-is and serialized together when the batch reaches
+    `max_events` or its oldest event is `max_delay_ms` old, so a batch costs one
+    write() instead of one per line. After each batch the durability policy applies:
+      none  - leave the bytes in the file object's buffer
+      flush - push the batch to the OS (compressed segments: the blocks finished so far)
+      fsync - flush, plus a full sync flush and fsync at most every `fsync_interval_ms`
+    """
+
+    def __init__(
+        self,
+        sink,
+        max_events: int = 500,
+        max_delay_ms: int = 250,
+        durability: str = "flush",
+        fsync_interval_ms: int = 1000,
+        encode: Optional[Callable[[Union[Dict, IRCRecord]], str]] = None,
+    ):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"durability must be one of {DURABILITY_POLICIES}, got {durability!r}")
+        self.sink = sink
+        self.encode = encode or chat_encoder("full")
+        self.max_events = max(1, int(max_events))
+        self.max_delay_s = max(0, int(max_delay_ms)) / 1000.0
+        self.durability = durability
+        self.fsync_interval_s = max(0, int(fsync_interval_ms)) / 1000.0
+
+        self.lock = threading.Lock()
+        self.closed = False
+        self._pending: List[Union[Dict, IRCRecord]] = []
+        self._oldest_at = 0.0  # monotonic time of the oldest pending event
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def append(self, evt: Union[Dict, IRCRecord]) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            if not self._pending:
+                self._oldest_at = time.monotonic()
+            self._pending.append(evt)
+            if len(self._pending) >= self.max_events:
+                self._flush_locked()
+
+    def due(self, now: float) -> bool:
+        if self._pending and now - self._oldest_at >= self.max_delay_s:
+            return True
+        return self._unsynced and now - self._last_fsync >= self.fsync_interval_s
+
+    def flush_if_due(self, now: float) -> None:
+        if not self.due(now):
+            return
+        with self.lock:
+            if not self.closed and self.due(now):
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self.closed:
+                self._flush_locked()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+            try:
+                self._flush_locked(durable=self.durability == "fsync")
+                self.sink.flush(sync=True)
+            finally:
+                self.closed = True
+                self.sink.close()
+
+    def _flush_locked(self, durable: bool = False) -> None:
+        batch = self._pending
+        t0 = time.perf_counter()
+        if batch:
+            self._pending = []
+            encode = self.encode
+            data = "".join([encode(evt) + "\n" for evt in batch]).encode("utf-8")
+            t1 = time.perf_counter()
+            ENCODE_SECONDS.observe(t1 - t0)
+            t0 = t1
+            times = [t for t in map(_event_time, batch) if t is not None]
+            self.sink.write_batch(
+                data,
+                len(batch),
+                min(times) if times else None,
+                max(times) if times else None,
+            )
+
+        try:
+            if self.durability == "none":
+                return
+            if batch:
+                self.sink.flush()
+            if self.durability == "fsync":
+                self._unsynced = self._unsynced or bool(batch)
+                now = time.monotonic()
+                if self._unsynced and (durable or now - self._last_fsync >= self.fsync_interval_s):
+                    self.sink.flush(sync=True)
+                    os.fsync(self.sink.fileno())
+                    self._last_fsync = now
+                    self._unsynced = False
+        finally:
+            if batch:
+                WRITE_SECONDS.observe(time.perf_counter() - t0)
+                CHAT_BATCHES.inc()
+                done = time.time()
+                LAG_SECONDS.observe_many([done - t for t in map(_sent_time, batch) if t is not None])
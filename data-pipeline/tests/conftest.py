@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the collector is run as `python -m collector.main` from data-pipeline/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from collector.fake_twitch import synthetic_templates
+from collector.irc import parse_irc_bytes
+from collector.util import ms_to_iso
+
+START_MS = 1_735_000_000_000
+
+
+def make_chat_records(channel, count=600, start_ms=START_MS, step_ms=250):
+    """
+    `count` PRIVMSGs `step_ms` apart, then one with non-ASCII text, escapes and quotes.
+    """
+    templates = [t for t in synthetic_templates(300) if b" PRIVMSG #" in t]
+    lines = [
+        templates[i % len(templates)] % (b"%x" % i, b"7", start_ms + i * step_ms, channel.encode())
+        for i in range(count)
+    ]
+    lines.append(
+        b"@badge-info=;badges=;color=;display-name=Sn\xc3\xb8w;id=ff;room-id=7;tmi-sent-ts=%d;"
+        b"user-id=9;user-type= :snow!snow@snow.tmi.twitch.tv PRIVMSG #%s :caf\xc3\xa9 \xf0\x9f\x8e\x84 \\ \"q\"\r\n"
+        % (start_ms + count * step_ms, channel.encode())
+    )
+    return [parse_irc_bytes(line, recv_ms=start_ms + i * step_ms + 40) for i, line in enumerate(lines)]
+
+
+def make_stream_info(channel, started_ms=START_MS):
+    return {
+        "channel": channel,
+        "user_id": "7",
+        "started_at": ms_to_iso(started_ms - 60_000),
+        "title": "t",
+        "game_name": "g",
+        "viewer_count": 1,
+    }
+
+
+@pytest.fixture
+def chat_records():
+    return make_chat_records
+
+
+@pytest.fixture
+def stream_info():
+    return make_stream_info
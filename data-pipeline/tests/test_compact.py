@@ -0,0 +1,54 @@
+import json
+import os
+
+from collector.compact import compact
+from collector.config import StorageCfg
+from collector.reader import iter_stream_dirs
+from collector.storage import Storage
+
+START_MS = 1_735_000_000_000
+
+
+def test_compaction_merges_streams_by_time_and_picks_up_new_and_crashed_chat(tmp_path, chat_records, stream_info):
+    data_root, out = tmp_path / "data", tmp_path / "data30"
+    storage = Storage(data_root, StorageCfg(chat_schema="compact", durability="flush"))
+
+    # two channels live at the same time, interleaved at 250ms
+    alpha = storage.open_stream(stream_info("alpha"))
+    bravo = storage.open_stream(stream_info("bravo"))
+    for rec in chat_records("alpha", 300):
+        storage.append_chat(alpha, rec)
+    for rec in chat_records("bravo", 300, start_ms=START_MS + 125):
+        storage.append_chat(bravo, rec)
+    storage.close_stream(alpha, ended_at="2024-12-24T01:00:00Z")
+    storage.close_stream(bravo, ended_at="2024-12-24T01:00:00Z")
+
+    assert compact(data_root, out)["chat"] == 602
+    rows = [json.loads(line) for line in (out / "all_chat.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert len(rows) == 602
+    assert [r["ts"] for r in rows] == sorted(r["ts"] for r in rows)
+    assert {r["vid"].split("_")[0] for r in rows[:10]} == {"alpha", "bravo"}
+    assert compact(data_root, out)["streams"] == 0
+
+    # a restart reopens alpha and appends to it before it closes again
+    alpha = storage.open_stream(stream_info("alpha"))
+    for rec in chat_records("alpha", 50, start_ms=START_MS + 600_000):
+        storage.append_chat(alpha, rec)
+    storage.close_stream(alpha, ended_at="2024-12-24T02:00:00Z")
+
+    # the collector dies in charlie: no ended_at, ever
+    charlie = storage.open_stream(stream_info("charlie"))
+    for rec in chat_records("charlie", 40):
+        storage.append_chat(charlie, rec)
+    charlie.chat_writer.flush()
+    stale = charlie.stream_dir.stat().st_mtime - 7200
+    for path in charlie.stream_dir.iterdir():
+        os.utime(path, (stale, stale))
+
+    counts = compact(data_root, out)
+    assert counts == {"streams": 2, "chat": 51 + 41, "events": 0, "gaps": 0}
+    lines = (out / "all_chat.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 602 + 51 + 41
+    state = json.loads((out / "compact_state.json").read_text(encoding="utf-8"))
+    assert state["streams"]["channel=charlie/" + charlie.stream_dir.name]["chat"] == 41
+    assert len(list(iter_stream_dirs(data_root))) == 3
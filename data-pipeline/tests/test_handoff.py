@@ -0,0 +1,27 @@
+import pytest
+import yaml
+
+from collector.config import load_config
+
+
+def write_config(tmp_path, engine, queue):
+    cfg = {
+        "data_root": str(tmp_path / "data"),
+        "streams": {"channels": ["alpha"]},
+        "irc": {"engine": engine},
+        "queue": queue,
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("engine, overflow", [("thread", "block"), ("asyncio", "drop_oldest")])
+def test_overflow_defaults_per_engine(engine, overflow, tmp_path):
+    assert load_config(write_config(tmp_path, engine, {})).queue.overflow == overflow
+
+
+def test_block_overflow_is_rejected_on_the_asyncio_engine(tmp_path):
+    load_config(write_config(tmp_path, "thread", {"overflow": "block"}))
+    with pytest.raises(ValueError, match="asyncio"):
+        load_config(write_config(tmp_path, "asyncio", {"overflow": "block"}))
@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+
+import pytest
+import yaml
+
+from collector import irc
+from collector.config import load_config
+from collector.fake_twitch import FakeIRCServer, synthetic_templates
+from collector.ingest import Ingest
+from collector.reader import iter_chat, iter_stream_dirs, load_rollups
+from collector.util import utc_now_iso
+
+CHANNELS = ["alpha", "bravo", "charlie"]
+
+
+def wait_for(cond, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def write_config(tmp_path, port, engine, layout):
+    cfg = {
+        "data_root": str(tmp_path / "data"),
+        "streams": {"channels": CHANNELS},
+        "storage": {"chat_layout": layout, "chat_schema": "compact", "rollups": True},
+        "irc": {
+            "server": "127.0.0.1",
+            "port": port,
+            "use_tls": False,
+            "join_rate": 1000,
+            "join_window_s": 1,
+            "engine": engine,
+        },
+        "telemetry": {"enabled": False},
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("layout", ["jsonl", "segments"])
+@pytest.mark.parametrize("engine", ["thread", "asyncio"])
+def test_fake_twitch_through_ingest(engine, layout, tmp_path, monkeypatch):
+    monkeypatch.setattr(irc, "READ_TIMEOUT_S", 0.2)
+    monkeypatch.setenv("TWITCH_IRC_NICK", "justinfan1")
+    monkeypatch.setenv("TWITCH_IRC_OAUTH", "oauth:x")
+    server = FakeIRCServer(synthetic_templates(200), rate=500, ping_s=3600)
+    server.start()
+    cfg = load_config(write_config(tmp_path, server.port, engine, layout))
+    ingest = Ingest(cfg)
+    ingest.start()
+    try:
+        started_at = utc_now_iso()
+        ingest.open_streams(
+            [
+                {
+                    "channel": ch,
+                    "user_id": str(i),
+                    "started_at": started_at,
+                    "title": "smoke",
+                    "game_name": "Just Chatting",
+                    "viewer_count": 10,
+                }
+                for i, ch in enumerate(CHANNELS)
+            ]
+        )
+        assert wait_for(lambda: server.joined == len(CHANNELS))
+        server.sending = True
+        time.sleep(0.8)
+        server.sending = False
+        time.sleep(1.5)  # quiet on the wire for several socket read timeouts
+        server.sending = True
+        time.sleep(0.8)
+        server.sending = False
+        sent = server.sent_chat
+        assert wait_for(lambda: ingest.queue.enqueued >= server.sent)
+        ingest.close_streams(CHANNELS)
+    finally:
+        ingest.stop()
+        server.stop()
+
+    stream_dirs = list(iter_stream_dirs(cfg.data_root))
+    assert len(stream_dirs) == len(CHANNELS)
+    written = 0
+    for sdir in stream_dirs:
+        chat = sum(1 for _ in iter_chat(sdir))
+        written += chat
+        assert not (sdir / "gaps.jsonl").exists()
+        assert load_rollups(sdir)["totals"]["msgs"] == chat
+        assert json.loads((sdir / "meta.json").read_text(encoding="utf-8"))["ended_at"]
+    assert sent > 0 and written == sent
+
+
+def test_gaps_are_recorded_on_the_writer_thread(tmp_path, monkeypatch, stream_info):
+    monkeypatch.setattr(irc, "READ_TIMEOUT_S", 0.1)
+    monkeypatch.setattr(irc, "IDLE_TIMEOUT_S", 0.4)
+    monkeypatch.setattr(irc, "RECONNECT_BACKOFF_MIN_S", 0.05)
+    monkeypatch.setenv("TWITCH_IRC_NICK", "justinfan1")
+    monkeypatch.setenv("TWITCH_IRC_OAUTH", "oauth:x")
+    server = FakeIRCServer(synthetic_templates(50), rate=100, ping_s=3600)
+    server.start()
+    cfg = load_config(write_config(tmp_path, server.port, "thread", "jsonl"))
+    ingest = Ingest(cfg)
+    threads = []
+    append_gap = ingest.storage.append_gap
+
+    def recording_append_gap(stream, gap):
+        threads.append(threading.current_thread().name)
+        append_gap(stream, gap)
+
+    monkeypatch.setattr(ingest.storage, "append_gap", recording_append_gap)
+    ingest.start()
+    try:
+        ingest.open_streams([stream_info("alpha")])
+        # nothing is sent: the idle timeout drops and rejoins the connection
+        assert wait_for(lambda: len(threads) >= 2)
+        ingest.close_streams(["alpha"])
+    finally:
+        ingest.stop()
+        server.stop()
+
+    assert set(threads) == {"storage-writer"}
+    (sdir,) = iter_stream_dirs(cfg.data_root)
+    meta = json.loads((sdir / "meta.json").read_text(encoding="utf-8"))
+    written = (sdir / "gaps.jsonl").read_text(encoding="utf-8").splitlines()
+    assert meta["gaps"] == len(written) == len(threads)
+
+
+def test_channel_back_live_behind_a_queued_close_reopens_on_a_later_poll(tmp_path, monkeypatch, capsys, stream_info):
+    monkeypatch.setenv("TWITCH_IRC_NICK", "justinfan1")
+    monkeypatch.setenv("TWITCH_IRC_OAUTH", "oauth:x")
+    server = FakeIRCServer(synthetic_templates(50), rate=100, ping_s=3600)
+    server.start()
+    cfg = load_config(write_config(tmp_path, server.port, "thread", "jsonl"))
+    ingest = Ingest(cfg)
+    ingest.call_timeout_s = 0.2
+    ingest.start()
+    infos = [stream_info("alpha", 1_735_000_000_000 + hour * 3_600_000) for hour in (0, 1)]
+    try:
+        ingest.open_streams(infos[:1])
+        gate = threading.Event()
+        ingest.writer.submit(gate.wait)  # the writer is stuck behind a slow disk
+        ingest.close_streams(["alpha"])
+        assert "alpha" not in ingest.active_channels
+
+        ingest.open_streams(infos[1:])
+        assert "close of alpha still queued" in capsys.readouterr().err
+        assert ingest.active_channels == {"alpha"}
+        assert ingest.active_streams["alpha"].closing
+
+        gate.set()
+        assert wait_for(lambda: "alpha" not in ingest.active_streams)
+        ingest.snapshot(infos[1:])
+        assert not ingest.reopening
+        assert ingest.active_streams["alpha"].started_at == infos[1]["started_at"]
+        ingest.close_streams(["alpha"])
+    finally:
+        ingest.stop()
+        server.stop()
+
+    metas = [json.loads((sdir / "meta.json").read_text(encoding="utf-8")) for sdir in iter_stream_dirs(cfg.data_root)]
+    assert sorted(m["started_at"] for m in metas) == [info["started_at"] for info in infos]
+    assert all(m["ended_at"] for m in metas)
+
+
+def test_cheers_and_resubs_become_typed_events(tmp_path, monkeypatch, stream_info):
+    monkeypatch.setenv("TWITCH_IRC_NICK", "justinfan1")
+    monkeypatch.setenv("TWITCH_IRC_OAUTH", "oauth:x")
+    templates = synthetic_templates(3000)
+    typed = [t for t in templates if b";bits=" in t or b" USERNOTICE #" in t]
+    server = FakeIRCServer(typed + templates[:len(typed)], rate=400, ping_s=3600)
+    server.start()
+    cfg = load_config(write_config(tmp_path, server.port, "asyncio", "segments"))
+    ingest = Ingest(cfg)
+    ingest.start()
+    try:
+        ingest.open_streams([stream_info("alpha")])
+        assert wait_for(lambda: server.joined == 1)
+        server.sending = True
+        time.sleep(0.5)
+        server.sending = False
+        assert wait_for(lambda: ingest.queue.enqueued >= server.sent)
+        ingest.close_streams(["alpha"])
+    finally:
+        ingest.stop()
+        server.stop()
+
+    (sdir,) = iter_stream_dirs(cfg.data_root)
+    events = [json.loads(line) for line in (sdir / "events.jsonl").read_text(encoding="utf-8").splitlines()]
+    cheers = [evt for evt in iter_chat(sdir) if evt["message"].startswith("Cheer")]
+    resubs = [evt for evt in events if evt["type"] == "resub"]
+    bits = [evt for evt in events if evt["type"] == "bits"]
+    assert len(resubs) == server.sent - server.sent_chat > 0
+    assert len(bits) == len(cheers) > 0
+    assert sum(evt["bits"] for evt in bits) == sum(int(evt["message"].split()[0][5:]) for evt in cheers)
+    assert all(evt["tier"] == "1" and evt["months"] for evt in resubs)
+
+    meta = json.loads((sdir / "meta.json").read_text(encoding="utf-8"))
+    totals = load_rollups(sdir)["totals"]
+    assert meta["events"] == len(events)
+    assert (totals["bits"], totals["subs"]) == (sum(evt["bits"] for evt in bits), len(resubs))
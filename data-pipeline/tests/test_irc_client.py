@@ -0,0 +1,81 @@
+import threading
+import time
+
+from collector import irc
+from collector.fake_twitch import FakeIRCServer, synthetic_templates
+from collector.joins import TokenBucket
+
+
+def wait_for(cond, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def start_client(server, received, gaps):
+    lock = threading.Lock()
+
+    def on_privmsg(rec):
+        with lock:
+            received.append(rec.channel)
+
+    client = irc.IRCClient(
+        "127.0.0.1",
+        server.port,
+        False,
+        "justinfan1",
+        "oauth:x",
+        on_privmsg,
+        on_disconnect=lambda channels, at: gaps.append(("down", channels)),
+        on_reconnect=lambda channels, at: gaps.append(("up", channels)),
+        join_bucket=TokenBucket(capacity=100, window_s=1),
+    )
+    client.connect()
+    client.join("alpha")
+    return client
+
+
+def test_quiet_longer_than_read_timeout_keeps_connection(monkeypatch):
+    monkeypatch.setattr(irc, "READ_TIMEOUT_S", 0.2)
+    server = FakeIRCServer(synthetic_templates(50), rate=200, ping_s=3600)
+    server.start()
+    received, gaps = [], []
+    client = start_client(server, received, gaps)
+    try:
+        server.sending = True
+        assert wait_for(lambda: len(received) > 20)
+        server.sending = False
+        time.sleep(0.3)
+        before = len(received)
+        time.sleep(1.5)  # several read timeouts with nothing on the wire
+        assert len(received) == before
+        server.sending = True
+        assert wait_for(lambda: len(received) > before + 20)
+        assert client.disconnects == 0
+        assert gaps == []
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_silence_past_idle_timeout_reconnects_and_rejoins(monkeypatch):
+    monkeypatch.setattr(irc, "READ_TIMEOUT_S", 0.1)
+    monkeypatch.setattr(irc, "IDLE_TIMEOUT_S", 0.5)
+    monkeypatch.setattr(irc, "RECONNECT_BACKOFF_MIN_S", 0.05)
+    server = FakeIRCServer(synthetic_templates(50), rate=200, ping_s=3600)
+    server.start()
+    received, gaps = [], []
+    client = start_client(server, received, gaps)
+    try:
+        assert wait_for(lambda: client.disconnects >= 1)
+        assert wait_for(lambda: ("up", ["alpha"]) in gaps)
+        assert gaps[0] == ("down", ["alpha"])
+        server.sending = True
+        before = len(received)
+        assert wait_for(lambda: len(received) > before + 20)
+    finally:
+        client.close()
+        server.stop()
@@ -0,0 +1,29 @@
+from collector import loadtest
+
+
+def test_histogram_quantile_interpolates_within_buckets():
+    samples = loadtest.parse_metrics(
+        "# TYPE lag histogram\n"
+        'lag_bucket{le="0.1"} 50\n'
+        'lag_bucket{le="1"} 90\n'
+        'lag_bucket{le="+Inf"} 100\n'
+        "lag_count 100\n"
+    )
+    assert loadtest.histogram_quantile(samples, "lag", 0.5) == 0.1
+    assert abs(loadtest.histogram_quantile(samples, "lag", 0.7) - 0.55) < 1e-9
+    assert loadtest.histogram_quantile(samples, "lag", 0.99) == 1.0
+
+
+def test_short_run_reports_throughput_and_drops():
+    args = loadtest.parse_args(
+        ["--channels", "5", "--rate", "400", "--duration", "3", "--warmup", "30", "--drain", "10"]
+        + ["--poll-seconds", "1", "--max-open-files", "8"]
+    )
+    report = loadtest.run(args)
+
+    assert report["sent_chat"] > 0
+    assert report["written"] == report["sent_chat"]
+    assert report["lost"] == report["queue_dropped"] == report["queue_spilled"] == 0
+    assert report["throughput_mean"] > 0 and report["throughput_min_1s"] is not None
+    assert report["lag_p50_s"] is not None and report["rss_peak_mb"] > 0
+    assert report["workdir"] is None
@@ -0,0 +1,38 @@
+import pytest
+
+from collector.config import StorageCfg
+from collector.reader import iter_chat
+from collector.storage import Storage
+
+FIELDS = ("type", "timestamp_utc", "sent_ms", "recv_ms", "channel", "user", "message", "tags")
+
+
+def write_stream(root, schema, chat_records, stream_info):
+    storage = Storage(root, StorageCfg(chat_schema=schema, durability="none"))
+    records = chat_records("alpha")
+    stream = storage.open_stream(stream_info("alpha"))
+    for rec in records:
+        storage.append_chat(stream, rec)
+    storage.close_stream(stream, ended_at="2024-12-24T01:00:00Z")
+    return records, stream
+
+
+@pytest.mark.parametrize("schema", ["full", "raw", "compact"])
+def test_chat_round_trips_through_every_schema(schema, tmp_path, chat_records, stream_info):
+    records, stream = write_stream(tmp_path, schema, chat_records, stream_info)
+
+    events = list(iter_chat(stream.stream_dir))
+    assert len(events) == len(records)
+    for rec, evt in zip(records, events):
+        expected = rec.to_dict()
+        assert {k: evt[k] for k in FIELDS} == {k: expected[k] for k in FIELDS}
+        if schema != "compact":  # compact rebuilds raw from the fields
+            assert evt["raw"] == expected["raw"]
+
+
+def test_compact_lines_do_not_repeat_the_raw_line(tmp_path, chat_records, stream_info):
+    sizes = {
+        schema: write_stream(tmp_path / schema, schema, chat_records, stream_info)[1].chat_path.stat().st_size
+        for schema in ("full", "raw", "compact")
+    }
+    assert sizes["compact"] < sizes["raw"] < sizes["full"]
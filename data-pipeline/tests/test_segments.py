@@ -0,0 +1,83 @@
+import json
+
+from collector.config import StorageCfg
+from collector.reader import chat_files, iter_chat
+from collector.segments import MANIFEST_NAME, SegmentedChatFile, open_chat_file
+from collector.storage import Storage
+from collector.writer import ChatWriter
+
+
+def chat_event(i):
+    return {"v": 3, "t": 1_735_000_000_000 + i * 250, "u": f"user{i % 40}", "m": f"message {i} KEKW"}
+
+
+def chat_line(i):
+    return json.dumps(chat_event(i))
+
+
+def write_segment(stream_dir, batch_lines, durability):
+    stream_dir.mkdir()
+    writer = ChatWriter(
+        SegmentedChatFile(stream_dir),
+        max_events=batch_lines,
+        durability=durability,
+        fsync_interval_ms=3_600_000,
+        encode=json.dumps,
+    )
+    for i in range(4000):
+        writer.append(chat_event(i))
+    writer.close()
+    path = stream_dir / "chat-00001.jsonl.gz"
+    with open_chat_file(path) as f:
+        assert sum(1 for _ in f) == 4000
+    return path.stat().st_size
+
+
+def test_flushing_small_batches_does_not_inflate_compressed_segments(tmp_path):
+    unflushed = write_segment(tmp_path / "none", 4000, "none")
+    for durability in ("flush", "fsync"):
+        per_line = write_segment(tmp_path / durability, 1, durability)
+        assert per_line < unflushed * 1.1
+
+
+def test_flush_hands_finished_blocks_to_the_os_and_sync_writes_the_tail(tmp_path):
+    sink = SegmentedChatFile(tmp_path)
+    data = "".join(chat_line(i) + "\n" for i in range(20)).encode("utf-8")
+    sink.write_batch(data, 20, None, None)
+    sink.flush()
+    sink.flush(sync=True)
+    with open_chat_file(tmp_path / "chat-00001.jsonl.gz") as f:
+        lines = []
+        try:
+            for line in f:
+                lines.append(line)
+        except EOFError:  # no gzip trailer until the segment closes
+            pass
+    assert b"".join(lines) == data
+    sink.close()
+    assert json.loads((tmp_path / MANIFEST_NAME).read_text(encoding="utf-8"))["segments"][0]["lines"] == 20
+
+
+def test_chat_round_trips_through_rotated_segments(tmp_path, chat_records, stream_info):
+    cfg = StorageCfg(batch_max_events=50, chat_layout="segments", chat_schema="compact", durability="none")
+    storage = Storage(tmp_path, cfg)
+    records = chat_records("alpha")
+    stream = storage.open_stream(stream_info("alpha"))
+    stream.chat_writer.sink.max_bytes = 16 * 1024
+    for rec in records:
+        storage.append_chat(stream, rec)
+    storage.close_stream(stream, ended_at="2024-12-24T01:00:00Z")
+
+    segments = json.loads((stream.stream_dir / MANIFEST_NAME).read_text(encoding="utf-8"))["segments"]
+    assert len(segments) > 2
+    assert sum(seg["lines"] for seg in segments) == len(records)
+    assert all(seg["closed_at"] and seg["bytes"] < seg["raw_bytes"] for seg in segments)
+
+    events = list(iter_chat(stream.stream_dir))
+    assert [evt["message"] for evt in events] == [rec.message for rec in records]
+    assert [evt["timestamp_utc"] for evt in events] == [rec.timestamp_utc for rec in records]
+
+    # a time range skips the segments outside it
+    middle = segments[1]
+    files = chat_files(stream.stream_dir, middle["min_ts_epoch"], middle["max_ts_epoch"])
+    assert [path.name for path in files] == [middle["file"]]
@@ -0,0 +1,52 @@
+import json
+
+from collector.config import StorageCfg
+from collector.reader import iter_chat
+from collector.segments import PlainChatFile
+from collector.storage import Storage
+from collector.writer import ChatWriter
+
+FIELDS = ("type", "timestamp_utc", "sent_ms", "recv_ms", "channel", "user", "message", "tags")
+
+
+def line_count(path):
+    return len(path.read_bytes().splitlines()) if path.exists() else 0
+
+
+def test_batches_reach_the_file_at_size_or_age(tmp_path):
+    path = tmp_path / "chat.jsonl"
+    writer = ChatWriter(PlainChatFile(path), max_events=100, max_delay_ms=50, encode=json.dumps)
+    events = [{"timestamp_utc": "2024-12-24T18:00:00Z", "message": str(i)} for i in range(106)]
+    for evt in events[:99]:
+        writer.append(evt)
+    assert line_count(path) == 0
+    writer.append(events[99])
+    assert line_count(path) == 100
+
+    for evt in events[100:105]:
+        writer.append(evt)
+    oldest = writer._oldest_at
+    writer.flush_if_due(oldest + 0.01)
+    assert line_count(path) == 100
+    writer.flush_if_due(oldest + 0.06)
+    assert line_count(path) == 105
+
+    writer.append(events[105])
+    writer.close()
+    assert [json.loads(line) for line in path.read_bytes().splitlines()] == events
+
+
+def test_chat_round_trips_across_batches(tmp_path, chat_records, stream_info):
+    storage = Storage(tmp_path, StorageCfg(batch_max_events=64, durability="flush"))
+    records = chat_records("alpha")
+    stream = storage.open_stream(stream_info("alpha"))
+    for rec in records:
+        storage.append_chat(stream, rec)
+    assert line_count(stream.chat_path) == len(records) // 64 * 64
+    storage.close_stream(stream, ended_at="2024-12-24T01:00:00Z")
+
+    events = list(iter_chat(stream.stream_dir))
+    assert len(events) == len(records)
+    for rec, evt in zip(records, events):
+        expected = rec.to_dict()
+        assert {k: evt[k] for k in FIELDS + ("raw",)} == {k: expected[k] for k in FIELDS + ("raw",)}